@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Riverbed Technology, Inc.
+#
+# This software is licensed under the terms and conditions of the MIT License
+# accompanying the software ("License").  This software is distributed "AS IS"
+# as set forth in the License.
+
+"""
+Compare the size and load time of the column catalog pickled through
+SteelScriptData, as done by earlier releases, against the compact
+catalog format, using a synthetic catalog shaped like that of a
+NetProfiler.
+
+    $ python benchmarks/bench_catalog.py --triplets 63 --columns 600
+"""
+
+import os
+import time
+import random
+import shutil
+import optparse
+import tempfile
+
+from steelscript.common._fs import SteelScriptDir
+from steelscript.netprofiler.core._catalog import ColumnCatalogFile
+from steelscript.netprofiler.core._types import Column
+
+TYPES = ['int', 'float', 'reltime', 'time', 'ipaddr', 'string']
+RATES = ['count', 'persec', 'none', 'pct', 'opt']
+
+
+def make_json(i):
+    return {'id': i, 'strid': 'ID_COLUMN_%d' % i, 'name': 'Column %d' % i,
+            'type': TYPES[i % len(TYPES)], 'rate': RATES[i % len(RATES)],
+            'category': 'key' if i % 5 == 0 else 'data',
+            'metric': 'net_bw', 'statistic': 'avg', 'unit': 'bytes',
+            'severity': 'none', 'area': 'none', 'internal': False,
+            'role': 'none', 'cli_srv': 'none', 'available': False,
+            'direction': 'none', 'comparison': 'none', 'sortable': True,
+            'comparison_parameter': '', 'has_others': False,
+            'context': False, 'name_type': 'colname_parts'}
+
+
+def make_catalog(ntriplets, ncolumns):
+    # As in older releases, each triplet got its own Column objects
+    rnd = random.Random(0)
+    data = dict()
+    for t in range(ntriplets):
+        ids = rnd.sample(range(ncolumns), ncolumns // 2)
+        data['triplet%d' % t] = [Column(i, 'column_%d' % i, 'Column %d' % i,
+                                        make_json(i))
+                                 for i in sorted(ids)]
+    return data
+
+
+def timed(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        secs = time.time() - start
+        best = secs if best is None else min(best, secs)
+    return best
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--triplets', type='int', default=63,
+                      help='number of realm/centricity/groupby triplets')
+    parser.add_option('--columns', type='int', default=600,
+                      help='number of distinct columns')
+    parser.add_option('--repeat', type='int', default=5,
+                      help='number of loads, the best time is reported')
+    options, _ = parser.parse_args()
+
+    data = make_catalog(options.triplets, options.columns)
+    directory = tempfile.mkdtemp()
+    try:
+        fs = SteelScriptDir(directory=directory)
+        pickled = fs.get_data('columns.pcl')
+        pickled.data = data
+        pickled.version = 1.1
+        pickled.write()
+
+        compact = ColumnCatalogFile(directory, 'columns.json')
+        compact.data = data
+        compact.version = 1.1
+        compact.write()
+
+        pickle_secs = timed(lambda: fs.get_data('columns.pcl'),
+                            options.repeat)
+        compact_secs = timed(lambda: ColumnCatalogFile(directory,
+                                                       'columns.json'),
+                             options.repeat)
+
+        for name, path, secs in (('pickle', pickled.fullpath, pickle_secs),
+                                 ('compact', compact.fullpath, compact_secs)):
+            print('%-8s %10d bytes  load %8.1f ms'
+                  % (name, os.path.getsize(path), secs * 1000))
+        print('compact catalog loads %.1fx faster' % (pickle_secs /
+                                                      compact_secs))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Riverbed Technology, Inc.
+#
+# This software is licensed under the terms and conditions of the MIT License
+# accompanying the software ("License").  This software is distributed "AS IS"
+# as set forth in the License.
+
+"""
+Compare the rows/sec of the legacy per-row legend resolution in
+Query._to_native against the compiled RowDecoder, using synthetic
+query payloads shaped like a TrafficFlowListReport.
+
+    $ python benchmarks/bench_decode.py --rows 100000 --rows 1000000
+"""
+
+import time
+import optparse
+
+from steelscript.netprofiler.core.report import Query, Report
+from steelscript.netprofiler.core._types import Column
+
+
+COLUMNS = [
+    # (id, strid, type, rate, category)
+    (98, 'ID_TIME', 'time', '', 'key'),
+    (5, 'ID_HOST_IP', 'ipaddr', '', 'key'),
+    (17, 'ID_PROTOPORT_NAME', 'string', '', 'key'),
+    (33, 'ID_AVG_BYTES', 'int', 'persec', 'data'),
+    (35, 'ID_TOTAL_BYTES', 'int', 'count', 'data'),
+    (280, 'ID_NETWORK_RTT', 'reltime', 'opt', 'data'),
+    (410, 'ID_AVG_BYTES_REDUCT', 'int', 'count', 'data'),
+    (72, 'ID_AVG_PKTS', 'float', 'persec', 'data'),
+]
+
+ROW = ['1549641600', '10.99.16.1', 'tcp/443', '1432', '859200',
+       '0.0123', '12.5%', '3.25']
+
+
+def make_legend():
+    return [Column.from_json({'id': cid, 'strid': strid,
+                              'name': strid[3:].title(), 'type': ctype,
+                              'rate': rate, 'category': category})
+            for cid, strid, ctype, rate, category in COLUMNS]
+
+
+def make_query(legend, rows):
+    # Build a Query around an already downloaded payload, without
+    # going through a NetProfiler
+    report = Report.__new__(Report)
+    report.profiler = None
+    report.timings = dict()
+    query = Query.__new__(Query)
+    query.report = report
+    query.columns = legend
+    query.available_columns = legend
+    query.querydata = {'data': rows}
+    query.data = rows
+    query.data_selected_columns = query.get_legend()
+    query._decoders = dict()
+    return query
+
+
+def legacy_to_native(query, row, columns):
+    # Decoding as done prior to RowDecoder
+    legend = query.get_legend(columns)
+    for i, x in enumerate(row):
+        try:
+            if (legend[i].json['type'] == 'float' or
+                    legend[i].json['type'] in 'reltime' or
+                    legend[i].json['rate'] == 'opt'):
+                row[i] = float(x)
+            elif legend[i].json['type'] == 'int':
+                row[i] = int(x)
+        except ValueError:
+            pass
+    return row
+
+
+def run(nrows):
+    legend = make_legend()
+
+    rows = [list(ROW) for _ in range(nrows)]
+    query = make_query(legend, rows)
+    start = time.time()
+    legacy = [legacy_to_native(query, row, None) for row in query.data]
+    legacy_secs = time.time() - start
+    del rows, legacy
+
+    rows = [list(ROW) for _ in range(nrows)]
+    query = make_query(legend, rows)
+    start = time.time()
+    compiled = query.get_data()
+    compiled_secs = time.time() - start
+    del rows, compiled
+
+    print('%9d rows  legacy: %12.0f rows/sec  compiled: %12.0f rows/sec  '
+          '(%.1fx)' % (nrows, nrows / legacy_secs, nrows / compiled_secs,
+                       legacy_secs / compiled_secs))
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--rows', action='append', type='int', default=[],
+                      help='number of synthetic rows to decode, may be '
+                           'repeated (default 100000 and 1000000)')
+    options, _ = parser.parse_args()
+
+    for nrows in (options.rows or [100000, 1000000]):
+        run(nrows)
+
+
+if __name__ == '__main__':
+    main()
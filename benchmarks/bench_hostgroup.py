@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Riverbed Technology, Inc.
+#
+# This software is licensed under the terms and conditions of the MIT License
+# accompanying the software ("License").  This software is distributed "AS IS"
+# as set forth in the License.
+
+"""
+Compare bulk edits of a host group type config stored as a plain list,
+as done prior to HostGroupConfig, against the indexed HostGroupConfig:
+adding CIDRs to every group as import_hostgroups.py does, reading each
+group back, removing one CIDR from each group, clearing half of the
+groups and serializing the config for save().  The lookup of the host
+group of addresses compiled from the config is also timed.
+
+    $ python benchmarks/bench_hostgroup.py --groups 1000 --groups 10000
+
+The list based version is quadratic and only timed up to --legacy-max
+groups.
+"""
+
+import time
+import random
+import optparse
+
+from steelscript.netprofiler.core.hostgroup import HostGroupType, HostGroup
+
+
+def make_groups(ngroups, ncidrs):
+    return [('group%d' % g,
+             ['10.%d.%d.%d/30' % (g // 256 % 256, g % 256, c * 4)
+              for c in range(ncidrs)])
+            for g in range(ngroups)]
+
+
+class LegacyGroup(object):
+    # HostGroup operations on a plain list, as done prior to
+    # HostGroupConfig
+    def __init__(self, config, name):
+        self.config = config
+        self.name = name
+
+    def add(self, cidrs):
+        new_config = [{'cidr': cidr, 'name': self.name} for cidr in cidrs]
+        index = [i for i, j in enumerate(self.config)
+                 if j['name'] == self.name]
+        if index:
+            self.config[index[-1]+1:index[-1]+1] = new_config
+        else:
+            self.config.extend(new_config)
+
+    def remove(self, cidrs):
+        self.config[:] = list(filter(
+            lambda a: a['cidr'] not in cidrs or a['name'] != self.name,
+            self.config))
+
+    def clear(self):
+        self.config[:] = list(filter(lambda a: a['name'] != self.name,
+                                     self.config))
+
+    def get(self):
+        return [i['cidr'] for i in self.config if i['name'] == self.name]
+
+
+def edit(make_group, groups):
+    timings = []
+    start = time.time()
+    hgs = [make_group(name) for name, _ in groups]
+    for hg, (_, cidrs) in zip(hgs, groups):
+        hg.add(cidrs)
+    timings.append(time.time() - start)
+
+    start = time.time()
+    for hg in hgs:
+        hg.get()
+    timings.append(time.time() - start)
+
+    start = time.time()
+    for hg, (_, cidrs) in zip(hgs, groups):
+        hg.remove([cidrs[0]])
+    for hg in hgs[::2]:
+        hg.clear()
+    timings.append(time.time() - start)
+    return timings
+
+
+def run(ngroups, ncidrs, legacy_max, naddresses):
+    groups = make_groups(ngroups, ncidrs)
+
+    hgtype = HostGroupType.create(None, 'bench')
+    timings = edit(lambda name: HostGroup(hgtype, name), groups)
+    start = time.time()
+    config = list(hgtype.config)
+    timings.append(time.time() - start)
+
+    print('%6d groups x %d cidrs  indexed: add %.2fs  get %.2fs  '
+          'remove/clear %.2fs  serialize %.2fs'
+          % ((ngroups, ncidrs) + tuple(timings)))
+
+    start = time.time()
+    lookup = hgtype.lookup()
+    compile_secs = time.time() - start
+    ips = ['10.%d.%d.%d' % (random.randrange(ngroups // 256 + 1),
+                            random.randrange(256), random.randrange(256))
+           for _ in range(naddresses)]
+    start = time.time()
+    lookup.classify(ips)
+    classify_secs = time.time() - start
+    print('%22s  lookup:  compile %.2fs  classify %.0f addresses/sec'
+          % ('', compile_secs, naddresses / classify_secs))
+
+    if ngroups > legacy_max:
+        print('%22s  list: skipped, above --legacy-max' % '')
+        return
+
+    legacy = []
+    timings = edit(lambda name: LegacyGroup(legacy, name), groups)
+    assert legacy == config
+    print('%22s  list:    add %.2fs  get %.2fs  remove/clear %.2fs'
+          % (('',) + tuple(timings)))
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--groups', action='append', type='int', default=[],
+                      help='number of host groups, may be repeated '
+                           '(default 1000 and 10000)')
+    parser.add_option('--cidrs', type='int', default=20,
+                      help='number of CIDRs per host group (default 20)')
+    parser.add_option('--addresses', type='int', default=1000000,
+                      help='number of addresses to classify '
+                           '(default 1000000)')
+    parser.add_option('--legacy-max', type='int', default=2000,
+                      help='largest number of groups to time the list '
+                           'based version with (default 2000)')
+    options, _ = parser.parse_args()
+
+    for ngroups in (options.groups or [1000, 10000]):
+        run(ngroups, options.cidrs, options.legacy_max, options.addresses)
+
+
+if __name__ == '__main__':
+    main()
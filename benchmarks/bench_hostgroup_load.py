@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Riverbed Technology, Inc.
+#
+# This software is licensed under the terms and conditions of the MIT License
+# accompanying the software ("License").  This software is distributed "AS IS"
+# as set forth in the License.
+
+"""
+Compare loading all host group types with their groups and members one
+request at a time, as examples/percentile.py did, against
+HostGroupType.load_all, against an API simulating the latency of an
+appliance:
+
+    $ python benchmarks/bench_hostgroup_load.py --types 20 --groups 50
+
+Each request sleeps for --latency seconds plus --item-latency per item
+returned.
+"""
+
+import time
+import optparse
+
+from steelscript.netprofiler.core.hostgroup import HostGroupType
+
+
+class SlowHostGroupTypesAPI(object):
+    def __init__(self, ntypes, ngroups, nmembers, latency, item_latency):
+        self.ntypes = ntypes
+        self.ngroups = ngroups
+        self.nmembers = nmembers
+        self.latency = latency
+        self.item_latency = item_latency
+        self.requests = 0
+
+    def _respond(self, items, offset, limit):
+        items = items[offset:None if limit is None else offset + limit]
+        self.requests += 1
+        time.sleep(self.latency + self.item_latency * len(items))
+        return items
+
+    def get_all(self, offset=0, limit=None):
+        return self._respond([{'id': t, 'name': 'type%d' % t,
+                               'favorite': False, 'description': ''}
+                              for t in range(self.ntypes)], offset, limit)
+
+    def get(self, type_id):
+        return self._respond([{'id': type_id, 'name': 'type%d' % type_id,
+                               'favorite': False, 'description': ''}],
+                             0, None)[0]
+
+    def get_config(self, type_id):
+        return self._respond([{'name': 'group%d' % g,
+                               'cidr': '10.%d.%d.0/24' % (type_id, g)}
+                              for g in range(self.ngroups)], 0, None)
+
+    def get_all_groups(self, type_id, offset=0, limit=None):
+        return self._respond([{'id': g, 'name': 'group%d' % g}
+                              for g in range(self.ngroups)], offset, limit)
+
+    def get_group_members(self, type_id, group_id, offset=0, limit=None):
+        return self._respond([{'ipaddr': '10.%d.%d.%d' % (type_id, group_id,
+                                                          m)}
+                              for m in range(self.nmembers)], offset, limit)
+
+
+def load_serial(api, page_size):
+    # one request at a time, paging as load_all does
+    def pages(func, *args):
+        items = []
+        while True:
+            page = func(*args, offset=len(items), limit=page_size)
+            if not page:
+                return items
+            items.extend(page)
+
+    snapshot = dict()
+    for info in pages(api.get_all):
+        api.get(info['id'])
+        api.get_config(info['id'])
+        snapshot[info['name']] = dict(
+            (group['name'], pages(api.get_group_members, info['id'],
+                                  group['id']))
+            for group in pages(api.get_all_groups, info['id']))
+    return snapshot
+
+
+def run(options, workers):
+    api = SlowHostGroupTypesAPI(options.types, options.groups,
+                                options.members, options.latency,
+                                options.item_latency)
+    profiler = type('NetProfiler', (object,), {})()
+    profiler.host = 'bench-%d' % workers
+    profiler.api = type('API', (object,), {})()
+    profiler.api.host_group_types = api
+
+    if workers == 0:
+        start = time.time()
+        snapshot = load_serial(api, options.page_size)
+        label = 'serial'
+    else:
+        start = time.time()
+        types = HostGroupType.load_all(profiler, workers=workers,
+                                       page_size=options.page_size)
+        snapshot = dict((name, dict((group.name, group.members)
+                                    for group in t.groups.values()))
+                        for name, t in types.items())
+        label = 'load_all, %d workers' % workers
+    secs = time.time() - start
+
+    assert len(snapshot) == options.types
+    assert all(len(groups) == options.groups
+               for groups in snapshot.values())
+    print('%-24s %5d requests  %6.2fs' % (label, api.requests, secs))
+    return secs
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--types', type='int', default=10,
+                      help='number of host group types (default 10)')
+    parser.add_option('--groups', type='int', default=20,
+                      help='number of host groups per type (default 20)')
+    parser.add_option('--members', type='int', default=50,
+                      help='number of members per host group (default 50)')
+    parser.add_option('--page-size', type='int', default=500,
+                      help='number of items per request (default 500)')
+    parser.add_option('--latency', type='float', default=0.01,
+                      help='seconds per request (default 0.01)')
+    parser.add_option('--item-latency', type='float', default=0.00001,
+                      help='seconds per item returned (default 0.00001)')
+    parser.add_option('--workers', action='append', type='int', default=[],
+                      help='number of load_all workers, may be repeated '
+                           '(default %d)' % HostGroupType.LOAD_WORKERS)
+    options, _ = parser.parse_args()
+
+    serial = run(options, 0)
+    for workers in (options.workers or [HostGroupType.LOAD_WORKERS]):
+        secs = run(options, workers)
+        print('%24s speedup %.1fx' % ('', serial / secs))
+
+
+if __name__ == '__main__':
+    main()
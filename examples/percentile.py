@@ -15,6 +15,7 @@ import matplotlib.pyplot as plt
 from steelscript.netprofiler.core.app import NetProfilerApp
 from steelscript.netprofiler.core import *
 from steelscript.netprofiler.core.filters import TimeFilter, TrafficFilter
+from steelscript.netprofiler.core.hostgroup import HostGroupType
 
 
 class PercentileApp(NetProfilerApp):
@@ -151,12 +152,12 @@ class PercentileApp(NetProfilerApp):
         ssh.close()
 
     def list_host_groups(self, profiler):
-        for grouptype in profiler.api.host_group_types.get_all():
-            print("Group type:", grouptype['name'])
+        grouptypes = HostGroupType.load_all(profiler, members=False)
+        for name, grouptype in grouptypes.items():
+            print("Group type:", name)
 
-            for group in profiler.api.host_group_types.get_all_groups(
-                    grouptype['id']):
-                print('', group['name'])
+            for group in grouptype.groups:
+                print('', group)
 
     def report_item(self, profiler, timefilter, trafficfilter,
                     buckettime, percentile):
@@ -6,12 +6,10 @@
 
 
 import os
-import time
 import json
 import types
 import logging
 import datetime
-import threading
 from collections import namedtuple
 
 import pandas
@@ -23,6 +21,7 @@ from steelscript.netprofiler.core.services import \
 from steelscript.netprofiler.core.report import \
     Report, SingleQueryReport, TrafficTimeSeriesReport, MultiQueryReport
 from steelscript.netprofiler.core.filters import TimeFilter, TrafficFilter
+from steelscript.netprofiler.core.polling import poll_status
 from steelscript.common.timeutils import (parse_timedelta,
                                           timedelta_total_seconds)
 from steelscript.appfwk.apps.datasource.models import \
@@ -37,8 +36,6 @@ from steelscript.netprofiler.core.hostgroup import HostGroupType
 from steelscript.appfwk.apps.jobs import QueryComplete, QueryError
 
 logger = logging.getLogger(__name__)
-lock = threading.Lock()
-
 
 def _post_process_combine_filterexprs(form, id, criteria, params):
     exprs = []
@@ -73,7 +70,7 @@ def netprofiler_hostgroup_types(form, id, field_kwargs, params):
 
         choices = []
 
-        for hgt in netprofiler.api.host_group_types.get_all():
+        for hgt in HostGroupType.get_all(netprofiler):
             choices.append((hgt['name'], hgt['name']))
 
     field_kwargs['label'] = 'HostGroupType'
@@ -90,13 +87,13 @@ def netprofiler_hostgroups(form, id, field_kwargs, params):
         netprofiler = DeviceManager.get_device(netprofiler_device)
 
         if params is not None and 'hostgroup_type' in params:
-            hgt = HostGroupType.find_by_name(netprofiler,
-                                             params['hostgroup_type'])
+            hostgroup_type = params['hostgroup_type']
         else:
             hostgroup_type = form.get_field_value('hostgroup_type', id)
 
-            hgt = HostGroupType.find_by_name(netprofiler,
-                                             hostgroup_type)
+        # only listed, may be read from the cache of host group types
+        hgt = HostGroupType.find_by_name(netprofiler, hostgroup_type,
+                                         refresh=False)
 
         choices = [(group, group) for group in hgt.groups.keys()]
 
@@ -459,31 +456,25 @@ class NetProfilerQuery(TableQueryBase):
 
     def _wait_for_data(self, report, minpct=0, maxpct=100):
         criteria = self.job.criteria
-        done = False
         logger.info("Waiting for report to complete")
-        while not done:
-            time.sleep(0.5)
-            with lock:
-                s = report.status()
 
+        for s in poll_status(report.status):
             logger.debug('Status: XXX %s' % str(s))
             pct = int(float(s['percent']) * ((maxpct - minpct)/100.0) + minpct)
             self.job.mark_progress(progress=pct)
-            done = (s['status'] == 'completed')
 
         # Retrieve the data
-        with lock:
-            data = report.get_data()
-
-            tz = criteria.starttime.tzinfo
-            # Update criteria
-            query = report.get_query_by_index(0)
-            criteria.starttime = (datetime.datetime
-                                  .utcfromtimestamp(query.actual_t0)
-                                  .replace(tzinfo=tz))
-            criteria.endtime = (datetime.datetime
-                                .utcfromtimestamp(query.actual_t1)
-                                .replace(tzinfo=tz))
+        data = report.get_data()
+
+        tz = criteria.starttime.tzinfo
+        # Update criteria
+        query = report.get_query_by_index(0)
+        criteria.starttime = (datetime.datetime
+                              .utcfromtimestamp(query.actual_t0)
+                              .replace(tzinfo=tz))
+        criteria.endtime = (datetime.datetime
+                            .utcfromtimestamp(query.actual_t1)
+                            .replace(tzinfo=tz))
 
         self.job.safe_update(actual_criteria=criteria)
         return data
@@ -493,21 +484,20 @@ class NetProfilerQuery(TableQueryBase):
         """
         args = self._prepare_report_args()
 
-        with lock:
-            report = SingleQueryReport(args.profiler)
-            report.run(
-                realm=self.table.options.realm,
-                groupby=args.profiler.groupbys[self.table.options.groupby],
-                centricity=args.centricity,
-                columns=args.columns,
-                timefilter=args.timefilter,
-                trafficexpr=args.trafficexpr,
-                data_filter=args.datafilter,
-                resolution=args.resolution,
-                sort_col=args.sortcol,
-                sync=False,
-                limit=args.limit
-            )
+        report = SingleQueryReport(args.profiler)
+        report.run(
+            realm=self.table.options.realm,
+            groupby=args.profiler.groupbys[self.table.options.groupby],
+            centricity=args.centricity,
+            columns=args.columns,
+            timefilter=args.timefilter,
+            trafficexpr=args.trafficexpr,
+            data_filter=args.datafilter,
+            resolution=args.resolution,
+            sort_col=args.sortcol,
+            sync=False,
+            limit=args.limit
+        )
 
         data = self._wait_for_data(report)
 
@@ -538,12 +528,11 @@ class NetProfilerTemplateQuery(NetProfilerQuery):
         """ Main execution method. """
         args = self._prepare_report_args()
 
-        with lock:
-            report = MultiQueryReport(args.profiler)
-            report.run(template_id=self.table.options.template_id,
-                       timefilter=args.timefilter,
-                       trafficexpr=args.trafficexpr,
-                       resolution=args.resolution)
+        report = MultiQueryReport(args.profiler)
+        report.run(template_id=self.table.options.template_id,
+                   timefilter=args.timefilter,
+                   trafficexpr=args.trafficexpr,
+                   resolution=args.resolution)
 
         data = self._wait_for_data(report)
         headers = report.get_legend()
@@ -687,19 +676,18 @@ class NetProfilerTrafficTimeSeriesQuery(NetProfilerQuery):
     # on to the TrafficTimeSeriesReport query_columns argument
     def run_top_n(self, config, args, base_col, minpct, maxpct):
         columns = config.columns + [base_col.name]
-        with lock:
-            report = SingleQueryReport(args.profiler)
-            report.run(
-                realm='traffic_summary',
-                centricity=args.centricity,
-                groupby=args.profiler.groupbys[self.table.options.groupby],
-                columns=columns,
-                timefilter=args.timefilter,
-                trafficexpr=args.trafficexpr,
-                resolution=args.resolution,
-                sort_col=base_col.name,
-                sync=False
-                )
+        report = SingleQueryReport(args.profiler)
+        report.run(
+            realm='traffic_summary',
+            centricity=args.centricity,
+            groupby=args.profiler.groupbys[self.table.options.groupby],
+            columns=columns,
+            timefilter=args.timefilter,
+            trafficexpr=args.trafficexpr,
+            resolution=args.resolution,
+            sort_col=base_col.name,
+            sync=False
+            )
 
         rows = self._wait_for_data(report, minpct=minpct, maxpct=maxpct)
 
@@ -768,31 +756,30 @@ class NetProfilerTrafficTimeSeriesQuery(NetProfilerQuery):
             logger.error(msg)
             return QueryError(msg)
 
-        with lock:
-            report = TrafficTimeSeriesReport(args.profiler)
-            columns = [args.columns[0], base_col.name]
-            logger.info("Query Columns: %s" % str(query_columns))
+        report = TrafficTimeSeriesReport(args.profiler)
+        columns = [args.columns[0], base_col.name]
+        logger.info("Query Columns: %s" % str(query_columns))
 
-            if self.table.options.groupby == 'host_group':
-                host_group_type = 'ByLocation'
-            else:
-                host_group_type = None
-
-            report.run(
-                centricity=args.centricity,
-                columns=columns,
-                timefilter=args.timefilter,
-                trafficexpr=args.trafficexpr,
-                resolution=args.resolution,
-                sync=False,
-                host_group_type=host_group_type,
-                query_columns_groupby=config.groupby,
-                query_columns=query_columns
-            )
+        if self.table.options.groupby == 'host_group':
+            host_group_type = 'ByLocation'
+        else:
+            host_group_type = None
+
+        report.run(
+            centricity=args.centricity,
+            columns=columns,
+            timefilter=args.timefilter,
+            trafficexpr=args.trafficexpr,
+            resolution=args.resolution,
+            sync=False,
+            host_group_type=host_group_type,
+            query_columns_groupby=config.groupby,
+            query_columns=query_columns
+        )
 
-        data = self._wait_for_data(report,
-                                   minpct=cur_report * (100/num_reports),
-                                   maxpct=(cur_report + 1) * (100/num_reports))
+        data = self._wait_for_data(
+            report, minpct=cur_report * (100/num_reports),
+            maxpct=(cur_report + 1) * (100/num_reports))
         cur_report += 1
 
         df = pandas.DataFrame(data,
@@ -810,22 +797,21 @@ class NetProfilerTrafficTimeSeriesQuery(NetProfilerQuery):
             # Run a separate timeseries query with no column filters
             # to get "totals" then use that to compute an "other" column
 
-            with lock:
-                report = SingleQueryReport(args.profiler)
-                report.run(
-                    realm='traffic_overall_time_series',
-                    centricity=args.centricity,
-                    groupby=args.profiler.groupbys['time'],
-                    columns=columns,
-                    timefilter=args.timefilter,
-                    trafficexpr=args.trafficexpr,
-                    resolution=args.resolution,
-                    sync=False
-                )
-
-            totals = self._wait_for_data(report,
-                                         minpct=cur_report * (100/num_reports),
-                                         maxpct=(cur_report + 1) * (100/num_reports))
+            report = SingleQueryReport(args.profiler)
+            report.run(
+                realm='traffic_overall_time_series',
+                centricity=args.centricity,
+                groupby=args.profiler.groupbys['time'],
+                columns=columns,
+                timefilter=args.timefilter,
+                trafficexpr=args.trafficexpr,
+                resolution=args.resolution,
+                sync=False
+            )
+
+            totals = self._wait_for_data(
+                report, minpct=cur_report * (100/num_reports),
+                maxpct=(cur_report + 1) * (100/num_reports))
 
             df = df.set_index('time')
             df['subtotal'] = df.sum(axis=1)
@@ -903,32 +889,25 @@ class NetProfilerServiceByLocQuery(TableQueryBase):
             'Running NetProfilerServiceByLocTable %d report for timeframe %s' %
             (self.table.id, str(tf)))
 
-        with lock:
-            report.run(timefilter=tf, sync=False)
+        report.run(timefilter=tf, sync=False)
 
-        done = False
         logger.info("Waiting for report to complete")
-        while not done:
-            time.sleep(0.5)
-            with lock:
-                s = report.status()
 
+        for s in poll_status(report.status):
             self.job.mark_progress(progress=int(s['percent']))
-            done = (s['status'] == 'completed')
 
         # Retrieve the data
-        with lock:
-            data = report.get_data()
-            query = report.get_query_by_index(0)
-
-            tz = criteria.starttime.tzinfo
-            # Update criteria
-            criteria.starttime = (datetime.datetime
-                                  .utcfromtimestamp(query.actual_t0)
-                                  .replace(tzinfo=tz))
-            criteria.endtime = (datetime.datetime
-                                .utcfromtimestamp(query.actual_t1)
-                                .replace(tzinfo=tz))
+        data = report.get_data()
+        query = report.get_query_by_index(0)
+
+        tz = criteria.starttime.tzinfo
+        # Update criteria
+        criteria.starttime = (datetime.datetime
+                              .utcfromtimestamp(query.actual_t0)
+                              .replace(tzinfo=tz))
+        criteria.endtime = (datetime.datetime
+                            .utcfromtimestamp(query.actual_t1)
+                            .replace(tzinfo=tz))
 
         self.job.safe_update(actual_criteria=criteria)
 
@@ -985,21 +964,20 @@ class NetProfilerHostPairPortQuery(NetProfilerQuery):
         """
         args = self._prepare_report_args()
 
-        with lock:
-            report = SingleQueryReport(args.profiler)
-            report.run(
-                realm=self.table.options.realm,
-                groupby=args.profiler.groupbys[self.table.options.groupby],
-                centricity=args.centricity,
-                columns=args.columns,
-                timefilter=args.timefilter,
-                trafficexpr=args.trafficexpr,
-                data_filter=args.datafilter,
-                resolution=args.resolution,
-                sort_col=self.table.options.sort_col,
-                sync=False,
-                limit=args.limit
-            )
+        report = SingleQueryReport(args.profiler)
+        report.run(
+            realm=self.table.options.realm,
+            groupby=args.profiler.groupbys[self.table.options.groupby],
+            centricity=args.centricity,
+            columns=args.columns,
+            timefilter=args.timefilter,
+            trafficexpr=args.trafficexpr,
+            data_filter=args.datafilter,
+            resolution=args.resolution,
+            sort_col=self.table.options.sort_col,
+            sync=False,
+            limit=args.limit
+        )
 
         data = self._wait_for_data(report)
 
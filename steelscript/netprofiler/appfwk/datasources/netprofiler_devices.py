@@ -15,7 +15,6 @@ from steelscript.appfwk.apps.datasource.models import \
 from steelscript.appfwk.apps.devices.devicemanager import DeviceManager
 from steelscript.appfwk.apps.devices.forms import fields_add_device_selection
 from steelscript.appfwk.libs.fields import Function
-from steelscript.netprofiler.appfwk.datasources.netprofiler import lock
 
 
 logger = logging.getLogger(__name__)
@@ -65,8 +64,7 @@ class NetProfilerDeviceQuery(TableQueryBase):
         # This returns an array of rows, one row per device
         # Each row is a dict containing elements such as:
         #      id, ipaddr, name, type, type_id, and version
-        with lock:
-            devicedata = profiler.api.devices.get_all()
+        devicedata = profiler.api.devices.get_all()
 
         # Convert to a DataFrame to make it easier to work with
         df = pandas.DataFrame(devicedata)
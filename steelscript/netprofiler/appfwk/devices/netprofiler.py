@@ -4,10 +4,21 @@
 # accompanying the software ("License").  This software is distributed "AS IS"
 # as set forth in the License.
 
+from django.conf import settings
 
 from steelscript.netprofiler.core.netprofiler import NetProfiler
 
+# Default number of reports run at once against each NetProfiler device,
+# overridden by NETPROFILER_MAX_REPORTS_PER_DEVICE in settings
+MAX_REPORTS_PER_DEVICE = 8
+
 
 def new_device_instance(*args, **kwargs):
-    # Used by DeviceManager to create a NetProfiler instance
-    return NetProfiler(*args, **kwargs)
+    # Used by DeviceManager to create a NetProfiler instance.  Reports
+    # are admitted by the scheduler shared by all devices of its host,
+    # so jobs against different appliances never wait for each other.
+    profiler = NetProfiler(*args, scheduler=True, **kwargs)
+    profiler.scheduler.max_running = getattr(
+        settings, 'NETPROFILER_MAX_REPORTS_PER_DEVICE',
+        MAX_REPORTS_PER_DEVICE)
+    return profiler
@@ -5,7 +5,12 @@
 # as set forth in the License.
 
 
+import time
+import codecs
+
 from steelscript.common.api_helpers import APIVersion
+from steelscript.common.exceptions import RvbdHTTPException
+from steelscript.netprofiler.core import _jsonstream
 
 
 class APIGroup(object):
@@ -16,14 +21,110 @@ class APIGroup(object):
         self.service = service
 
 
+def _endpoint(urlpath):
+    """Return `urlpath` with identifiers replaced by placeholders.
+
+    Path segments holding digits, such as report and query ids or IP
+    addresses, become ``{id}`` and host group names ``{name}``, so that
+    ``/reports/12/queries/34.json`` is ``/reports/{id}/queries/{id}.json``.
+    """
+    segments = urlpath.split('?', 1)[0].split('/')
+    for i, segment in enumerate(segments):
+        name, ext = segment, ''
+        if name.endswith('.json'):
+            name, ext = name[:-5], '.json'
+        if i > 0 and segments[i - 1] == 'groups':
+            segments[i] = '{name}' + ext
+        elif any(c.isdigit() for c in name):
+            segments[i] = '{id}' + ext
+    return '/'.join(segments)
+
+
+def _body_size(request):
+    body = getattr(request, 'body', None)
+    return len(body) if body else 0
+
+
 class API1Group(APIGroup):
+    def _record(self, urlpath, method, start, response, bytes_in=None):
+        """Record the request for `urlpath` started at `start` in the
+        http_stats and metrics of the service.
+        """
+        seconds = time.monotonic() - start
+
+        stats = getattr(self.service, 'http_stats', None)
+        if stats is not None:
+            stats.record_call(seconds)
+
+        metrics = getattr(self.service, 'metrics', None)
+        if metrics is not None:
+            if response is None:
+                status = None
+                bytes_in = bytes_out = 0
+            else:
+                status = response.status_code
+                if bytes_in is None:
+                    bytes_in = len(response.content)
+                bytes_out = _body_size(response.request)
+            metrics.record_request(self.uri_prefix + _endpoint(urlpath),
+                                   method, status, seconds,
+                                   bytes_in, bytes_out)
+
     def _json_request(self, urlpath, method='GET', data=None, params=None,
                       raw_response=False):
         """Issue the given API request via JSON
         """
-        return self.service.conn.json_request(method, self.uri_prefix + urlpath,
-                                              body=data, params=params,
-                                              raw_response=raw_response)
+        start = time.monotonic()
+        r = None
+        try:
+            data, r = self.service.conn.json_request(
+                method, self.uri_prefix + urlpath, body=data, params=params,
+                raw_response=True)
+        except RvbdHTTPException as e:
+            r = e.xresult
+            raise
+        finally:
+            self._record(urlpath, method, start, r)
+
+        if raw_response:
+            return data, r
+        return data
+
+    def _json_stream_request(self, urlpath, key, side, params=None,
+                             chunk_size=65536):
+        """Issue a GET request and incrementally parse the JSON response.
+
+        Yields the elements of the top-level array `key` as the response
+        body is received, all other top-level members are stored in the
+        dict `side`.
+        """
+        extra_headers = {'Content-Type': 'application/json',
+                         'Accept': 'application/json'}
+        start = time.monotonic()
+        try:
+            r = self.service.conn.request('GET', self.uri_prefix + urlpath,
+                                          params=params,
+                                          extra_headers=extra_headers,
+                                          stream=True)
+        except RvbdHTTPException as e:
+            self._record(urlpath, 'GET', start, e.xresult)
+            raise
+
+        received = [0]
+
+        def content():
+            for c in r.iter_content(chunk_size=chunk_size):
+                received[0] += len(c)
+                yield c
+
+        try:
+            decoder = codecs.getincrementaldecoder(r.encoding or 'utf-8')()
+            chunks = (decoder.decode(c) for c in content())
+            for item in _jsonstream.iter_items(chunks, key, side):
+                yield item
+        finally:
+            r.close()
+            self._record(urlpath, 'GET', start, r, bytes_in=received[0])
 
 
 class Common(API1Group):
@@ -37,14 +138,34 @@ class Common(API1Group):
         return self._json_request('/logout.json')
 
 
+def _cached(name):
+    """Property stored under `name` in the `_cache` dict of the object."""
+    def fget(self):
+        return self._cache.get(name)
+
+    def fset(self, value):
+        self._cache[name] = value
+    return property(fget, fset)
+
+
 class Report(API1Group):
     def __init__(self, *args, **kwargs):
         super(Report, self).__init__(*args, **kwargs)
-        self.columns_cache = dict()
-        self.realms_cache = None
-        self.centricities_cache = None
-        self.groupbys_cache = None
-        self.areas_cache = None
+        self.share_cache(dict())
+
+    columns_cache = _cached('columns')
+    realms_cache = _cached('realms')
+    centricities_cache = _cached('centricities')
+    groupbys_cache = _cached('groupbys')
+    areas_cache = _cached('areas')
+
+    def share_cache(self, cache):
+        """Keep the metadata responses in the dict `cache`, which may be
+        shared with the Report objects of other connections to the same
+        appliance.
+        """
+        cache.setdefault('columns', dict())
+        self._cache = cache
 
     def realms(self, force=False):
         if not self.realms_cache or force:
@@ -91,6 +212,15 @@ class Report(API1Group):
         uri += '.json'
         return self._json_request(uri, params=params)
 
+    def iter_queries(self, rid, qid, side, params=None):
+        """Iterate over the data rows of a report query as they arrive.
+
+        The remaining members of the query response, such as `totals`,
+        are stored in the dict `side`.
+        """
+        uri = '/reports/{0}/queries/{1}.json'.format(rid, qid)
+        return self._json_stream_request(uri, 'data', side, params=params)
+
     def delete(self, rid):
         return self._json_request('/reports/{0}.json'.format(rid),
                                   method='DELETE')
@@ -0,0 +1,122 @@
+# Copyright (c) 2019 Riverbed Technology, Inc.
+#
+# This software is licensed under the terms and conditions of the MIT License
+# accompanying the software ("License").  This software is distributed "AS IS"
+# as set forth in the License.
+
+"""
+Compact on-disk format of the NetProfiler column catalog.
+
+The catalog maps each realm, centricity and groupby triplet to the list
+of columns valid for it.  Most columns are valid for many triplets, so
+rather than pickling a Column object per triplet, the file holds one
+table of unique column definitions, as rows of values in a fixed field
+order, and for each triplet the list of positions of its columns in
+that table::
+
+    {"format": 2,
+     "cache_version": 1.1,
+     "fields": ["id", "strid", "name", "type", "rate", "category", ...],
+     "columns": [[30, "ID_TOTAL_BYTES", "Total Bytes", "int", ...], ...],
+     "absent": {"12": [6, 9], ...},
+     "triplets": {"traffic_summaryhoshos": [0, 4, 17, ...], ...}}
+
+The file is plain JSON, read with the C accelerated json module.
+"""
+
+import os
+import json
+import logging
+
+from steelscript.common._fs import SteelScriptFile
+from steelscript.netprofiler.core._types import Column
+
+logger = logging.getLogger(__name__)
+
+FORMAT = 2
+
+# Fields listed first in the column table, any other field found in the
+# column definitions is appended after them
+FIELDS = ['id', 'strid', 'name', 'type', 'rate', 'category']
+
+
+class ColumnCatalogFile(SteelScriptFile):
+    """File object for the column catalog.
+
+    Like :class:`SteelScriptData <steelscript.common._fs.SteelScriptData>`,
+    `data` is a dict of triplet hash to list of Column objects and
+    `version` the cache version it was written with.
+    """
+    def __init__(self, *args, **kwargs):
+        super(ColumnCatalogFile, self).__init__(*args, **kwargs)
+
+    def read(self):
+        self.data = None
+        if not os.path.isfile(self.fullpath):
+            return
+
+        try:
+            with open(self.fullpath, 'r') as f:
+                catalog = json.load(f)
+        except ValueError as e:
+            logger.warning('Ignoring unreadable column catalog %s: %s'
+                           % (self.fullpath, e))
+            return
+
+        if catalog.get('format') != FORMAT:
+            return
+
+        fields = catalog['fields']
+        definitions = [dict(zip(fields, values))
+                       for values in catalog['columns']]
+        for i, absent in catalog['absent'].items():
+            for k in absent:
+                del definitions[int(i)][fields[k]]
+        columns = [Column.from_json(d) for d in definitions]
+
+        self.version = catalog['cache_version']
+        self.data = dict((h, [columns[i] for i in indexes])
+                         for h, indexes in catalog['triplets'].items())
+
+    def write(self):
+        fields = list(FIELDS)
+        table = []
+        positions = dict()
+        triplets = dict()
+        for h, columns in self.data.items():
+            indexes = []
+            for c in columns:
+                # identical definitions are stored once
+                ident = json.dumps(c.json, sort_keys=True)
+                i = positions.get(ident)
+                if i is None:
+                    i = positions[ident] = len(table)
+                    table.append(c)
+                    for k in c.json:
+                        if k not in fields:
+                            fields.append(k)
+                indexes.append(i)
+            triplets[h] = indexes
+
+        # fields missing from a definition are listed separately, so
+        # that definitions are restored exactly
+        absent = dict()
+        for i, c in enumerate(table):
+            missing = [j for j, k in enumerate(fields) if k not in c.json]
+            if missing:
+                absent[i] = missing
+
+        catalog = {'format': FORMAT,
+                   'cache_version': self.version,
+                   'fields': fields,
+                   'columns': [[c.json.get(k) for k in fields]
+                               for c in table],
+                   'absent': absent,
+                   'triplets': triplets}
+
+        # write to a temporary file first, so that concurrent readers
+        # never see a partial catalog
+        tmp = self.fullpath + '.tmp%d' % os.getpid()
+        with open(tmp, 'w') as f:
+            json.dump(catalog, f, separators=(',', ':'))
+        os.replace(tmp, self.fullpath)
@@ -0,0 +1,134 @@
+# Copyright (c) 2019 Riverbed Technology, Inc.
+#
+# This software is licensed under the terms and conditions of the MIT License
+# accompanying the software ("License").  This software is distributed "AS IS"
+# as set forth in the License.
+
+"""
+Incremental parsing of JSON objects holding one large array.
+
+Report query responses look like::
+
+    {"id": ..., "columns": [...], "data": [[...], [...], ...],
+     "totals": [...]}
+
+where "data" may hold hundreds of thousands of rows.  `iter_items`
+walks such a document as its text arrives, yielding the elements of
+one top-level array one at a time and collecting every other top-level
+member on the side.
+"""
+
+import json
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+# characters which may continue a number
+_NUMBER = '0123456789+-.eE'
+
+
+class _Reader(object):
+    """Buffer over an iterator of text chunks."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.text = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        for chunk in self.chunks:
+            if chunk:
+                self.text = self.text[self.pos:] + chunk
+                self.pos = 0
+                return
+        self.eof = True
+
+    def _skip_whitespace(self):
+        while True:
+            text, pos = self.text, self.pos
+            while pos < len(text) and text[pos] in _WHITESPACE:
+                pos += 1
+            self.pos = pos
+            if pos < len(text):
+                return
+            if self.eof:
+                raise ValueError('Unexpected end of JSON document')
+            self._fill()
+
+    def peek(self):
+        self._skip_whitespace()
+        return self.text[self.pos]
+
+    def next_char(self):
+        c = self.peek()
+        self.pos += 1
+        return c
+
+    def expect(self, c):
+        found = self.next_char()
+        if found != c:
+            raise ValueError('Expected %r at offset %d, found %r'
+                             % (c, self.pos - 1, found))
+
+    def value(self):
+        """Decode the next complete JSON value."""
+        self._skip_whitespace()
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.text, self.pos)
+            except ValueError:
+                if self.eof:
+                    raise
+            else:
+                # A number may continue in the next chunk, when it ends
+                # the buffer or only a prefix of it was decoded, such as
+                # 12 out of '12.'
+                if self.eof or (end < len(self.text) and not (
+                        isinstance(obj, (int, float)) and
+                        self.text[end] in _NUMBER)):
+                    self.pos = end
+                    return obj
+            self._fill()
+
+
+def iter_items(chunks, key, side):
+    """Yield the elements of array `key` of the JSON object in `chunks`.
+
+    :param chunks: iterable of text chunks making up one JSON object
+
+    :param str key: name of the top-level member holding the array
+        to iterate over
+
+    :param dict side: updated with all other top-level members of the
+        object, complete once the iterator is exhausted
+
+    """
+    reader = _Reader(chunks)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+
+    while True:
+        name = reader.value()
+        reader.expect(':')
+        if name == key and reader.peek() == '[':
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.expect(']')
+            else:
+                while True:
+                    yield reader.value()
+                    c = reader.next_char()
+                    if c == ']':
+                        break
+                    elif c != ',':
+                        raise ValueError('Expected "," or "]" in array, '
+                                         'found %r' % c)
+        else:
+            side[name] = reader.value()
+
+        c = reader.next_char()
+        if c == '}':
+            break
+        elif c != ',':
+            raise ValueError('Expected "," or "}" in object, found %r' % c)
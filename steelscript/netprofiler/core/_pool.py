@@ -0,0 +1,133 @@
+# Copyright (c) 2019 Riverbed Technology, Inc.
+#
+# This software is licensed under the terms and conditions of the MIT License
+# accompanying the software ("License").  This software is distributed "AS IS"
+# as set forth in the License.
+
+"""
+HTTP connection pooling for NetProfiler connections.
+
+All API groups of a NetProfiler object issue their requests through the
+same ``requests`` session.  :class:`PoolAdapter` is mounted on that
+session so that a bounded number of persistent connections are opened
+to the appliance and reused by every thread, and counts the connections
+opened in a :class:`ConnectionStats` along with the latency of each API
+call.
+"""
+
+import socket
+import threading
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+
+class ConnectionStats(object):
+    """Counters of the HTTP connections and calls of a NetProfiler."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Set all counters back to zero."""
+        with self._lock:
+            # connections opened, each costing a TCP and TLS handshake
+            self.connections = 0
+            self.calls = 0
+            self.total_seconds = 0.0
+            self.min_seconds = None
+            self.max_seconds = None
+
+    def record_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def record_call(self, seconds):
+        with self._lock:
+            self.calls += 1
+            self.total_seconds += seconds
+            if self.min_seconds is None or seconds < self.min_seconds:
+                self.min_seconds = seconds
+            if self.max_seconds is None or seconds > self.max_seconds:
+                self.max_seconds = seconds
+
+    @property
+    def mean_seconds(self):
+        """Average latency of an API call, None before the first one."""
+        if not self.calls:
+            return None
+        return self.total_seconds / self.calls
+
+    def as_dict(self):
+        """Return the counters as a dict."""
+        with self._lock:
+            return {'connections': self.connections,
+                    'calls': self.calls,
+                    'total_seconds': self.total_seconds,
+                    'min_seconds': self.min_seconds,
+                    'max_seconds': self.max_seconds,
+                    'mean_seconds': (self.total_seconds / self.calls
+                                     if self.calls else None)}
+
+
+def _counting(pool_cls, stats):
+    """Return a subclass of the urllib3 `pool_cls` counting the
+    connections it opens in `stats`.
+    """
+    class CountingPool(pool_cls):
+        def _new_conn(self):
+            stats.record_connection()
+            return super(CountingPool, self)._new_conn()
+
+    CountingPool.__name__ = 'Counting' + pool_cls.__name__
+    return CountingPool
+
+
+class PoolAdapter(HTTPAdapter):
+    """Transport adapter keeping up to `pool_size` persistent connections
+    per host.
+
+    :param stats: :class:`ConnectionStats` counting opened connections
+
+    :param int pool_size: maximum number of connections kept open, and
+        when `block` is set, in use at once
+
+    :param bool block: if True, requests wait for a pooled connection to
+        be free rather than opening one that is closed after use
+
+    :param bool keepalive: if True, enable TCP keep-alive probes on the
+        pooled connections, so that idle ones are not dropped by firewalls
+        or NAT devices between requests
+    """
+    def __init__(self, stats, pool_size=10, block=False, keepalive=True):
+        self.stats = stats
+        self.keepalive = keepalive
+        super(PoolAdapter, self).__init__(pool_maxsize=pool_size,
+                                          pool_block=block)
+
+    def init_poolmanager(self, connections, maxsize, block=False,
+                         **pool_kwargs):
+        if self.keepalive:
+            pool_kwargs['socket_options'] = (
+                HTTPConnection.default_socket_options +
+                [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)])
+
+        super(PoolAdapter, self).init_poolmanager(connections, maxsize,
+                                                  block=block, **pool_kwargs)
+
+        pools = self.poolmanager.pool_classes_by_scheme
+        self.poolmanager.pool_classes_by_scheme = dict(
+            (scheme, _counting(cls, self.stats))
+            for scheme, cls in pools.items())
+
+
+def mount(session, stats, pool_size=10, block=False, keepalive=True):
+    """Mount a :class:`PoolAdapter` for http and https on the ``requests``
+    `session`, see :class:`PoolAdapter` for the arguments.
+    """
+    adapter = PoolAdapter(stats, pool_size=pool_size, block=block,
+                          keepalive=keepalive)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return adapter
@@ -0,0 +1,99 @@
+# Copyright (c) 2019 Riverbed Technology, Inc.
+#
+# This software is licensed under the terms and conditions of the MIT License
+# accompanying the software ("License").  This software is distributed "AS IS"
+# as set forth in the License.
+
+"""
+Process-wide registry of NetProfiler appliance metadata.
+
+The column catalog, areas and the responses of the metadata API calls
+only change with the software version of an appliance.  NetProfiler
+objects connected to the same host and version, in any thread, share a
+single :class:`Metadata` entry, so that only the first one loads them.
+An entry is replaced when an appliance reports a different version.
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class Metadata(object):
+    """Metadata shared by the NetProfiler objects of one appliance."""
+
+    def __init__(self, host, version):
+        self.host = host
+        self.version = version
+
+        # held while loading or updating any of the attributes below
+        self.lock = threading.RLock()
+
+        self.columns_file = None        # _catalog.ColumnCatalogFile
+        self.columns = None             # _types.ColumnContainer
+        self.colnames = None            # set of column keys
+        self.column_index = None        # netprofiler.ColumnIndex
+        self.groupby_keys = dict()      # groupby -> set of column keys
+        # True once the columns of all triplets were requested
+        self.columns_complete = False
+
+        self.areas_file = None
+        self.areas_dict = None
+        self.areas = None               # _types.AreaContainer
+
+        # responses of the _api1.Report metadata calls
+        self.api_cache = dict()
+
+        # most recent NetProfiler object using this entry, as a weakref,
+        # which retrieves columns on behalf of the others
+        self.profiler = None
+
+    def load_columns(self):
+        """Retrieve the columns not cached yet, for lazy NetProfilers.
+
+        Only done once: columns still missing afterwards do not exist,
+        looking them up again requests nothing.
+        """
+        if self.columns_complete:
+            return
+        profiler = self.profiler() if self.profiler is not None else None
+        if profiler is not None and profiler.lazy:
+            profiler.prefetch_columns()
+
+
+class MetadataRegistry(object):
+    """Map of appliance host to the :class:`Metadata` of its version."""
+
+    def __init__(self):
+        self._entries = dict()
+        self._lock = threading.Lock()
+
+    def get(self, host, version):
+        """Return the entry for `host` running software `version`.
+
+        A new, empty, entry is created if none exists or if the one
+        registered is for another version.
+        """
+        with self._lock:
+            entry = self._entries.get(host)
+            if entry is None or entry.version != version:
+                if entry is not None:
+                    logger.info('NetProfiler %s changed version from %s to '
+                                '%s, discarding its metadata'
+                                % (host, entry.version, version))
+                entry = self._entries[host] = Metadata(host, version)
+            return entry
+
+    def invalidate(self, host):
+        """Drop the entry for `host`."""
+        with self._lock:
+            self._entries.pop(host, None)
+
+    def clear(self):
+        """Drop all entries."""
+        with self._lock:
+            self._entries.clear()
+
+
+registry = MetadataRegistry()
@@ -5,6 +5,9 @@
 # as set forth in the License.
 
 
+import weakref
+import threading
+
 from steelscript.netprofiler.core import _constants
 
 
@@ -18,8 +21,34 @@ class Container(object):
     pass
 
 
+class LoadingContainer(Container):
+    """Container calling `loader` to find attributes it is missing."""
+    __slots__ = ('_loader',)
+
+    def __init__(self, loader=None):
+        self._loader = loader
+
+    def __getattr__(self, name):
+        if name.startswith('_') or self._loader is None:
+            raise AttributeError(name)
+        self._loader()
+        try:
+            return self.__dict__[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
 class Column(object):
     """A column object represents a single data column in Profiler terms"""
+
+    __slots__ = ('id', 'key', 'label', 'json', 'iskey', 'baseid',
+                 'ephemeral', 'ctype', 'rate', '_hash', '__weakref__')
+
+    # Non-ephemeral columns created by from_json, shared by all triplets,
+    # reports and NetProfiler objects holding the same definition
+    _shared = weakref.WeakValueDictionary()
+    _shared_lock = threading.Lock()
+
     def __init__(self, cid, key, label, json, baseid=None, ephemeral=False):
         # Numeric column id.  This may be ephemeral -- meaning
         # its a really big number like 100000+.  For a given report
@@ -42,6 +71,27 @@ class Column(object):
         self.baseid = (baseid or cid)
         self.ephemeral = ephemeral
 
+        # decoded once, as used for every row of report data
+        self.ctype = json.get('type')
+        self.rate = json.get('rate')
+
+        # the definition is never modified, so neither is its hash
+        try:
+            self._hash = hash(tuple(json.values()))
+        except TypeError:
+            self._hash = hash(key)
+
+    def __getstate__(self):
+        return dict(id=self.id, key=self.key, label=self.label,
+                    json=self.json, baseid=self.baseid,
+                    ephemeral=self.ephemeral)
+
+    def __setstate__(self, state):
+        # also restores Columns pickled before __slots__ were used
+        self.__init__(state['id'], state['key'], state['label'],
+                      state['json'], state.get('baseid'),
+                      state.get('ephemeral', False))
+
     @classmethod
     def from_json(cls, json):
         ephemeral = json['id'] >= _constants.EPHEMERAL_COLID
@@ -53,8 +103,24 @@ class Column(object):
             # and is equal to str(json['id'])
             key = strid
 
-        return Column(json['id'], key, json['name'],
-                      json=json, ephemeral=ephemeral)
+        if ephemeral:
+            return Column(json['id'], key, json['name'],
+                          json=json, ephemeral=ephemeral)
+
+        try:
+            ident = tuple(json.items())
+            hash(ident)
+        except TypeError:
+            return Column(json['id'], key, json['name'],
+                          json=json, ephemeral=ephemeral)
+
+        with cls._shared_lock:
+            column = cls._shared.get(ident)
+            if column is None:
+                column = cls._shared[ident] = Column(json['id'], key,
+                                                     json['name'], json=json,
+                                                     ephemeral=ephemeral)
+        return column
 
     def _get_cmp_val(self, other):
         if isinstance(other, Column):
@@ -80,7 +146,7 @@ class Column(object):
         return self.key >= self._get_cmp_val(other)
 
     def __hash__(self):
-        return hash(tuple(self.json.values()))
+        return self._hash
 
     def __repr__(self):
         if self.baseid and self.baseid != self.id:
@@ -121,24 +187,36 @@ class ColumnContainer(object):
     """Wrapper class for key and value Column classes
     Can be iterated against to get combined results.
     """
-    def __init__(self, columns):
-        self.key = Container()
-        self.value = Container()
+    def __init__(self, columns, loader=None):
+        """
+        :param columns: list of Column objects
+
+        :param loader: if set, function called to retrieve more columns
+            when one that is looked up is missing
+        """
+        self.key = LoadingContainer(loader)
+        self.value = LoadingContainer(loader)
         self._map = dict()
+        self._loader = loader
         self._update(columns)
 
     def __getitem__(self, key):
+        if key not in self._map and self._loader is not None:
+            self._loader()
         return self._map[key]
 
     def __iter__(self):
         """Iterates over keys and values to provide combined Column results.
         """
-        for c in self.keys:
+        # copied, as columns may be added by another thread meanwhile
+        for c in list(self.keys):
             yield c
-        for c in self.values:
+        for c in list(self.values):
             yield c
 
     def __contains__(self, key_or_id):
+        if key_or_id not in self._map and self._loader is not None:
+            self._loader()
         return key_or_id in self._map
 
     def _update(self, columns):
@@ -0,0 +1,238 @@
+# Copyright (c) 2019 Riverbed Technology, Inc.
+#
+# This software is licensed under the terms and conditions of the MIT License
+# accompanying the software ("License").  This software is distributed "AS IS"
+# as set forth in the License.
+
+"""
+This module provides an asyncio interface to NetProfiler reporting.
+
+:class:`AsyncNetProfiler` wraps a :class:`NetProfiler
+<steelscript.netprofiler.core.netprofiler.NetProfiler>` and shares its
+column metadata.  Requests to the appliance run on a small, bounded pool
+of worker threads while all waiting between status polls is done on the
+event loop, so thousands of reports can be in progress at once without
+a thread per report::
+
+    >>> async def top_hosts(aprofiler, timefilter):
+    ...     report = AsyncTrafficSummaryReport(aprofiler)
+    ...     await report.run(groupby='hos',
+    ...                      columns=['host_ip', 'avg_bytes'],
+    ...                      timefilter=timefilter)
+    ...     data = await report.get_data()
+    ...     await report.delete()
+    ...     return data
+
+Requires Python 3.7 or later.
+"""
+
+import asyncio
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from steelscript.netprofiler.core.netprofiler import NetProfiler
+from steelscript.netprofiler.core.polling import FixedPolling, AdaptivePolling
+from steelscript.netprofiler.core.report import (SingleQueryReport,
+                                                 TrafficSummaryReport,
+                                                 TrafficOverallTimeSeriesReport,
+                                                 TrafficTimeSeriesReport,
+                                                 TrafficFlowListReport)
+
+__all__ = ['AsyncNetProfiler',
+           'AsyncSingleQueryReport',
+           'AsyncTrafficSummaryReport',
+           'AsyncTrafficOverallTimeSeriesReport',
+           'AsyncTrafficTimeSeriesReport',
+           'AsyncTrafficFlowListReport']
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncNetProfiler(object):
+    """asyncio front-end to a NetProfiler appliance."""
+
+    def __init__(self, netprofiler, max_requests=8):
+        """Wrap an existing :class:`NetProfiler` object.
+
+        :param netprofiler: connected NetProfiler instance, its columns,
+            groupbys, realms and centricities are used as is
+
+        :param int max_requests: maximum number of HTTP requests in
+            progress at once against the appliance
+        """
+        self.netprofiler = netprofiler
+        self.executor = ThreadPoolExecutor(max_workers=max_requests)
+
+    @classmethod
+    async def connect(cls, host, port=None, auth=None, max_requests=8,
+                      lazy=False):
+        """Establish a connection to a NetProfiler without blocking
+        the event loop, see :class:`NetProfiler` for the arguments.
+        """
+        loop = asyncio.get_running_loop()
+        netprofiler = await loop.run_in_executor(
+            None, functools.partial(NetProfiler, host, port=port, auth=auth,
+                                    lazy=lazy))
+        return cls(netprofiler, max_requests=max_requests)
+
+    @property
+    def columns(self):
+        return self.netprofiler.columns
+
+    @property
+    def groupbys(self):
+        return self.netprofiler.groupbys
+
+    @property
+    def realms(self):
+        return self.netprofiler.realms
+
+    @property
+    def centricities(self):
+        return self.netprofiler.centricities
+
+    def get_columns(self, columns, groupby=None, strict=True):
+        """See :meth:`NetProfiler.get_columns`."""
+        return self.netprofiler.get_columns(columns, groupby, strict)
+
+    async def call(self, func, *args, **kwargs):
+        """Run the blocking `func` on the request pool and return its
+        result.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(func, *args, **kwargs))
+
+    def close(self):
+        """Release the request pool."""
+        self.executor.shutdown(wait=False)
+
+
+class AsyncSingleQueryReport(object):
+    """asyncio counterpart of :class:`SingleQueryReport`.
+
+    The coroutines mirror the methods of the wrapped report, available
+    as the `report` attribute.
+    """
+
+    report_class = SingleQueryReport
+
+    def __init__(self, aprofiler):
+        self.aprofiler = aprofiler
+        self.report = self.report_class(aprofiler.netprofiler)
+
+    @property
+    def id(self):
+        return getattr(self.report, 'id', None)
+
+    async def run(self, *args, **kwargs):
+        """Create the report on NetProfiler.
+
+        Takes the same arguments as the `run` method of the wrapped
+        report.  If `sync` is True (the default), wait until the report
+        is complete.  Admission by the scheduler of the NetProfiler, if
+        any, is awaited on the event loop, not on the request pool.
+
+        Sharded reports, and time series run through the
+        `timeseries_cache` of the NetProfiler, wait for their
+        sub-reports in the blocking `run` of the wrapped report, which
+        occupies one thread of the request pool until they all complete.
+        """
+        sync = kwargs.pop('sync', True)
+        kwargs['sync'] = False
+        await self._admission()
+        try:
+            await self.aprofiler.call(self.report.run, *args, **kwargs)
+        except BaseException:
+            # such as invalid columns, raised before the report was posted
+            self.report._release()
+            raise
+        if sync:
+            return await self.wait_for_complete()
+
+    async def _admission(self):
+        ticket = self.report._submit()
+        if ticket is None or ticket.admitted is not None:
+            return
+
+        loop = asyncio.get_running_loop()
+        admitted = loop.create_future()
+
+        def done(future):
+            if not future.done():
+                future.set_result(None)
+
+        ticket.add_done_callback(
+            lambda ticket: loop.call_soon_threadsafe(done, admitted))
+        try:
+            await admitted
+        except asyncio.CancelledError:
+            ticket.release()
+            raise
+
+    async def status(self):
+        """Query for the status of report, see :meth:`Report.status`."""
+        return await self.aprofiler.call(self.report.status)
+
+    async def wait_for_complete(self, interval=None, timeout=600,
+                                polling=None):
+        """Periodically checks report status and returns True when
+        100% complete, False if `timeout` seconds passed first.
+
+        See :meth:`Report.wait_for_complete` for the arguments.
+        """
+        if polling is None:
+            if interval is not None:
+                polling = FixedPolling(interval)
+            else:
+                polling = AdaptivePolling()
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        attempt = 0
+        while True:
+            s = await self.status()
+            if s['status'] == 'completed':
+                logger.info("Report %s complete" % self.id)
+                return True
+
+            elapsed = loop.time() - start
+            if elapsed >= timeout:
+                logger.warning("Timed out waiting for report %s to complete,"
+                               "last %d%% complete" %
+                               (self.id, int(s['percent'] or 0)))
+                return False
+
+            delay = polling.next_interval(s, attempt, elapsed)
+            await asyncio.sleep(min(delay, timeout - elapsed))
+            attempt += 1
+
+    async def get_legend(self, columns=None):
+        return await self.aprofiler.call(self.report.get_legend, columns)
+
+    async def get_data(self, columns=None, limit=None):
+        return await self.aprofiler.call(self.report.get_data,
+                                         columns, limit)
+
+    async def get_totals(self, columns=None):
+        return await self.aprofiler.call(self.report.get_totals, columns)
+
+    async def delete(self):
+        await self.aprofiler.call(self.report.delete)
+
+
+class AsyncTrafficSummaryReport(AsyncSingleQueryReport):
+    report_class = TrafficSummaryReport
+
+
+class AsyncTrafficOverallTimeSeriesReport(AsyncSingleQueryReport):
+    report_class = TrafficOverallTimeSeriesReport
+
+
+class AsyncTrafficTimeSeriesReport(AsyncSingleQueryReport):
+    report_class = TrafficTimeSeriesReport
+
+
+class AsyncTrafficFlowListReport(AsyncSingleQueryReport):
+    report_class = TrafficFlowListReport
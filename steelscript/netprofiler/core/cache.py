@@ -0,0 +1,399 @@
+# Copyright (c) 2019 Riverbed Technology, Inc.
+#
+# This software is licensed under the terms and conditions of the MIT License
+# accompanying the software ("License").  This software is distributed "AS IS"
+# as set forth in the License.
+
+"""
+Caching of report results across runs.
+
+Two caches are provided, both enabled by attaching them to a NetProfiler
+object.
+
+A :class:`ReportCache` is attached to a NetProfiler object to enable it::
+
+    >>> netprofiler.report_cache = ReportCache()
+
+Reports run through that NetProfiler are then looked up by the criteria
+they post.  When identical criteria were run before, the report is
+restored from the cache: no report is created on the appliance, its
+status is not polled and the data already downloaded is not requested
+again.
+
+Entries are kept in an in-memory LRU and pickled to disk under
+``~/.steelscript/NetProfiler/reports``.  Entries expire after `ttl`
+seconds, except for reports over time windows ending more than `settle`
+seconds ago: NetProfiler will not return different data for them, so
+they are kept until evicted to stay within the size budget.
+
+A :class:`TimeSeriesCache` holds the rows of time series reports by time
+bucket::
+
+    >>> netprofiler.timeseries_cache = TimeSeriesCache()
+
+Time series reports with an explicit resolution then only run reports
+for the parts of their time frame not already cached, so a dashboard
+refreshing "last 1 hour" every minute only fetches the latest minutes.
+"""
+
+import os
+import time
+import json
+import pickle
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from steelscript.common._fs import SteelScriptDir
+
+__all__ = ['ReportCache', 'TimeSeriesCache']
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+
+
+class ReportCache(object):
+    """Two level, in-memory and on-disk, cache of report results."""
+
+    def __init__(self, ttl=300, max_entries=128, max_bytes=256 * 2 ** 20,
+                 settle=600, directory=None, disk=True):
+        """Create a report cache.
+
+        :param ttl: seconds an entry for a recent time window stays valid
+
+        :param int max_entries: number of entries kept in memory
+
+        :param int max_bytes: size budget of the on-disk store
+
+        :param settle: seconds after which the data of a time window is
+            considered final, reports ending before ``now - settle`` are
+            cached with no expiration
+
+        :param directory: base directory of the on-disk store, defaults to
+            the user's steelscript directory
+
+        :param bool disk: if False, only keep entries in memory
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.settle = settle
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if disk:
+            self._dir = SteelScriptDir('NetProfiler', 'reports',
+                                       directory=directory)
+        else:
+            self._dir = None
+        # size of the on-disk store, counted on the first write
+        self._disk_bytes = None
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(profiler, to_post):
+        """Return the cache key of the report `to_post` against `profiler`.
+
+        The key is a digest of the canonical JSON form of the posted
+        criteria together with the appliance and its software version.
+        """
+        ident = {'host': getattr(profiler, 'host', None),
+                 'version': getattr(profiler, 'version', None),
+                 'report': to_post}
+        canonical = json.dumps(ident, sort_keys=True, separators=(',', ':'),
+                               default=str)
+        return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+    def new_entry(self, to_post, report_id, queries):
+        """Return a new entry for the completed report `report_id`.
+
+        Expiration is decided from the time frame in `to_post`.
+        """
+        end = to_post.get('criteria', {}).get('time_frame', {}).get('end')
+        now = time.time()
+        if end is not None and end <= now - self.settle:
+            expires = None
+        else:
+            expires = now + self.ttl
+
+        return {'to_post': to_post,
+                'id': report_id,
+                'queries': queries,
+                'data': dict(),
+                'expires': expires}
+
+    def _filename(self, key):
+        return key + '.pcl'
+
+    def get(self, key):
+        """Return the entry for `key`, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        if entry is None and self._dir is not None:
+            entry = self._read(key)
+            if entry is not None:
+                with self._lock:
+                    self._remember(key, entry)
+
+        if entry is not None and self._expired(entry):
+            self.invalidate(key)
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        """Store or update `entry` for `key`."""
+        with self._lock:
+            self._remember(key, entry)
+            if self._dir is not None:
+                self._write(key, entry)
+
+    def invalidate(self, key):
+        """Drop the entry for `key`."""
+        with self._lock:
+            self._entries.pop(key, None)
+            if self._dir is not None:
+                path = os.path.join(self._dir.basedir, self._filename(key))
+                size = self._size(path)
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                else:
+                    if self._disk_bytes is not None:
+                        self._disk_bytes -= size
+
+    def clear(self):
+        """Drop all entries, in memory and on disk."""
+        with self._lock:
+            self._entries.clear()
+            if self._dir is not None:
+                for name in self._dir.get_files():
+                    # including temporary files left by a crash
+                    if name.endswith('.pcl') or '.pcl.tmp' in name:
+                        os.remove(os.path.join(self._dir.basedir, name))
+                self._disk_bytes = 0
+
+    def _expired(self, entry):
+        return (entry['expires'] is not None and
+                entry['expires'] <= time.time())
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _read(self, key):
+        if not self._dir.isfile(self._filename(key)):
+            return None
+        try:
+            f = self._dir.get_data(self._filename(key))
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            logger.warning('Discarding unreadable report cache file %s: %s'
+                           % (self._filename(key), e))
+            f = None
+        if f is None or f.version != CACHE_VERSION:
+            self.invalidate(key)
+            return None
+
+        # the modification time orders files for eviction
+        os.utime(f.fullpath, None)
+        return f.data
+
+    @staticmethod
+    def _size(path):
+        try:
+            return os.stat(path).st_size
+        except OSError:
+            return 0
+
+    def _write(self, key, entry):
+        # same layout as SteelScriptData, without reading the old file.
+        # Written to a temporary file first, so that readers, in this or
+        # another process, never see a partial entry.
+        path = os.path.join(self._dir.basedir, self._filename(key))
+        tmp = path + '.tmp%d.%d' % (os.getpid(), threading.get_ident())
+        with open(tmp, 'wb') as f:
+            pickle.dump({'CACHE_VERSION': CACHE_VERSION, 'data': entry}, f)
+        size = self._size(tmp)
+        old = self._size(path)
+        os.replace(tmp, path)
+
+        if self._disk_bytes is not None:
+            self._disk_bytes += size - old
+        if self._disk_bytes is None or self._disk_bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        """Remove the least recently used files above the size budget.
+
+        The directory is only listed on the first write and once the
+        running size exceeds the budget, which also accounts for files
+        written by other processes.
+        """
+        files = []
+        total = 0
+        for name in self._dir.get_files():
+            if not name.endswith('.pcl'):
+                continue
+            path = os.path.join(self._dir.basedir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+        files.sort()
+        while total > self.max_bytes and files:
+            _, size, path = files.pop(0)
+            logger.debug('Evicting report cache file %s' % path)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        self._disk_bytes = total
+
+
+class TimeSeriesCache(object):
+    """In-memory cache of time series rows, bucketed by resolution."""
+
+    def __init__(self, max_series=256, max_age=7 * 24 * 3600, settle=180):
+        """Create a time series cache.
+
+        :param int max_series: number of distinct series kept, the least
+            recently used are dropped first
+
+        :param max_age: seconds of history kept for each series
+
+        :param settle: seconds after which the data of a time bucket is
+            considered final, more recent buckets are fetched every time
+        """
+        self.max_series = max_series
+        self.max_age = max_age
+        self.settle = settle
+
+        self._series = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(profiler, criteria):
+        """Return the key of the series described by the dict `criteria`,
+        such as the traffic filter, columns, centricity and resolution.
+        """
+        ident = {'host': getattr(profiler, 'host', None),
+                 'version': getattr(profiler, 'version', None),
+                 'criteria': criteria}
+        return json.dumps(ident, sort_keys=True, separators=(',', ':'),
+                          default=str)
+
+    def _get(self, key):
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = {'legend': None,
+                                          'rows': dict(),
+                                          'covered': []}
+            while len(self._series) > self.max_series:
+                self._series.popitem(last=False)
+        self._series.move_to_end(key)
+        return series
+
+    def missing(self, key, start, end):
+        """Return the list of (start, end) ranges of [`start`, `end`)
+        not covered by the series `key`, in seconds since the epoch.
+        """
+        with self._lock:
+            covered = self._get(key)['covered']
+
+            gaps = []
+            t = start
+            for s, e in covered:
+                if e <= t:
+                    continue
+                if s >= end:
+                    break
+                if s > t:
+                    gaps.append((t, s))
+                t = max(t, e)
+            if t < end:
+                gaps.append((t, end))
+            return gaps
+
+    def update(self, key, start, end, legend, rows, time_index, step=1):
+        """Store `rows` fetched for [`start`, `end`) in series `key`.
+
+        :param legend: list of columns describing `rows`
+
+        :param int time_index: index of the time column in `rows`
+
+        :param int step: seconds of each time bucket of the series
+
+        Only the whole buckets of the range older than `settle` seconds
+        are marked as covered, rows for more recent buckets are kept but
+        fetched again next time.  Rows stored with a legend of other
+        columns are dropped.
+        """
+        now = time.time()
+        with self._lock:
+            series = self._get(key)
+            if series['legend'] is None:
+                series['legend'] = legend
+            elif ([c.key for c in legend] !=
+                  [c.key for c in series['legend']]):
+                series['legend'] = legend
+                series['rows'] = dict()
+                series['covered'] = []
+            data = series['rows']
+            for row in rows:
+                data[int(row[time_index])] = row
+
+            settled = min(end, int(now - self.settle) // step * step)
+            if settled > start:
+                covered = series['covered'] + [(start, settled)]
+                covered.sort()
+                merged = [covered[0]]
+                for s, e in covered[1:]:
+                    if s <= merged[-1][1]:
+                        merged[-1] = (merged[-1][0], max(merged[-1][1], e))
+                    else:
+                        merged.append((s, e))
+                series['covered'] = merged
+
+            self._prune(series, now - self.max_age)
+
+    def _prune(self, series, oldest):
+        data = series['rows']
+        for t in [t for t in data if t < oldest]:
+            del data[t]
+        series['covered'] = [(max(s, oldest), e)
+                             for s, e in series['covered'] if e > oldest]
+
+    def get(self, key, start, end):
+        """Return the legend and rows of series `key` within
+        [`start`, `end`), ordered by time.
+        """
+        with self._lock:
+            series = self._get(key)
+            data = series['rows']
+            times = sorted(t for t in data if start <= t < end)
+            return series['legend'], [data[t] for t in times]
+
+    def clear(self):
+        """Drop all series."""
+        with self._lock:
+            self._series.clear()
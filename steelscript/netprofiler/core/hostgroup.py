@@ -10,7 +10,18 @@ and their host groups and hosts.
 """
 
 from steelscript.common.exceptions import RvbdException, RvbdHTTPException
+from collections import OrderedDict, Counter
+from collections.abc import MutableSequence, Sequence
+import json
+import time
+import bisect
+import hashlib
 import logging
+import warnings
+import functools
+import ipaddress
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 # Examples:
 #
@@ -45,6 +56,651 @@ def clean_str_or_bytes(strings_or_bytes):
     return strings_or_bytes
 
 
+def _items(entries):
+    return ((entry['cidr'], entry['name']) for entry in entries)
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode('utf8')).hexdigest()
+
+
+def _body_size(data):
+    """Size in bytes of `data` sent as a JSON request body."""
+    if not isinstance(data, str):
+        data = json.dumps(data)
+    return len(data.encode('utf8'))
+
+
+class _Node(object):
+    # Link of the HostGroupConfig list holding one config item
+    __slots__ = ('entry', 'prev', 'next')
+
+    def __init__(self, entry):
+        self.entry = entry
+        self.prev = self.next = self
+
+
+class HostGroupConfig(MutableSequence):
+    """Ordered list of the cidr/name config items of a host group type.
+
+    The order of the items across all host groups is their precedence
+    on NetProfiler.  Items are also indexed by host group name and by
+    CIDR, so that the operations of :class:`HostGroup` only cost the
+    number of items they touch rather than the size of the whole list.
+
+    It behaves as a list of the config dicts, which are serialized as
+    they are by :func:`HostGroupType.save`.  Changes by position, such as
+    ``config[3] = {...}`` or ``del config[3]``, take time proportional
+    to the length of the list.  The dicts are copied when added and when
+    read, so that the indexes always match them: an item is changed by
+    assigning it, ``config[3] = dict(config[3], cidr=...)``, not by
+    modifying it in place.
+
+    It is not a `list` subclass though: use ``list(config)`` where an
+    actual list is needed, such as to serialize it with
+    ``json.dumps``.  Adding a list, ``config + [...]``, returns a list.
+    """
+
+    def __init__(self, entries=()):
+        self._head = _Node(None)
+        # name -> OrderedDict of nodes in list order
+        self._names = dict()
+        # cidr -> OrderedDict of nodes
+        self._cidrs = dict()
+        self._size = 0
+        # list of the entries, built on demand
+        self._list = None
+        # incremented on every change
+        self.changes = 0
+        self._link(entries, self._head)
+
+    def _link(self, entries, before, prepend=False):
+        """Insert `entries` before the node `before`, adding them first
+        to the index of their host group if `prepend` is set, last
+        otherwise.
+        """
+        nodes = []
+        for entry in entries:
+            node = _Node(dict(entry))
+            node.prev = before.prev
+            node.next = before
+            before.prev.next = node
+            before.prev = node
+            nodes.append(node)
+
+        for node in (reversed(nodes) if prepend else nodes):
+            name = node.entry['name']
+            group = self._names.get(name)
+            if group is None:
+                group = self._names[name] = OrderedDict()
+            group[node] = None
+            if prepend:
+                group.move_to_end(node, last=False)
+            self._cidrs.setdefault(node.entry['cidr'],
+                                   OrderedDict())[node] = None
+
+        self._size += len(nodes)
+        self._list = None
+        self.changes += 1
+
+    def _unlink(self, node):
+        node.prev.next = node.next
+        node.next.prev = node.prev
+
+        name = node.entry['name']
+        del self._names[name][node]
+        if not self._names[name]:
+            del self._names[name]
+        cidr = node.entry['cidr']
+        del self._cidrs[cidr][node]
+        if not self._cidrs[cidr]:
+            del self._cidrs[cidr]
+
+        self._size -= 1
+        self._list = None
+        self.changes += 1
+
+    def _reset(self, entries):
+        self._head.prev = self._head.next = self._head
+        self._names.clear()
+        self._cidrs.clear()
+        self._size = 0
+        self._link(entries, self._head)
+
+    # Host group operations
+
+    def names(self):
+        """Return the names of the host groups with config items."""
+        return list(self._names)
+
+    def get_group(self, name):
+        """Return the config items of host group `name`, in order."""
+        return [dict(node.entry) for node in self._names.get(name, ())]
+
+    def find(self, cidr):
+        """Return the config items for `cidr`, in any host group."""
+        return [dict(node.entry) for node in self._cidrs.get(cidr, ())]
+
+    def add_group(self, name, cidrs, prepend=False, keep_together=True):
+        """Add an item for each of `cidrs` to host group `name`, see
+        :func:`HostGroup.add` for the placement options.
+        """
+        entries = [{'cidr': cidr, 'name': name} for cidr in cidrs]
+        group = self._names.get(name)
+        if keep_together and group:
+            if prepend:
+                before = next(iter(group))
+            else:
+                before = next(reversed(group)).next
+        elif prepend:
+            before = self._head.next
+        else:
+            before = self._head
+        self._link(entries, before, prepend)
+
+    def remove_group(self, name, cidrs=None):
+        """Remove the items of host group `name` for any of `cidrs`, or
+        all of its items if `cidrs` is None.
+        """
+        if cidrs is None:
+            nodes = list(self._names.get(name, ()))
+        else:
+            nodes = [node for cidr in set(cidrs)
+                     for node in list(self._cidrs.get(cidr, ()))
+                     if node.entry['name'] == name]
+        for node in nodes:
+            self._unlink(node)
+
+    # List interface
+
+    def _nodes(self):
+        node = self._head.next
+        while node is not self._head:
+            yield node
+            node = node.next
+
+    def _entries(self):
+        # the items themselves, not to be modified
+        for node in self._nodes():
+            yield node.entry
+
+    def __iter__(self):
+        for node in self._nodes():
+            yield dict(node.entry)
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, entry):
+        try:
+            nodes = self._cidrs.get(entry['cidr'], ())
+        except (TypeError, KeyError):
+            return False
+        return any(node.entry == entry for node in nodes)
+
+    def __getitem__(self, index):
+        if self._list is None:
+            self._list = list(self._entries())
+        if isinstance(index, slice):
+            return [dict(entry) for entry in self._list[index]]
+        return dict(self._list[index])
+
+    def __setitem__(self, index, value):
+        entries = list(self._entries())
+        entries[index] = value
+        self._reset(entries)
+
+    def __delitem__(self, index):
+        entries = list(self._entries())
+        del entries[index]
+        self._reset(entries)
+
+    def insert(self, index, entry):
+        if index >= self._size:
+            self.append(entry)
+        elif index <= -self._size or index == 0:
+            self._link([entry], self._head.next, prepend=True)
+        else:
+            entries = list(self._entries())
+            entries.insert(index, entry)
+            self._reset(entries)
+
+    def append(self, entry):
+        self._link([entry], self._head)
+
+    def extend(self, entries):
+        self._link(entries, self._head)
+
+    def clear(self):
+        self._reset(())
+
+    def sort(self, key=None, reverse=False):
+        """Sort the items in place, as `list.sort`."""
+        self._reset(sorted(self._entries(), key=key, reverse=reverse))
+
+    def __add__(self, other):
+        if isinstance(other, Sequence) and not isinstance(other, str):
+            return list(self) + list(other)
+        return NotImplemented
+
+    def __radd__(self, other):
+        if isinstance(other, Sequence) and not isinstance(other, str):
+            return list(other) + list(self)
+        return NotImplemented
+
+    def __eq__(self, other):
+        if isinstance(other, Sequence) and not isinstance(other, str):
+            return (len(self) == len(other) and
+                    list(self._entries()) == list(other))
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __reduce__(self):
+        # the linked nodes are too deep to pickle recursively
+        return (self.__class__, (list(self._entries()),))
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, list(self._entries()))
+
+
+def _parse_cidr(cidr):
+    """Return the IP version and the first and last address, as integers,
+    of `cidr`.  Abbreviated IPv4 networks such as '10.99/16' are
+    accepted, as are addresses without a prefix length.
+    """
+    address, _, prefix = cidr.strip().partition('/')
+    if ':' in address:
+        network = ipaddress.IPv6Network('%s/%s' % (address, prefix or 128),
+                                        strict=False)
+        return (6, int(network.network_address),
+                int(network.broadcast_address))
+
+    # parsed directly, ipaddress being slow for large configs
+    octets = address.split('.')
+    if (len(octets) > 4 or
+            not all(o.isdigit() and int(o) < 256 for o in octets)):
+        raise ValueError('Invalid IPv4 address %r' % address)
+    length = int(prefix) if prefix else 8 * len(octets)
+    if not 0 <= length <= 32:
+        raise ValueError('Invalid prefix length %r' % prefix)
+
+    value = 0
+    for octet in octets:
+        value = value << 8 | int(octet)
+    value <<= 8 * (4 - len(octets))
+    size = 1 << (32 - length)
+    first = value - value % size
+    return 4, first, first + size - 1
+
+
+def _segments(ranges, last_address):
+    """Split the address space into segments each matched first by one
+    config item.
+
+    `ranges` is a list of (first, last, group) in order of precedence,
+    where group is the index of the host group name.  As CIDRs are either
+    nested or disjoint, a single sweep over the ranges sorted by first
+    address finds the item of highest precedence covering each segment.
+
+    Returns the sorted list of segment start addresses and the list of
+    the group of each segment, -1 where no item matches.
+    """
+    starts = [0]
+    groups = [-1]
+
+    def emit(start, group):
+        if groups[-1] != group:
+            if starts[-1] == start:
+                groups[-1] = group
+            else:
+                starts.append(start)
+                groups.append(group)
+
+    order = sorted(range(len(ranges)),
+                   key=lambda i: (ranges[i][0], -ranges[i][1], i))
+    # enclosing ranges, as (last, precedence, group) of the item of
+    # highest precedence covering the range and its parents
+    stack = []
+    pos = 0
+    for i in order:
+        first, last, group = ranges[i]
+        while stack and stack[-1][0] < first:
+            top_last, _, top_group = stack.pop()
+            if pos <= top_last:
+                emit(pos, top_group)
+                pos = top_last + 1
+        if pos < first:
+            emit(pos, stack[-1][2] if stack else -1)
+            pos = first
+        if stack and stack[-1][1] < i:
+            stack.append((last,) + stack[-1][1:])
+        else:
+            stack.append((last, i, group))
+
+    while stack:
+        top_last, _, top_group = stack.pop()
+        if pos <= top_last:
+            emit(pos, top_group)
+            pos = top_last + 1
+    if pos <= last_address:
+        emit(pos, -1)
+    return starts, groups
+
+
+class HostGroupLookup(object):
+    """Local lookup of the host group of IP addresses.
+
+    Built from the config items of a host group type, an address belongs
+    to the group of the first item in the config whose CIDR contains it,
+    as on NetProfiler::
+
+        >>> byloc = HostGroupType.find_by_name(netprofiler, 'ByLocation')
+        >>> lookup = byloc.lookup()
+        >>> lookup['10.99.1.12']
+        'sanfran'
+        >>> lookup.classify(report.get_data()...)
+
+    The config is compiled into sorted arrays of address ranges, so that
+    each address costs a binary search.  :meth:`classify` looks up many
+    IPv4 addresses at once with numpy.
+    """
+
+    def __init__(self, config):
+        """Compile `config`, a list of cidr/name config items.  Items
+        with an invalid CIDR are logged and ignored.
+        """
+        # host group names, in order of first item
+        self.names = []
+        index = dict()
+        ranges = {4: [], 6: []}
+        for entry in config:
+            try:
+                version, first, last = _parse_cidr(entry['cidr'])
+            except ValueError as e:
+                logger.warning('Ignoring invalid CIDR %r of host group %s: '
+                               '%s' % (entry['cidr'], entry['name'], e))
+                continue
+            group = index.get(entry['name'])
+            if group is None:
+                group = index[entry['name']] = len(self.names)
+                self.names.append(entry['name'])
+            ranges[version].append((first, last, group))
+
+        self._starts = dict()
+        self._groups = dict()
+        for version, last_address in ((4, 2 ** 32 - 1), (6, 2 ** 128 - 1)):
+            starts, groups = _segments(ranges[version], last_address)
+            self._starts[version] = starts
+            self._groups[version] = groups
+        self._arrays = None
+
+    def __len__(self):
+        """Number of address ranges with a distinct host group."""
+        return sum(len(starts) for starts in self._starts.values())
+
+    def index(self, ip):
+        """Return the position in `names` of the host group of `ip`, or -1
+        if it is in none.  `ip` may be a string, an integer IPv4 address or
+        an :mod:`ipaddress` address.
+        """
+        if not isinstance(ip, (ipaddress.IPv4Address, ipaddress.IPv6Address)):
+            ip = ipaddress.ip_address(ip)
+        starts = self._starts[ip.version]
+        return self._groups[ip.version][
+            bisect.bisect_right(starts, int(ip)) - 1]
+
+    def get(self, ip, default=None):
+        """Return the name of the host group of `ip`, or `default`."""
+        group = self.index(ip)
+        return default if group < 0 else self.names[group]
+
+    def __getitem__(self, ip):
+        group = self.index(ip)
+        if group < 0:
+            raise KeyError(ip)
+        return self.names[group]
+
+    def classify_indexes(self, ips):
+        """Return a numpy int array of the position in `names` of the host
+        group of each of `ips`, -1 for addresses in no group.
+
+        `ips` is a sequence or numpy array of address strings, or a numpy
+        integer array of IPv4 addresses.  Dotted IPv4 strings are parsed
+        in bulk, other addresses one at a time.  Raises ValueError if any
+        is not a valid address.
+        """
+        import numpy
+
+        if self._arrays is None:
+            self._arrays = (numpy.array(self._starts[4], dtype=numpy.int64),
+                            numpy.array(self._groups[4], dtype=numpy.int32))
+        starts, groups = self._arrays
+
+        if isinstance(ips, numpy.ndarray) and ips.dtype.kind in 'iu':
+            values = ips.astype(numpy.int64)
+        else:
+            values = _parse_ipv4(numpy, ips)
+            if values is None:
+                return numpy.array([self.index(ip) for ip in ips],
+                                   dtype=numpy.int32)
+        return groups[numpy.searchsorted(starts, values, side='right') - 1]
+
+    def classify(self, ips):
+        """Return a numpy object array of the host group name of each of
+        `ips`, None for addresses in no group, see
+        :meth:`classify_indexes`.
+        """
+        import numpy
+
+        # the last element is selected by -1
+        names = numpy.array(self.names + [None], dtype=object)
+        return names[self.classify_indexes(ips)]
+
+
+def _parse_ipv4(numpy, ips):
+    """Return a numpy int64 array of the dotted IPv4 strings `ips`, or None
+    if any is not one.
+    """
+    if not len(ips):
+        return numpy.zeros(0, dtype=numpy.int64)
+    if isinstance(ips, numpy.ndarray):
+        ips = ips.tolist()
+    try:
+        # 256 between addresses, never a valid octet, shows any address
+        # without exactly 4 octets by shifting the others
+        text = '.256.'.join(ips)
+    except TypeError:
+        return None
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        try:
+            values = numpy.fromstring(text, dtype=numpy.int64, sep='.')
+        except (ValueError, DeprecationWarning):
+            return None
+    if len(values) != 5 * len(ips) - 1:
+        return None
+    values = numpy.append(values, 256).reshape(-1, 5)
+    octets = values[:, :4]
+    if ((values[:, 4] != 256).any() or (octets > 255).any() or
+            (octets < 0).any()):
+        return None
+    return ((octets[:, 0] << 24) | (octets[:, 1] << 16) |
+            (octets[:, 2] << 8) | octets[:, 3])
+
+
+class HostGroupTypeDirectory(object):
+    """Cache of the host group types of one NetProfiler appliance.
+
+    Holds the list of host group types, indexed by name, and the settings
+    and config of the types loaded, each for `ttl` seconds.
+    :class:`HostGroupType` invalidates the types it saves or deletes, and
+    only reads cached settings and config when asked to with
+    ``refresh=False``, for read-only lookups: a type saved from a stale
+    copy would overwrite the changes made since.  Use
+    :func:`get_directory` to get the directory of an appliance.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # (expires, list of type info dicts, name -> id)
+        self._types = None
+        # type id -> (expires, info, list of config items)
+        self._configs = dict()
+
+    def get_all(self, netprofiler):
+        """Return the info dicts of all host group types."""
+        return list(self._get_types(netprofiler)[0])
+
+    def find_id(self, netprofiler, name):
+        """Return the id of the host group type `name`, or None.
+
+        A name missing from the cached list is looked up again on the
+        appliance, in case the type was created since.
+        """
+        type_id = self._get_types(netprofiler)[1].get(name)
+        if type_id is None:
+            with self._lock:
+                self._types = None
+            type_id = self._get_types(netprofiler)[1].get(name)
+        return type_id
+
+    def _get_types(self, netprofiler):
+        with self._lock:
+            cached = self._types
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1:]
+
+        return self._store_types(netprofiler.api.host_group_types.get_all())
+
+    def _store_types(self, types):
+        names = dict()
+        for info in types:
+            # the first type of a name is used, as by a linear search
+            names.setdefault(info['name'], info['id'])
+        with self._lock:
+            self._types = (time.monotonic() + self.ttl, types, names)
+        return types, names
+
+    def get(self, netprofiler, type_id):
+        """Return the info dict and the list of config items of the host
+        group type `type_id`.  The config items are copies, which may be
+        modified.
+        """
+        with self._lock:
+            cached = self._configs.get(type_id)
+        if cached is None or cached[0] <= time.monotonic():
+            api = netprofiler.api.host_group_types
+            info = api.get(type_id)
+            try:
+                config = api.get_config(type_id)
+            except RvbdHTTPException as e:
+                # When you call get_config a RESOURCE_NOT_FOUND error is
+                # raised if the config of that type is empty, even if the
+                # host group type exists.
+                if e.error_id != 'RESOURCE_NOT_FOUND':
+                    raise
+                logger.debug('RESOURCE_NOT_FOUND exception raised because '
+                             'the config is empty. It was excepted because '
+                             'we still want the HostGroupType.')
+                config = []
+            cached = (time.monotonic() + self.ttl, info, config)
+            with self._lock:
+                self._configs[type_id] = cached
+
+        _, info, config = cached
+        return info, [dict(entry) for entry in config]
+
+    def invalidate(self, type_id=None):
+        """Drop the cached list of types and the settings and config of
+        type `type_id`, or of all types if None.
+        """
+        with self._lock:
+            self._types = None
+            if type_id is None:
+                self._configs.clear()
+            else:
+                self._configs.pop(type_id, None)
+
+
+_directories = dict()
+_directories_lock = threading.Lock()
+
+
+def get_directory(netprofiler):
+    """Return the :class:`HostGroupTypeDirectory` shared by all
+    NetProfiler objects connected to the host of `netprofiler`.
+    """
+    with _directories_lock:
+        directory = _directories.get(netprofiler.host)
+        if directory is None:
+            directory = _directories[netprofiler.host] = \
+                HostGroupTypeDirectory()
+        return directory
+
+
+class _BulkLoader(object):
+    """Run API calls on a thread pool, the result of each being passed
+    to a callback which may queue more calls.
+
+    Callbacks all run in the thread calling :meth:`run`, so they need no
+    locking.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        # future -> callback
+        self.pending = dict()
+
+    def submit(self, callback, func, *args, **kwargs):
+        future = self.pool.submit(functools.partial(func, *args, **kwargs))
+        self.pending[future] = callback
+
+    def page(self, callback, func, args, page_size, offset=0, items=None):
+        """Walk the paginated list returned by `func` called with `args`,
+        `page_size` items at a time, then call `callback` with all items.
+
+        The list ends with an empty page, as NetProfiler may return fewer
+        items than requested before the end.  If it returns the first
+        items again, ignoring `offset`, the list is requested whole.
+        """
+        items = [] if items is None else items
+
+        def done(page):
+            if not page:
+                callback(items)
+            elif items and page[0] == items[0]:
+                logger.warning('%s ignored the offset of its pages, '
+                               'requesting all items at once'
+                               % func.__name__)
+                self.submit(callback, func, *args)
+            else:
+                items.extend(page)
+                self.page(callback, func, args, page_size,
+                          offset + len(page), items)
+
+        self.submit(done, func, *args, offset=offset, limit=page_size)
+
+    def run(self):
+        """Wait for all calls, including those queued by callbacks."""
+        while self.pending:
+            done, _ = wait(list(self.pending), return_when=FIRST_COMPLETED)
+            for future in done:
+                callback = self.pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception:
+                    for other in self.pending:
+                        other.cancel()
+                    raise
+                callback(result)
+
+
 class HostGroupType(object):
     """ Convenience class to allow easy access to host group types.
 
@@ -80,6 +736,12 @@ class HostGroupType(object):
 
     """
 
+    # number of concurrent requests used by load_all
+    LOAD_WORKERS = 8
+
+    # number of items requested at once from paginated lists
+    PAGE_SIZE = 500
+
     def __init__(self, netprofiler, id):
         """
         :class:`HostGroupType` should not be instantiated directly,
@@ -101,12 +763,138 @@ class HostGroupType(object):
         # Dictionary of HostGroup entries by name
         self.groups = {}
 
+        # HostGroupLookup compiled from config and the config state it
+        # was compiled from
+        self._lookup = None
+        self._lookup_config = None
+        self._lookup_changes = None
+
+        # State as last loaded from or saved to NetProfiler, see _synced
+        self._saved = None
+
+        # Description of the last call to save
+        self.last_save = None
+
+    @property
+    def config(self):
+        """The cidr/name config items of all host groups, in order of
+        precedence, as a :class:`HostGroupConfig`.  May be assigned any
+        list of config items.
+
+        This used to be a plain `list`: use ``list(config)`` to get one,
+        for instance to serialize it with ``json.dumps``.  Its items are
+        copies, changed by assigning them rather than in place.
+        """
+        return self._config
+
+    @config.setter
+    def config(self, entries):
+        self._config = HostGroupConfig(entries)
+
+    def lookup(self):
+        """Return a :class:`HostGroupLookup` of the host group of IP
+        addresses according to the current config.
+        """
+        config = self._config
+        if (self._lookup is None or self._lookup_config is not config or
+                self._lookup_changes != config.changes):
+            self._lookup = HostGroupLookup(config._entries())
+            self._lookup_config = config
+            self._lookup_changes = config.changes
+        return self._lookup
+
+    @classmethod
+    def get_all(cls, netprofiler):
+        """Return the info dicts of all host group types, with their
+        `id` and `name`, from the :class:`HostGroupTypeDirectory` of the
+        appliance.
+        """
+        return get_directory(netprofiler).get_all(netprofiler)
+
     @classmethod
-    def find_by_name(cls, netprofiler, name):
-        """Find and load a host group type by name."""
+    def load_all(cls, netprofiler, members=True, workers=None,
+                 page_size=None):
+        """Load all host group types with their groups and members.
+
+        :param bool members: if True, also retrieve the hosts of each
+            host group
+
+        :param int workers: number of concurrent requests, defaults to
+            `LOAD_WORKERS`
+
+        :param int page_size: number of items requested at once from
+            the paginated lists of types, groups and members, defaults
+            to `PAGE_SIZE`
+
+        Returns an OrderedDict of name to loaded :class:`HostGroupType`,
+        in the order listed by NetProfiler.  The `info` attribute of each
+        :class:`HostGroup` is the dict describing it returned by
+        NetProfiler, and `members` the list of its hosts.  The settings
+        and config of all types are also stored in the
+        :class:`HostGroupTypeDirectory` of the appliance.
+        """
+        api = netprofiler.api.host_group_types
+        directory = get_directory(netprofiler)
+        directory.invalidate()
+        page_size = page_size or cls.PAGE_SIZE
+        types = OrderedDict()
+
+        def group(host_group_type, name):
+            host_group = host_group_type.groups.get(name)
+            if host_group is None:
+                host_group = HostGroup(host_group_type, name)
+            return host_group
+
+        def got_members(host_group, items):
+            host_group.members = items
+
+        def got_groups(host_group_type, infos):
+            for info in infos:
+                host_group = group(host_group_type, info['name'])
+                host_group.info = info
+                if members:
+                    loader.page(functools.partial(got_members, host_group),
+                                api.get_group_members,
+                                (host_group_type.id, info['id']), page_size)
+
+        def got_config(host_group_type, result):
+            info, config = result
+            host_group_type._loaded(info, config)
+            for name in host_group_type.config.names():
+                group(host_group_type, name)
+
+        def got_types(infos):
+            directory._store_types(infos)
+            for info in infos:
+                host_group_type = cls(netprofiler, info['id'])
+                types.setdefault(info['name'], host_group_type)
+                loader.submit(functools.partial(got_config, host_group_type),
+                              directory.get, netprofiler, info['id'])
+                loader.page(functools.partial(got_groups, host_group_type),
+                            api.get_all_groups, (info['id'],), page_size)
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=workers or
+                                cls.LOAD_WORKERS) as pool:
+            loader = _BulkLoader(pool)
+            loader.page(got_types, api.get_all, (), page_size)
+            loader.run()
+
+        logger.info('Loaded %d host group types with %d groups in %.1fs'
+                    % (len(types),
+                       sum(len(t.groups) for t in types.values()),
+                       time.monotonic() - start))
+        return types
+
+    @classmethod
+    def find_by_name(cls, netprofiler, name, refresh=True):
+        """Find and load a host group type by name.
+
+        See :meth:`load` for `refresh`.
+        """
         type_id = HostGroupType._find_id(netprofiler, name)
         host_group_type = HostGroupType(netprofiler, type_id)
-        host_group_type.load()
+        host_group_type.load(refresh)
         return host_group_type
 
     @classmethod
@@ -129,60 +917,144 @@ class HostGroupType(object):
         host_group_type.description = description
         return host_group_type
 
-    def load(self):
-        """Load settings and groups."""
+    def load(self, refresh=True):
+        """Load settings and groups.
+
+        :param bool refresh: if False, read them from the
+            :class:`HostGroupTypeDirectory` of the appliance when cached
+            there, which is only safe for types not saved afterwards.
+        """
         if self.id is None:
             raise RvbdException('Type: "{0}" has not yet been saved to the '
                                 'Netprofiler, so there is nothing to load. '
                                 'Call $host_group_type.save() first to save it.'
                                 .format(self.name))
-        info = self.netprofiler.api.host_group_types.get(self.id)
+        directory = get_directory(self.netprofiler)
+        if refresh:
+            directory.invalidate(self.id)
+        info, config = directory.get(self.netprofiler, self.id)
+        if not config:
+            self.groups = {}
+        self._loaded(info, config)
+
+    def _loaded(self, info, config):
+        """Set the settings and config to `info` and `config`, as
+        retrieved from NetProfiler.
+        """
         self.name = info['name']
         self.favorite = info['favorite']
         self.description = info['description']
+        self.config = config
 
-        try:
-            self.config = self.netprofiler.api.host_group_types.get_config(self.id)
-        except RvbdHTTPException as e:
-            # When you call get_config a RESOURCE_NOT_FOUND error is raised if
-            # the config of that type is empty, even if the host group type
-            # exists. Because of this we except that error and move on with load
-            if e.error_id == 'RESOURCE_NOT_FOUND':
-                logger.debug('RESOURCE_NOT_FOUND exception raised because the '
-                             'config is empty. It was excepted because we '
-                             'still want the HostGroupType.')
-                self.config = []
-                self.groups = {}
-            else:
-                raise e
+        self._synced(list(self.config))
 
         # Get the groups, we will need to reformat the output to fit our dict.
-        for entry in self.config:
-            if entry['name'] not in self.groups:
-                # Note -- only need to create a HostGroup for the *first*
-                # entry found for a given name, as HostGroup doesn't actually
-                # store data, it reference back to this objects 'config'
-                # property
-                HostGroup(self, entry['name'])
-
-    def save(self):
+        for name in self.config.names():
+            if name not in self.groups:
+                # Note -- only need to create a HostGroup for each name
+                # found, as HostGroup doesn't actually store data, it
+                # reference back to this objects 'config' property
+                HostGroup(self, name)
+
+    def save(self, force=False):
         """Save settings and groups.
 
-        If this is a new host group type, it will be created.
+        If this is a new host group type, it will be created.  Otherwise
+        only what changed since it was last loaded or saved is sent:
+        nothing if the settings and config are unchanged, only the config
+        if the settings are.
+
+        :param bool force: if True, send the settings and config even if
+            unchanged
+
+        Returns a dict describing the save, also kept as `last_save`:
+        `action`, one of 'create', 'set', 'set_config' or None if nothing
+        was sent, `added` and `removed`, the number of config items added
+        and removed, `bytes_sent`, the size of the request body, and
+        `bytes_saved`, the size of a full update less `bytes_sent`.
         """
+        api = self.netprofiler.api.host_group_types
+        settings = (self.name, self.description, self.favorite)
+        saved = self._saved
+
+        entries = list(self.config)
+        if (not force and saved is not None and
+                saved['settings'] == settings and
+                entries == saved['entries']):
+            # nothing changed, as known without serializing the config
+            return self._saved_as(None, Counter(), Counter(), 0,
+                                  saved['size'])
+
+        text = json.dumps(entries, sort_keys=True)
+        full_size = _body_size(self._full_body(None)) - 4 + _body_size(text)
+        if saved is None:
+            added, removed = Counter(_items(entries)), Counter()
+        else:
+            current = Counter(_items(entries))
+            added = current - saved['items']
+            removed = saved['items'] - current
 
         # If this is a new HostGroupType, then create it
         if self.id is None:
-            type_info = self.netprofiler.api.host_group_types.create(
-                self.name, self.description, self.favorite, self.config)
+            type_info = api.create(self.name, self.description,
+                                   self.favorite, entries)
             self.id = type_info['id']
             logger.debug("New HostGroupType created with Name: {0} and ID: {1}"
                          .format(self.name, self.id))
-            return
-        # Otherwise just set the preexisting HostGroupType with the new info
-        self.netprofiler.api.host_group_types.set(self.id, self.name,
-                                                  self.description,
-                                                  self.favorite, self.config)
+            action = 'create'
+            sent = full_size
+        elif (force or saved is None or saved['settings'] != settings):
+            # Otherwise set the preexisting HostGroupType with the new info
+            api.set(self.id, self.name, self.description, self.favorite,
+                    entries)
+            action = 'set'
+            sent = full_size
+        elif saved['digest'] != _digest(text):
+            api.set_config(self.id, entries)
+            action = 'set_config'
+            sent = _body_size(text)
+        else:
+            # changes were undone
+            action = None
+            sent = 0
+
+        if action is not None:
+            get_directory(self.netprofiler).invalidate(self.id)
+        self._synced(entries, text, full_size)
+        return self._saved_as(action, added, removed, sent, full_size)
+
+    def _full_body(self, config):
+        return {'name': self.name, 'description': self.description,
+                'favorite': self.favorite, 'config': config}
+
+    def _synced(self, entries, text=None, full_size=None):
+        """Remember `entries`, the config items, and the settings as being
+        those on NetProfiler.
+        """
+        if text is None:
+            text = json.dumps(entries, sort_keys=True)
+        if full_size is None:
+            full_size = (_body_size(self._full_body(None)) - 4 +
+                         _body_size(text))
+        self._saved = {'settings': (self.name, self.description,
+                                    self.favorite),
+                       'entries': [dict(entry) for entry in entries],
+                       'digest': _digest(text),
+                       'items': Counter(_items(entries)),
+                       'size': full_size}
+
+    def _saved_as(self, action, added, removed, sent, full_size):
+        self.last_save = {'action': action,
+                          'added': sum(added.values()),
+                          'removed': sum(removed.values()),
+                          'bytes_sent': sent,
+                          'bytes_saved': full_size - sent}
+        logger.info('Saved host group type %s: %s, %d config items added, '
+                    '%d removed, %d bytes sent, %d bytes saved'
+                    % (self.name, action or 'unchanged',
+                       self.last_save['added'], self.last_save['removed'],
+                       sent, self.last_save['bytes_saved']))
+        return self.last_save
 
     def delete(self):
         """Delete this host group type and all groups."""
@@ -192,7 +1064,9 @@ class HostGroupType(object):
                                 'Call $host_group_type.save() first to save it.'
                                 .format(self.name))
         self.netprofiler.api.host_group_types.delete(self.id)
+        get_directory(self.netprofiler).invalidate(self.id)
         self.id = None
+        self._saved = None
 
     def _add_host_group(self, new_host_group):
         """ Add a new host group to groups dictionary.
@@ -209,12 +1083,7 @@ class HostGroupType(object):
     @classmethod
     def _find_id(cls, netprofiler, name):
         # Get the ID of the host type specified by name
-        host_types = netprofiler.api.host_group_types.get_all()
-        target_type_id = None
-        for host_type in host_types:
-            if name == host_type['name']:
-                target_type_id = host_type['id']
-                break
+        target_type_id = get_directory(netprofiler).find_id(netprofiler, name)
         # If target_type_id is still None, then we didn't find that host
         if target_type_id is None:
             raise RvbdException('{0} is not a valid type name '
@@ -230,7 +1099,8 @@ class HostGroup(object):
     # across host group definitions because of precedence
     #
     # As such, all operations like add/remove/clear
-    # operate on hostgrouptype.config
+    # operate on hostgrouptype.config, which indexes the
+    # config items of each host group
 
     def __init__(self, hostgrouptype, name):
         """New object representing a host group by name.
@@ -247,6 +1117,9 @@ class HostGroup(object):
             raise RvbdException("This host group's name is not a string.")
         self.host_group_type = hostgrouptype
         self.name = name
+        # as retrieved by HostGroupType.load_all
+        self.info = None
+        self.members = None
         self.host_group_type._add_host_group(self)
 
     def add(self, cidrs, prepend=False, keep_together=True,
@@ -302,26 +1175,8 @@ class HostGroup(object):
         if replace:
             self.clear()
 
-        # Format the cidrs to be in the correct format for the config
-        old_config = self.host_group_type.config
-        new_config = []
-        for cidr in cidrs:
-            new_config.append({'cidr': cidr, 'name': self.name})
-
-        # Add the new_config in the correct location
-        if keep_together and len(old_config) > 0:
-            index = [i for i, j in enumerate(old_config)
-                     if j['name'] == self.name]
-            if len(index) != 0:
-                if prepend:
-                    self.host_group_type.config[index[0]:index[0]] = new_config
-                else:
-                    self.host_group_type.config[index[-1]+1:index[-1]+1] = new_config
-                return
-        if prepend:
-            self.host_group_type.config[0:0] = new_config
-        else:
-            self.host_group_type.config.extend(new_config)
+        self.host_group_type.config.add_group(self.name, cidrs, prepend,
+                                              keep_together)
 
     def remove(self, cidrs):
         """Remove a CIDR from this host group.
@@ -332,16 +1187,13 @@ class HostGroup(object):
         """
         cidrs = clean_str_or_bytes(cidrs)
 
-        self.host_group_type.config = list(filter(
-            lambda a: a['cidr'] not in cidrs or a['name'] != self.name,
-            self.host_group_type.config))
+        self.host_group_type.config.remove_group(self.name, cidrs)
 
     def clear(self):
         """Clear all definitions for this host group."""
-        self.host_group_type.config = list(filter(lambda a: a['name'] != self.name,
-                                                  self.host_group_type.config))
+        self.host_group_type.config.remove_group(self.name)
 
     def get(self):
         """Return a list of CIDRs assigned to this host group."""
-        return [i['cidr'] for i in self.host_group_type.config
-                if i['name'] == self.name]
+        return [i['cidr'] for i in
+                self.host_group_type.config.get_group(self.name)]
@@ -0,0 +1,298 @@
+# Copyright (c) 2019 Riverbed Technology, Inc.
+#
+# This software is licensed under the terms and conditions of the MIT License
+# accompanying the software ("License").  This software is distributed "AS IS"
+# as set forth in the License.
+
+"""
+Instrumentation of the requests and reports of a NetProfiler.
+
+Every NetProfiler object collects :class:`Metrics`, available as its
+`metrics` attribute:
+
+* each API request, by endpoint template such as
+  ``/api/profiler/1.0/reporting/reports/{id}/queries/{id}.json``,
+  method and HTTP status: the number of requests, bytes sent and
+  received and a latency histogram
+
+* each phase of the reports run through it: creating the report
+  (``post``), status polls (``poll``), time spent queued on the
+  appliance (``queued``), waiting for completion (``wait``),
+  downloading (``download``) and decoding (``decode``) the data
+
+The phases of a single report are also summed in the `timings` dict of
+the report.
+
+Metrics are read with :meth:`Metrics.as_dict`, exported in the Prometheus
+text format with :meth:`Metrics.to_prometheus`, or forwarded as they are
+recorded to sinks added with :meth:`Metrics.add_sink`::
+
+    >>> netprofiler.metrics.add_sink(lambda event: print(event))
+"""
+
+import bisect
+import logging
+import threading
+
+__all__ = ['Histogram', 'Metrics']
+
+logger = logging.getLogger(__name__)
+
+# upper bounds, in seconds, of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1, 2.5, 5, 10, 30, 60, 300)
+
+
+class Histogram(object):
+    """Distribution of observed values over fixed buckets."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # the last count is for values above the largest bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Return a list of (upper bound, number of values not above
+        it), ending with an infinite bound.
+        """
+        res = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),),
+                                self.counts):
+            total += count
+            res.append((bound, total))
+        return res
+
+    def as_dict(self):
+        return {'buckets': self.cumulative(),
+                'sum': self.sum,
+                'count': self.count}
+
+
+class Metrics(object):
+    """Request and report phase metrics of a NetProfiler."""
+
+    def __init__(self, labels=None, buckets=BUCKETS):
+        """Create an empty set of metrics.
+
+        :param dict labels: labels added to every exported metric, such as
+            the host of the NetProfiler
+
+        :param buckets: upper bounds of the histogram buckets, in seconds
+        """
+        self.labels = dict(labels or {})
+        self.buckets = buckets
+
+        self._lock = threading.Lock()
+        self._requests = dict()
+        self._phases = dict()
+        self._histograms = dict()
+        self._gauges = dict()
+        self._sinks = list()
+
+    def add_sink(self, sink):
+        """Call `sink` with a dict describing each recorded event.
+
+        Request events have `type` 'request', `endpoint`, `method`,
+        `status`, `seconds`, `bytes_in` and `bytes_out`.  Report phase
+        events have `type` 'phase', `phase`, `seconds` and `report`, the
+        id of the report.  Exceptions raised by `sink` are logged and
+        otherwise ignored.
+        """
+        with self._lock:
+            self._sinks.append(sink)
+
+    def remove_sink(self, sink):
+        with self._lock:
+            self._sinks.remove(sink)
+
+    def _emit(self, event):
+        for sink in list(self._sinks):
+            try:
+                sink(event)
+            except Exception:
+                logger.exception('Metrics sink %r failed' % sink)
+
+    def record_request(self, endpoint, method, status, seconds,
+                       bytes_in=0, bytes_out=0):
+        """Record an API request.
+
+        :param str endpoint: path of the request with identifiers
+            replaced by placeholders
+
+        :param status: HTTP status code, or None if no response was
+            received
+        """
+        key = (endpoint, method, status)
+        with self._lock:
+            stats = self._requests.get(key)
+            if stats is None:
+                stats = self._requests[key] = {
+                    'count': 0, 'bytes_in': 0, 'bytes_out': 0,
+                    'seconds': Histogram(self.buckets)}
+            stats['count'] += 1
+            stats['bytes_in'] += bytes_in
+            stats['bytes_out'] += bytes_out
+            stats['seconds'].observe(seconds)
+
+        if self._sinks:
+            self._emit({'type': 'request', 'endpoint': endpoint,
+                        'method': method, 'status': status,
+                        'seconds': seconds, 'bytes_in': bytes_in,
+                        'bytes_out': bytes_out})
+
+    def record_phase(self, phase, seconds, report=None):
+        """Record `seconds` spent in `phase` by the report with id
+        `report`.
+        """
+        with self._lock:
+            histogram = self._phases.get(phase)
+            if histogram is None:
+                histogram = self._phases[phase] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+        if self._sinks:
+            self._emit({'type': 'phase', 'phase': phase,
+                        'seconds': seconds, 'report': report})
+
+    def observe(self, name, seconds, **labels):
+        """Add `seconds` to the histogram `name` for `labels`."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def set_gauge(self, name, value, **labels):
+        """Set the gauge `name` for `labels` to `value`."""
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def clear(self):
+        """Drop all recorded values, sinks are kept."""
+        with self._lock:
+            self._requests.clear()
+            self._phases.clear()
+            self._histograms.clear()
+            self._gauges.clear()
+
+    def as_dict(self):
+        """Return the metrics as a dict with `requests`, a list of dicts
+        for each endpoint, method and status, `phases`, a dict of phase to
+        histogram, and `histograms` and `gauges`, dicts of name to a list
+        of (labels, value).
+        """
+        with self._lock:
+            requests = []
+            for (endpoint, method, status), stats in \
+                    sorted(self._requests.items(), key=_sort_key):
+                requests.append({'endpoint': endpoint,
+                                 'method': method,
+                                 'status': status,
+                                 'count': stats['count'],
+                                 'bytes_in': stats['bytes_in'],
+                                 'bytes_out': stats['bytes_out'],
+                                 'seconds': stats['seconds'].as_dict()})
+            phases = dict((phase, histogram.as_dict())
+                          for phase, histogram in self._phases.items())
+            histograms = dict()
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                histograms.setdefault(name, []).append(
+                    (dict(labels), histogram.as_dict()))
+            gauges = dict()
+            for (name, labels), value in sorted(self._gauges.items()):
+                gauges.setdefault(name, []).append((dict(labels), value))
+        return {'requests': requests, 'phases': phases,
+                'histograms': histograms, 'gauges': gauges}
+
+    def to_prometheus(self, prefix='netprofiler'):
+        """Return the metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            requests = sorted(self._requests.items(), key=_sort_key)
+            phases = sorted(self._phases.items())
+            histograms = sorted(self._histograms.items())
+            gauges = sorted(self._gauges.items())
+
+            name = prefix + '_request_seconds'
+            lines.append('# HELP %s Latency of API requests.' % name)
+            lines.append('# TYPE %s histogram' % name)
+            for (endpoint, method, status), stats in requests:
+                labels = self._labels(endpoint=endpoint, method=method,
+                                      status=status or 'error')
+                lines.extend(_histogram_lines(name, labels,
+                                              stats['seconds']))
+
+            for field, name, doc in (
+                    ('bytes_in', prefix + '_response_bytes_total',
+                     'Bytes received in API responses.'),
+                    ('bytes_out', prefix + '_request_bytes_total',
+                     'Bytes sent in API requests.')):
+                lines.append('# HELP %s %s' % (name, doc))
+                lines.append('# TYPE %s counter' % name)
+                for (endpoint, method, status), stats in requests:
+                    labels = self._labels(endpoint=endpoint, method=method,
+                                          status=status or 'error')
+                    lines.append('%s{%s} %d' % (name, labels, stats[field]))
+
+            name = prefix + '_report_phase_seconds'
+            lines.append('# HELP %s Time spent by reports in each phase.'
+                         % name)
+            lines.append('# TYPE %s histogram' % name)
+            for phase, histogram in phases:
+                lines.extend(_histogram_lines(name,
+                                              self._labels(phase=phase),
+                                              histogram))
+
+            last = None
+            for (name, labels), histogram in histograms:
+                name = '%s_%s' % (prefix, name)
+                if name != last:
+                    lines.append('# TYPE %s histogram' % name)
+                    last = name
+                lines.extend(_histogram_lines(name,
+                                              self._labels(**dict(labels)),
+                                              histogram))
+
+            last = None
+            for (name, labels), value in gauges:
+                name = '%s_%s' % (prefix, name)
+                if name != last:
+                    lines.append('# TYPE %s gauge' % name)
+                    last = name
+                lines.append('%s{%s} %r' % (name,
+                                            self._labels(**dict(labels)),
+                                            value))
+
+        return '\n'.join(lines) + '\n'
+
+    def _labels(self, **labels):
+        items = sorted(self.labels.items()) + list(labels.items())
+        return ','.join('%s="%s"' % (k, _escape(v)) for k, v in items)
+
+
+def _sort_key(item):
+    (endpoint, method, status), _ = item
+    return (endpoint, method, status or 0)
+
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\').replace('\n', '\\n')
+            .replace('"', '\\"'))
+
+
+def _histogram_lines(name, labels, histogram):
+    sep = ',' if labels else ''
+    for bound, count in histogram.cumulative():
+        le = '+Inf' if bound == float('inf') else repr(float(bound))
+        yield '%s_bucket{%s%sle="%s"} %d' % (name, labels, sep, le, count)
+    yield '%s_sum{%s} %r' % (name, labels, histogram.sum)
+    yield '%s_count{%s} %d' % (name, labels, histogram.count)
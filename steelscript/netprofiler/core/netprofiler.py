@@ -11,13 +11,21 @@ the state of the NetProfiler, modifying its settings and performing operations
 like creating running reports.
 """
 
+import time
+import weakref
 import logging
 import itertools
+from concurrent.futures import ThreadPoolExecutor
 
 from steelscript.common.datastructures import DictObject
 from steelscript.common.api_helpers import APIVersion
 from steelscript.netprofiler.core import _api1
 from steelscript.netprofiler.core import _constants
+from steelscript.netprofiler.core import _catalog
+from steelscript.netprofiler.core import _registry
+from steelscript.netprofiler.core import _pool
+from steelscript.netprofiler.core.scheduler import get_scheduler
+from steelscript.netprofiler.core.metrics import Metrics
 from steelscript.common._fs import SteelScriptDir
 from steelscript.netprofiler.core._types import (Column, AreaContainer,
                                                  ColumnContainer)
@@ -36,12 +44,70 @@ def make_hash(realm, centricity, groupby):
     return str(realm) + str(centricity) + str(groupby)
 
 
+class ColumnIndex(object):
+    """Inverted index of the column catalog.
+
+    Holds the keys of the columns of each cached realm, centricity and
+    groupby triplet, and the triplets of each realm, centricity and
+    groupby value, so that searches are answered by set operations.
+    """
+    def __init__(self, data, realms, centricities, groupbys):
+        self.columns = dict()       # triplet -> frozenset of column keys
+        self.by_key = dict()        # column key -> Column
+        self.triplets = {'realm': dict(),
+                         'centricity': dict(),
+                         'groupby': dict()}
+
+        for triplet in itertools.product(realms, centricities, groupbys):
+            columns = data.get(make_hash(*triplet))
+            if columns is None:
+                continue
+            for c in columns:
+                self.by_key.setdefault(c.key, c)
+            self.columns[triplet] = frozenset(c.key for c in columns)
+            for dim, value in zip(('realm', 'centricity', 'groupby'),
+                                  triplet):
+                self.triplets[dim].setdefault(value, set()).add(triplet)
+
+    def search(self, realms=None, centricities=None, groupbys=None):
+        """Return the set of keys of the columns valid for any triplet
+        matching the given values, None matching any value.
+        """
+        matches = None
+        for dim, values in (('realm', realms),
+                            ('centricity', centricities),
+                            ('groupby', groupbys)):
+            if values is None:
+                continue
+            index = self.triplets[dim]
+            found = set()
+            for v in values:
+                found.update(index.get(v, ()))
+            matches = found if matches is None else (matches & found)
+
+        if matches is None:
+            matches = self.columns
+
+        keys = set()
+        for triplet in matches:
+            keys.update(self.columns[triplet])
+        return keys
+
+
 class NetProfiler(steelscript.common.service.Service):
     """The NetProfiler class is the main interface to interact with a
     NetProfiler appliance.  Primarily this provides an interface to reporting.
+
+    A NetProfiler object may be used by several threads at once, each
+    running its own reports.
     """
 
-    def __init__(self, host, port=None, auth=None):
+    # number of concurrent requests used to retrieve column definitions
+    COLUMN_FETCH_WORKERS = 8
+
+    def __init__(self, host, port=None, auth=None, lazy=False,
+                 pool_size=10, pool_block=False, keepalive=True,
+                 scheduler=None):
         """Establishes a connection to a NetProfiler appliance.
 
         :param str host: name or IP address of the NetProfiler to
@@ -60,9 +126,53 @@ class NetProfiler(steelscript.common.service.Service):
             if unspecified, this will use the latest version supported by both
             this implementation and the NetProfiler appliance.
 
+        :param bool lazy: if True, do not verify the local column cache
+            against the appliance on connection.  Columns of each
+            realm, centricity and groupby are requested the first time
+            they are needed by :meth:`get_columns` or
+            :meth:`search_columns`, or when calling :meth:`prefetch_columns`.
+            Areas are likewise only requested when first used.
+
+        :param int pool_size: number of HTTP connections to the appliance
+            kept open and shared by all threads using this object
+
+        :param bool pool_block: if True, requests beyond `pool_size`
+            wait for a pooled connection.  By default they open a new
+            one, closed after use.
+
+        :param bool keepalive: if True, enable TCP keep-alive probes on
+            the pooled connections so idle ones stay usable
+
+        :param scheduler: :class:`ReportScheduler
+            <steelscript.netprofiler.core.scheduler.ReportScheduler>`
+            admitting the reports run through this object, bounding the
+            reports in progress on the appliance, or True for the one
+            shared with the other NetProfiler objects of the process
+            connected to the same `host`.  By default reports are not
+            subject to admission control.
+
+        Connections opened and the latency of API calls are counted in
+        `http_stats`, a :class:`ConnectionStats
+        <steelscript.netprofiler.core._pool.ConnectionStats>`.  Each API
+        request and report phase is recorded in `metrics`, a
+        :class:`Metrics <steelscript.netprofiler.core.metrics.Metrics>`.
+
+        Column definitions and areas are shared with the other NetProfiler
+        objects of the process connected to the same `host` running the
+        same software version, only the first one loads them.
+
         See the base :py:class:`Service<steelscript.common.service.Service>` class
         for more information about additional functionality supported.
         """
+        self.pool_size = pool_size
+        self.pool_block = pool_block
+        self.keepalive = keepalive
+        self.http_stats = _pool.ConnectionStats()
+        self.metrics = Metrics(labels={'host': host})
+        if scheduler is True:
+            scheduler = get_scheduler(host)
+        self.scheduler = scheduler
+
         super(NetProfiler, self).__init__("profiler", host, port,
                                           auth=auth,
                                           versions=[APIVersion("1.0")],override_services_api='/api/common/1.0/services')
@@ -75,6 +185,12 @@ class NetProfiler(steelscript.common.service.Service):
 
         self._info = None
 
+        # optional steelscript.netprofiler.core.cache.ReportCache and
+        # TimeSeriesCache holding the results of reports run through
+        # this object
+        self.report_cache = None
+        self.timeseries_cache = None
+
         # checking if the profiler supports 1.2
         # if yes, then use column dsc
         # otherwise, use column qos
@@ -85,11 +201,37 @@ class NetProfiler(steelscript.common.service.Service):
             _key, _value = ('qos', 'qos')
         self.groupbys[_key] = _value
 
-        self._load_file_caches()
-        self.columns = ColumnContainer(self._unique_columns())
-        self.colnames = set(c.key for c in self.columns)
+        self.lazy = lazy
+        # seconds taken to retrieve the columns of each triplet
+        self.column_timings = dict()
+        self._fs_data = SteelScriptDir('NetProfiler', 'data')
 
-        self.areas = AreaContainer(self._areas_dict.items())
+        self._metadata = _registry.registry.get(self.host, self.version)
+        self.api.report.share_cache(self._metadata.api_cache)
+
+        with self._metadata.lock:
+            self._metadata.profiler = weakref.ref(self)
+            if self._metadata.columns is None:
+                self._load_file_caches()
+                self._metadata.columns = ColumnContainer(
+                    self._unique_columns(),
+                    loader=self._metadata.load_columns)
+                self._metadata.colnames = set(
+                    c.key for c in self._metadata.columns)
+            elif not lazy:
+                self._verify_cache()
+
+            self.columns = self._metadata.columns
+            self.colnames = self._metadata.colnames
+
+            if not lazy and self._metadata.areas is None:
+                self._load_areas()
+
+    def connect(self):
+        super(NetProfiler, self).connect()
+        _pool.mount(self.conn.conn, self.http_stats,
+                    pool_size=self.pool_size, block=self.pool_block,
+                    keepalive=self.keepalive)
 
     def _load_file_caches(self):
         """Load and unroll locally cached files
@@ -97,109 +239,217 @@ class NetProfiler(steelscript.common.service.Service):
         We want to avoid making any calls for column data here
         and just load what has been stored locally for now
         """
-        self._fs_data = SteelScriptDir('NetProfiler', 'data')
-
-        columns_filename = 'columns-' + self.version + '.pcl'
-        self._columns_file = self._fs_data.get_data(columns_filename)
-        if (self._columns_file.data is None or
-                self._columns_file.version < _constants.CACHE_VERSION):
+        columns_filename = 'columns-' + self.version + '.json'
+        columns_file = _catalog.ColumnCatalogFile(self._fs_data.basedir,
+                                                  columns_filename)
+        if columns_file.data is None:
+            # convert the catalog pickled by earlier releases
+            legacy_filename = 'columns-' + self.version + '.pcl'
+            if self._fs_data.isfile(legacy_filename):
+                legacy = self._fs_data.get_data(legacy_filename)
+                if legacy.data:
+                    columns_file.data = legacy.data
+                    columns_file.version = legacy.version
+                    columns_file.write()
+
+        if (columns_file.data is None or
+                columns_file.version < _constants.CACHE_VERSION):
             # if CACHE_VERSION older than our config,
             # we must have an *old* version, and need to recreate cache
-            self._columns_file.data = dict()
+            columns_file.data = dict()
+        self._metadata.columns_file = columns_file
 
-        areas_filename = 'areas-' + self.version + '.json'
-        self._areas_file = self._fs_data.get_config(areas_filename)
-        if self._areas_file.data is None:
-            self._areas_file.data = self.api.report.areas()
-            self._areas_file.write()
+        if not self.lazy:
+            self._verify_cache()
 
-        self._verify_cache()
-        self._areas_dict = dict(self._genareas(self._areas_file.data))
+    def _load_areas(self):
+        """Load areas from the local cache, or from the appliance."""
+        metadata = self._metadata
+        with metadata.lock:
+            if metadata.areas is not None:
+                return
 
-    def _verify_cache(self, refetch=False):
-        """Retrieve all the possible combinations of
-        groupby, centricity and realm using the rule shown under
-        the search_columns method.
+            areas_filename = 'areas-' + self.version + '.json'
+            areas_file = self._fs_data.get_config(areas_filename)
+            if areas_file.data is None:
+                areas_file.data = self.api.report.areas()
+                areas_file.write()
 
-        By default, all these permutations will be checked against
-        the current local cache file, and any missing keys will be
-        retrieved from the server.
+            metadata.areas_file = areas_file
+            metadata.areas_dict = dict(self._genareas(areas_file.data))
+            metadata.areas = AreaContainer(metadata.areas_dict.items())
 
-        :param bool refetch: will force an api refresh call from the
-            machine even if the data can be found in local cache.
+    @property
+    def areas(self):
+        if self._metadata.areas is None:
+            self._load_areas()
+        return self._metadata.areas
+
+    def _triplets(self, realms=None, centricities=None, groupbys=None):
+        """Yield the valid (realm, centricity, groupby) triplets, following
+        the rule shown under the search_columns method, optionally
+        restricted to the given realms, centricities and groupbys.
         """
-        columns = list()
-        write = False
-        have_exception = False
         for realm in self.realms:
+            if realms is not None and realm not in realms:
+                continue
+
             if realm == 'traffic_flow_list' or realm == 'identity_list':
-                centricities = ['hos']
+                realm_centricities = ['hos']
             elif realm == 'msq':
-                centricities = ['hos']
+                realm_centricities = ['hos']
             else:
-                centricities = self.centricities
+                realm_centricities = self.centricities
+
+            for centricity in realm_centricities:
+                if centricities is not None and centricity not in centricities:
+                    continue
 
-            for centricity in centricities:
                 if realm == 'traffic_summary':
-                    groupbys = [x for x in self.groupbys.values() if
-                                x not in ['thu', 'slm']]
+                    realm_groupbys = [x for x in self.groupbys.values() if
+                                      x not in ['thu', 'slm']]
                 elif 'time_series' in realm:
-                    groupbys = ['tim']
+                    realm_groupbys = ['tim']
                 elif realm == 'identity_list':
-                    groupbys = ['thu']
+                    realm_groupbys = ['thu']
                 elif realm == 'msq':
-                    groupbys = ['slm']
+                    realm_groupbys = ['slm']
                 else:
-                    groupbys = ['hos']
-
-                for groupby in groupbys:
-                    _hash = make_hash(realm, centricity, groupby)
-                    if refetch or _hash not in self._columns_file.data:
-                        logger.debug('Requesting columns for triplet: '
-                                     '%s, %s, %s' % (realm,
-                                                     centricity,
-                                                     groupby))
-                        try:
-                            api_call = self.api.report.columns(realm,
-                                                               centricity,
-                                                               groupby)
-                        except RvbdHTTPException as e:
-                            logger.warning('Exception raised fetching columns'
-                                           'for triplet: {0}, {1}, {2} with '
-                                           'message {3}'.format(realm,
-                                                                centricity,
-                                                                groupby,
-                                                                e.message))
-                            have_exception = True
-                            continue
-
-                        # generate Column objects from json
-                        api_columns = self._gencolumns(api_call)
-                        # compare against objects we've already retrieved
-                        existing = [c for c in columns if c in api_columns]
-                        new_columns = [c for c in api_columns
-                                       if c not in existing]
-                        columns.extend(new_columns)
-
-                        # add them to data, preserving existing objects
-                        self._columns_file.data[_hash] = (existing +
-                                                          new_columns)
-                        write = True
+                    realm_groupbys = ['hos']
+
+                for groupby in realm_groupbys:
+                    if groupbys is None or groupby in groupbys:
+                        yield realm, centricity, groupby
+
+    def _verify_cache(self, refetch=False):
+        """Retrieve all the possible combinations of
+        groupby, centricity and realm using the rule shown under
+        the search_columns method.
+
+        By default, all these permutations will be checked against
+        the current local cache file, and any missing keys will be
+        retrieved from the server.
+
+        :param bool refetch: will force an api refresh call from the
+            machine even if the data can be found in local cache.
+        """
+        self._fetch_triplets(self._triplets(), refetch)
+        self._metadata.columns_complete = True
+
+        if not self._metadata.columns_file.data:
+            raise RvbdException("_verify_cache failed to collect both"
+                                "cached and live data. Please check"
+                                "NetProfiler health")
+
+    def _fetch_triplets(self, triplets, refetch=False):
+        """Retrieve the columns of `triplets` missing from the local cache.
+
+        Triplets are requested concurrently, by at most
+        `COLUMN_FETCH_WORKERS` threads, and the time each request took is
+        recorded in `column_timings`.  Return True if any columns were
+        retrieved.
+        """
+        with self._metadata.lock:
+            return self._fetch_missing(triplets, refetch)
+
+    def _fetch_missing(self, triplets, refetch):
+        metadata = self._metadata
+        data = metadata.columns_file.data
+        missing = [t for t in triplets
+                   if refetch or make_hash(*t) not in data]
+        if not missing:
+            return False
+
+        def fetch(triplet):
+            logger.debug('Requesting columns for triplet: '
+                         '%s, %s, %s' % triplet)
+            start = time.monotonic()
+            try:
+                return self.api.report.columns(*triplet, force=refetch)
+            finally:
+                self.column_timings[triplet] = time.monotonic() - start
+
+        start = time.monotonic()
+        workers = min(self.COLUMN_FETCH_WORKERS, len(missing))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [(t, pool.submit(fetch, t)) for t in missing]
+
+            # share one Column object per key across triplets, including
+            # those already cached
+            seen = dict()
+            if not refetch:
+                for lst in data.values():
+                    for c in lst:
+                        seen.setdefault(c.key, c)
+
+            columns = list()
+            write = False
+            have_exception = False
+            for triplet, future in futures:
+                try:
+                    api_call = future.result()
+                except RvbdHTTPException as e:
+                    logger.warning('Exception raised fetching columns'
+                                   'for triplet: {0}, {1}, {2} with '
+                                   'message {3}'.format(triplet[0],
+                                                        triplet[1],
+                                                        triplet[2],
+                                                        e.message))
+                    have_exception = True
+                    continue
+
+                logger.debug('Retrieved columns for triplet %s, %s, %s '
+                             'in %.3fs' % (triplet +
+                                           (self.column_timings[triplet],)))
+
+                # generate Column objects from json, preserving the
+                # objects we've already retrieved
+                triplet_columns = list()
+                for c in self._gencolumns(api_call):
+                    existing = seen.get(c.key)
+                    if existing is None:
+                        seen[c.key] = existing = c
+                        columns.append(c)
+                    triplet_columns.append(existing)
+
+                data[make_hash(*triplet)] = triplet_columns
+                write = True
+
+        logger.info('Retrieved columns for %d triplets in %.3fs'
+                    % (len(missing), time.monotonic() - start))
 
         if write:
-            self._columns_file.version = _constants.CACHE_VERSION
-            self._columns_file.write()
+            metadata.columns_file.version = _constants.CACHE_VERSION
+            metadata.columns_file.write()
+            metadata.column_index = None
+            metadata.groupby_keys = dict()
+            if metadata.columns is not None:
+                self._add_columns(columns)
         elif have_exception:
             logger.warning('_verify_cache: Some realm, centricity, '
                            'and groupby triplets failed.')
+        return write
 
-        if not self._columns_file.data:
-            raise RvbdException("_verify_cache failed to collect both"
-                                "cached and live data. Please check"
-                                "NetProfiler health")
+    def _add_columns(self, columns):
+        """Make newly retrieved `columns` available."""
+        metadata = self._metadata
+        new_columns = [c for c in columns if c.key not in metadata.colnames]
+        metadata.columns._update(new_columns)
+        metadata.colnames.update(c.key for c in new_columns)
+
+    def prefetch_columns(self, realms=None, centricities=None, groupbys=None):
+        """Retrieve the columns of the given realms, centricities and
+        groupbys, all of them by default, if not already cached.
+
+        Only useful for NetProfiler objects created with `lazy` set.
+        """
+        self._fetch_triplets(self._triplets(realms, centricities, groupbys))
+        if realms is None and centricities is None and groupbys is None:
+            # lookups of missing columns need not request anything
+            self._metadata.columns_complete = True
 
     def _unique_columns(self):
-        """Pull unique columns from _columns_file (a dict of lists). """
+        """Pull unique columns from the columns file (a dict of lists). """
         def unique(seq):
             seen = set()
             for lst in seq:
@@ -208,14 +458,16 @@ class NetProfiler(steelscript.common.service.Service):
                         continue
                     seen.add(c)
                     yield c
-        return list(unique(list(self._columns_file.data.values())))
+        return list(unique(list(self._metadata.columns_file.data.values())))
 
     def _parse_area(self, area):
+        if self._metadata.areas_dict is None:
+            self._load_areas()
         if isinstance(area, (str,)):
-            if area not in self._areas_dict:
+            if area not in self._metadata.areas_dict:
                 raise ValueError('{0} is not a valid area type for this'
                                  'netprofiler'.format(area))
-            return self._areas_dict[area]
+            return self._metadata.areas_dict[area]
 
     def _gencolumns(self, columns):
         """Return a list of Column objects from a list of json columns.
@@ -282,7 +534,7 @@ class NetProfiler(steelscript.common.service.Service):
         """
         res = list()
         if groupby:
-            groupby_cols = self.search_columns(groupbys=[groupby])
+            groupby_cols = self._get_groupby_keys(groupby)
         else:
             groupby_cols = None
 
@@ -308,6 +560,10 @@ class NetProfiler(steelscript.common.service.Service):
                 strid = column['strid']
                 cname = strid.lower()[3:]
 
+            if cname not in colnames and self.lazy and not groupby_cols:
+                # may belong to a triplet not retrieved yet, those of
+                # `groupby` are retrieved already
+                self._metadata.load_columns()
             if cname not in colnames:
                 raise RvbdException('{0} is not a valid column '
                                     'for this netprofiler'.format(column))
@@ -345,24 +601,33 @@ class NetProfiler(steelscript.common.service.Service):
         ============================= ============ ==================
 
         """
-        result = set()
-
-        if realms is None:
-            realms = self.realms
-        if centricities is None:
-            centricities = self.centricities
-        if groupbys is None:
-            groupbys = list(self.groupbys.values())
-
-        datakeys = list(self._columns_file.data.keys())
-        search_keys = [make_hash(*p) for p in itertools.product(realms,
-                                                                centricities,
-                                                                groupbys)]
-
-        keys = [k for k in datakeys if k in search_keys]
-        for key in keys:
-            result.update(x for x in self._columns_file.data[key])
-        return list(result)
+        if self.lazy:
+            self.prefetch_columns(realms, centricities, groupbys)
+
+        index = self._get_column_index()
+        keys = index.search(realms, centricities, groupbys)
+        return [index.by_key[k] for k in keys]
+
+    def _get_column_index(self):
+        """Return the ColumnIndex of the cached catalog."""
+        metadata = self._metadata
+        index = metadata.column_index
+        if index is None:
+            with metadata.lock:
+                index = metadata.column_index = ColumnIndex(
+                    metadata.columns_file.data, self.realms,
+                    self.centricities, list(self.groupbys.values()))
+        return index
+
+    def _get_groupby_keys(self, groupby):
+        """Return the set of keys of the columns valid for `groupby`."""
+        keys = self._metadata.groupby_keys.get(groupby)
+        if keys is None:
+            if self.lazy:
+                self.prefetch_columns(groupbys=[groupby])
+            keys = self._get_column_index().search(groupbys=[groupby])
+            self._metadata.groupby_keys[groupby] = keys
+        return keys
 
     def logout(self):
         """ Issue logout command to netprofiler machine. """
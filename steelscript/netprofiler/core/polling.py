@@ -0,0 +1,128 @@
+# Copyright (c) 2019 Riverbed Technology, Inc.
+#
+# This software is licensed under the terms and conditions of the MIT License
+# accompanying the software ("License").  This software is distributed "AS IS"
+# as set forth in the License.
+
+"""
+Strategies deciding how often the status of a running report is polled.
+
+A strategy is asked for the delay before the next status request given
+the last status returned by NetProfiler, the number of polls already
+made and the time elapsed since the first poll.
+"""
+
+import time
+import logging
+
+__all__ = ['FixedPolling', 'AdaptivePolling', 'poll_status']
+
+logger = logging.getLogger(__name__)
+
+
+class PollingStrategy(object):
+    """Base class for report status polling strategies."""
+
+    def next_interval(self, status, attempt, elapsed):
+        """Return the number of seconds to wait before the next poll.
+
+        :param dict status: last status returned for the report, with
+            `status`, `percent` and `remaining_seconds`
+
+        :param int attempt: number of polls made so far, minus one
+
+        :param float elapsed: seconds since the first poll
+        """
+        raise NotImplementedError()
+
+
+class FixedPolling(PollingStrategy):
+    """Poll every `interval` seconds."""
+
+    def __init__(self, interval=1):
+        self.interval = interval
+
+    def next_interval(self, status, attempt, elapsed):
+        return self.interval
+
+
+class AdaptivePolling(PollingStrategy):
+    """Poll quickly at first, then back off based on progress.
+
+    The delay grows exponentially from `min_interval` by a factor of
+    `backoff` on every poll.  When NetProfiler estimates a long time
+    remaining, either through `remaining_seconds` or the `percent`
+    complete so far, the delay is stretched to `remaining_factor` of that
+    estimate.  The delay never exceeds `max_interval`.
+
+    Short reports are thus picked up within a fraction of a second while
+    long reports are polled only a handful of times.
+    """
+
+    def __init__(self, min_interval=0.5, max_interval=30, backoff=1.5,
+                 remaining_factor=0.5):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.remaining_factor = remaining_factor
+
+    def _remaining(self, status, elapsed):
+        try:
+            remaining = float(status.get('remaining_seconds') or 0)
+        except (TypeError, ValueError):
+            remaining = 0
+
+        if remaining <= 0:
+            # fall back on extrapolating the progress made so far
+            try:
+                percent = float(status.get('percent') or 0)
+            except (TypeError, ValueError):
+                percent = 0
+            if 0 < percent < 100:
+                remaining = elapsed * (100 - percent) / percent
+
+        return remaining
+
+    def next_interval(self, status, attempt, elapsed):
+        interval = self.min_interval * (self.backoff ** min(attempt, 32))
+        interval = max(interval,
+                       self._remaining(status, elapsed) * self.remaining_factor)
+        return min(interval, self.max_interval)
+
+
+def poll_status(status, strategy=None, timeout=None):
+    """Poll `status` until it reports completion, yielding each status.
+
+    :param status: function returning the current report status
+
+    :param strategy: :class:`PollingStrategy` deciding the delay between
+        polls, defaults to :class:`AdaptivePolling`
+
+    :param timeout: if set, stop polling once `timeout` seconds of wall
+        clock time have passed
+
+    The last status yielded indicates `completed` unless the timeout
+    was reached.
+    """
+    if strategy is None:
+        strategy = AdaptivePolling()
+
+    start = time.monotonic()
+    attempt = 0
+    while True:
+        s = status()
+        yield s
+
+        if s['status'] == 'completed':
+            return
+
+        elapsed = time.monotonic() - start
+        if timeout is not None and elapsed >= timeout:
+            return
+
+        delay = strategy.next_interval(s, attempt, elapsed)
+        if timeout is not None:
+            delay = min(delay, timeout - elapsed)
+
+        time.sleep(delay)
+        attempt += 1
@@ -12,18 +12,25 @@ access to running reports and retrieving data from a NetProfiler.
 
 import logging
 import time
+import weakref
+import itertools
 # import types
 from io import StringIO
+from collections import deque, namedtuple
 
 from steelscript.common.api_helpers import APIVersion
 from steelscript.common.timeutils import (parse_timedelta, datetime_to_seconds,
-                                          timedelta_total_seconds)
+                                          timedelta_total_seconds,
+                                          sec_string_to_datetime)
 from steelscript.common.datastructures import RecursiveUpdateDict
 from steelscript.common.exceptions import RvbdException, RvbdHTTPException
 
 from steelscript.netprofiler.core.filters import TimeFilter, TrafficFilter
+from steelscript.netprofiler.core.polling import (FixedPolling, AdaptivePolling,
+                                                  poll_status)
 from steelscript.netprofiler.core._exceptions import ProfilerException
 from steelscript.netprofiler.core._types import Column, ColumnContainer
+from steelscript.netprofiler.core.scheduler import INTERACTIVE
 
 __all__ = ['TrafficSummaryReport',
            'TrafficOverallTimeSeriesReport',
@@ -32,11 +39,187 @@ __all__ = ['TrafficSummaryReport',
            'HostTimeSeriesReport',
            'WANSummaryReport',
            'WANTimeSeriesReport',
-           'IdentityReport']
+           'IdentityReport',
+           'ReportBatch']
 
 logger = logging.getLogger(__name__)
 
 
+def _to_float(x):
+    try:
+        return float(x)
+    except ValueError:
+        # netprofiler bug, %reduct columns labeled as ints
+        # hostgroup "123:10" lableled as ints
+        return x
+
+
+def _to_int(x):
+    try:
+        return int(x)
+    except ValueError:
+        return x
+
+
+def _params_key(params):
+    """Hashable form of query data request parameters."""
+    if not params:
+        return None
+    return tuple(sorted(params.items()))
+
+
+def _is_additive(column):
+    """Return True if values of `column` over consecutive time windows
+    add up to its value over the whole time frame.
+    """
+    return (column.json.get('statistic') == 'total' and
+            column.json.get('rate') == 'count')
+
+
+def _sum_results(legend, results):
+    """Merge summary rows of several reports by summing their values.
+
+    `results` is a list of (legend, rows, totals), rows are matched by the
+    values of their key columns.  Return the merged rows and totals.
+    """
+    keys = [i for i, c in enumerate(legend) if c.iskey]
+    values = [i for i, c in enumerate(legend) if not c.iskey]
+
+    def add(a, b):
+        if a == '':
+            return b
+        if b == '':
+            return a
+        return a + b
+
+    merged = dict()
+    totals = None
+    for _, rows, shard_totals in results:
+        for row in rows:
+            k = tuple(row[i] for i in keys)
+            current = merged.get(k)
+            if current is None:
+                merged[k] = list(row)
+            else:
+                for i in values:
+                    current[i] = add(current[i], row[i])
+
+        if shard_totals is not None:
+            if totals is None:
+                totals = list(shard_totals)
+            else:
+                for i in values:
+                    totals[i] = add(totals[i], shard_totals[i])
+
+    return list(merged.values()), totals
+
+
+class _PhaseTimer(object):
+    """Add up the time spent in each phase while retrieving data, to be
+    recorded once on `report` when done.
+    """
+    def __init__(self, report):
+        self.report = report
+        self.seconds = dict()
+
+    def add(self, phase, start):
+        self.seconds[phase] = (self.seconds.get(phase, 0) +
+                               time.monotonic() - start)
+
+    def record(self):
+        for phase, seconds in self.seconds.items():
+            self.report._add_time(phase, seconds)
+        self.seconds.clear()
+
+
+def _decode_rows(decode, rows, timer, phase='decode', chunk_size=1024):
+    """Yield `decode` applied to each of `rows`.
+
+    Rows are decoded by chunks of `chunk_size`, so that the time spent is
+    added to `phase` of the :class:`_PhaseTimer` `timer` without timing
+    every row, nor the code consuming them.
+    """
+    rows = iter(rows)
+    while True:
+        start = time.monotonic()
+        chunk = [decode(row) for row in itertools.islice(rows, chunk_size)]
+        timer.add(phase, start)
+        if not chunk:
+            return
+        yield from chunk
+
+
+class RowDecoder(object):
+    """Convert raw query rows into native python values.
+
+    The conversion for each column is worked out once from the column
+    definitions in `legend`, each row is then decoded by applying only
+    the int/float converters that are needed.  Columns holding strings
+    are passed through untouched.
+
+    Rows are decoded into new lists, leaving the raw rows, which may be
+    held by a report cache, unchanged.
+    """
+    def __init__(self, legend):
+        self.converters = tuple(self.converter_for(c) for c in legend)
+        self._plan = tuple((i, f) for i, f in enumerate(self.converters)
+                           if f is not None)
+
+    @classmethod
+    def converter_for(cls, column):
+        """Return the conversion function for `column`, or None."""
+        ctype = column.ctype
+        # Note that `ctype in 'reltime'` intentionally matches
+        # substrings, so that 'time' columns are returned as floats
+        if (ctype == 'float' or
+                ctype in 'reltime' or
+                column.rate == 'opt'):
+            return _to_float
+        elif ctype == 'int':
+            return _to_int
+        return None
+
+    def __call__(self, row):
+        row = list(row)
+        for i, convert in self._plan:
+            row[i] = convert(row[i])
+        return row
+
+
+def _column_array(column, values):
+    """Return a typed numpy array holding `values` of `column`.
+
+    Numeric columns become int64 or float64 arrays, 'time' columns
+    become datetime64[s], with NaN for blank or None values.  Anything
+    else, or numeric columns holding values NetProfiler mislabels (such
+    as %reduct columns) or integers beyond int64, are kept as object
+    arrays of the values that RowDecoder would return.
+    """
+    import numpy
+
+    convert = RowDecoder.converter_for(column)
+    if convert is None:
+        return numpy.array(values, dtype=object)
+
+    ctype = column.ctype
+    dtype = numpy.int64 if convert is _to_int else numpy.float64
+    try:
+        try:
+            arr = numpy.array(values, dtype=dtype)
+        except (ValueError, TypeError):
+            # blank values are returned for missing data
+            arr = numpy.array([numpy.nan if x == '' or x is None else x
+                               for x in values], dtype=numpy.float64)
+    except (ValueError, TypeError, OverflowError):
+        # including integers too large for int64
+        return numpy.array([None if x is None else convert(x)
+                            for x in values], dtype=object)
+
+    if ctype == 'time':
+        arr = arr.astype(numpy.int64).astype('datetime64[s]')
+    return arr
+
+
 class Query(object):
     """This class represents a netprofiler query instance.
     """
@@ -62,6 +245,8 @@ class Query(object):
         self.querydata = None
         self.data = None
         self.data_selected_columns = None
+        self.streamed_querydata = None
+        self._decoders = dict()
 
     def _select_columns(self, columns, ephemeral=True):
         """Return a set of column objects representing the requested columns."""
@@ -166,22 +351,23 @@ class Query(object):
         else:
             return self._select_columns(self.columns)
 
-    def _to_native(self, row, columns):
-        legend = self.get_legend(columns)
-        for i, x in enumerate(row):
-            try:
-                if (legend[i].json['type'] == 'float' or
-                    legend[i].json['type'] in 'reltime' or
-                    legend[i].json['rate'] == 'opt'):
-                    row[i] = float(x)
-                elif legend[i].json['type'] == 'int':
-                    row[i] = int(x)
-            except ValueError:
-                # netprofiler bug, %reduct columns labeled as ints
-                # hostgroup "123:10" lableled as ints
-                pass
+    def _get_decoder(self, legend):
+        """Return the compiled row decoder for the columns in `legend`.
 
-        return row
+        Decoders are cached per column selection, so the legend and the
+        column types are only inspected once per query rather than once
+        per row.
+        """
+        key = tuple(c.id for c in legend)
+        try:
+            return self._decoders[key]
+        except KeyError:
+            decoder = self._decoders[key] = RowDecoder(legend)
+            return decoder
+
+    def _to_native(self, row, columns=None):
+        legend = self.get_legend(columns)
+        return self._get_decoder(legend)(row)
 
     def _get_querydata(self, columns=None, limit=None):
         """Get the query data."""
@@ -203,33 +389,152 @@ class Query(object):
 
         if not params:
             params = None
-        self.querydata = self.report.profiler.api.report.queries(self.report.id,
-                                                                 self.id,
-                                                                 params=params)
+
+        self.querydata = self.report._cached_querydata(self, params)
+        if self.querydata is None:
+            start = time.monotonic()
+            self.querydata = self.report.profiler.api.report.queries(
+                self.report.id, self.id, params=params)
+            self.report._time('download', start)
+            self.report._cache_querydata(self, params, self.querydata)
+
         if 'data' in self.querydata:
             self.data = self.querydata['data']
-        else
+        else:
             self.data = []
-            
+
         self.data_selected_columns = columns
         logger.debug(
             'Retrieved query data for '
             'query id {0} and column {1}'.format(self.id, columns))
 
-    def get_iterdata(self, columns=None, limit=None):
-        """Iterate over the query data."""
+    def _iter_querydata(self, columns=None, limit=None, page_size=None,
+                        stream=False):
+        """Yield decoded rows without keeping the query data around.
+
+        If `page_size` is set, the data is requested in `offset`/`limit`
+        windows of at most `page_size` rows, each page being released
+        once its rows have been consumed.
+
+        If `stream` is True, each response body is parsed incrementally
+        and rows are decoded as they arrive instead of after the whole
+        response has been read.  The remaining members of the last
+        response (such as `totals`) are stored in
+        `self.streamed_querydata`.
+        """
+        columns = self.get_legend(columns)
+        decode = self._get_decoder(columns)
+        api = self.report.profiler.api.report
+        timer = _PhaseTimer(self.report)
+
+        params = {'columns': ','.join(str(col.id) for col in columns)}
+        if limit:
+            params['limit'] = limit
+
+        offset = 0
+        try:
+            while True:
+                if page_size:
+                    count = page_size
+                    if limit:
+                        count = min(count, limit - offset)
+                    params['offset'] = offset
+                    params['limit'] = count
+
+                if stream:
+                    # rows are parsed as they are received, decoding is
+                    # accounted for as part of the download
+                    querydata = dict()
+                    rows = _decode_rows(
+                        decode, api.iter_queries(self.report.id, self.id,
+                                                 querydata, params=params),
+                        timer, 'download')
+                else:
+                    start = time.monotonic()
+                    querydata = api.queries(self.report.id, self.id,
+                                            params=params)
+                    timer.add('download', start)
+                    rows = _decode_rows(decode, querydata.pop('data', []),
+                                        timer)
+
+                nrows = 0
+                for row in rows:
+                    nrows += 1
+                    yield row
+
+                self.streamed_querydata = querydata
+                logger.debug('Retrieved %d rows at offset %d for query id %s'
+                             % (nrows, offset, self.id))
+
+                offset += nrows
+                if (not page_size or nrows < count or
+                        (limit and offset >= limit)):
+                    break
+        finally:
+            # once for all pages, however many rows were consumed
+            timer.record()
+
+    def get_iterdata(self, columns=None, limit=None, page_size=None,
+                     stream=False):
+        """Iterate over the query data.
+
+        :param integer page_size: if set, retrieve the data from
+            NetProfiler in pages of at most `page_size` rows instead of
+            all rows at once.
+
+        :param bool stream: if True, parse the response incrementally,
+            yielding each row as soon as it has been received.
+
+        Rows retrieved with `page_size` or `stream` are not kept on the
+        query, so memory use does not grow with the size of the result.
+        Both are ignored for reports going through a report cache, whose
+        data is always retrieved whole so that it can be cached.
+        """
+        if (page_size or stream) and self.report._cache_key is None:
+            yield from self._iter_querydata(columns, limit, page_size, stream)
+            return
+
         self._get_querydata(columns, limit)
-        for row in self.data:
-            yield self._to_native(row, columns)
+        decode = self._get_decoder(self.data_selected_columns)
+        timer = _PhaseTimer(self.report)
+        try:
+            yield from _decode_rows(decode, self.data, timer)
+        finally:
+            timer.record()
 
     def get_data(self, columns=None, limit=None):
         """Generate list from get_iterdata."""
         return list(self.get_iterdata(columns, limit))
 
+    def get_columns_data(self, columns=None, limit=None):
+        """Return the query data as a list of typed numpy arrays.
+
+        One array is returned per column, in the same order as
+        :py:meth:`Query.get_legend`.  The arrays are built directly
+        from the downloaded payload: int64 or float64 for numeric
+        columns, datetime64[s] for 'time' columns and object arrays
+        for everything else.
+
+        Requires numpy.
+        """
+        self._get_querydata(columns, limit)
+        legend = self.data_selected_columns
+
+        start = time.monotonic()
+        if self.data:
+            values = list(zip(*self.data))
+        else:
+            values = [()] * len(legend)
+
+        arrays = [_column_array(c, v) for c, v in zip(legend, values)]
+        self.report._time('decode', start)
+        return arrays
+
     def get_totals(self, columns=None):
         """Return the totals associated with the requested columns."""
         self._get_querydata(columns)
-        return self._to_native(self.querydata['totals'])
+        decode = self._get_decoder(self.data_selected_columns)
+        return decode(self.querydata['totals'])
 
     def all_columns(self):
         """Returns all the columns available for this query.
@@ -243,11 +548,83 @@ class Query(object):
         return self.available_columns
 
 
+class MergedQuery(object):
+    """Query-like view over rows merged locally from other reports.
+
+    Supports the data access methods of :class:`Query`, the rows having
+    already been converted to native values.
+    """
+    def __init__(self, report, legend, rows, columns=None, totals=None):
+        self.report = report
+        self.id = None
+        self.legend = legend
+        self.rows = rows
+        self.columns = columns or legend
+        self.totals = totals
+        self.available_columns = legend
+        self.is_time_series = report.groupby == 'tim'
+        self.data_selected_columns = None
+
+    def _indexes(self, columns):
+        if not columns:
+            columns = self.columns
+        try:
+            return [self.legend.index(c) for c in columns]
+        except ValueError:
+            raise ProfilerException('Columns %s not all available in %s'
+                                    % (columns, self.legend))
+
+    def get_legend(self, columns=None):
+        return [self.legend[i] for i in self._indexes(columns)]
+
+    def get_iterdata(self, columns=None, limit=None, page_size=None,
+                     stream=False):
+        indexes = self._indexes(columns)
+        rows = self.rows[:limit] if limit else self.rows
+        for row in rows:
+            yield [row[i] for i in indexes]
+
+    def get_data(self, columns=None, limit=None):
+        return list(self.get_iterdata(columns, limit))
+
+    def get_columns_data(self, columns=None, limit=None):
+        legend = self.get_legend(columns)
+        self.data_selected_columns = legend
+        rows = self.get_data(columns, limit)
+        if rows:
+            values = list(zip(*rows))
+        else:
+            values = [()] * len(legend)
+        return [_column_array(c, v) for c, v in zip(legend, values)]
+
+    def get_totals(self, columns=None):
+        if self.totals is None:
+            raise ProfilerException('Totals are not available for results '
+                                    'merged from several reports')
+        return [self.totals[i] for i in self._indexes(columns)]
+
+    def all_columns(self):
+        return self.available_columns
+
+
 class Report(object):
     """Base class for all NetProfiler reports.
 
     This class is normally not used directly, but instead via subclasses
     :class:`SingleQueryReport` and :class:`MultiQueryReport`.
+
+    The `timings` dict holds the seconds spent by the last run of the
+    report in each phase: `post` to create it, `poll` for the `polls`
+    status requests, `queued` until NetProfiler started running it,
+    `wait` until it completed, `download` and `decode` for its data,
+    and `admission` spent waiting for the :class:`ReportScheduler
+    <steelscript.netprofiler.core.scheduler.ReportScheduler>` of the
+    NetProfiler.  Each phase is also recorded in the :class:`Metrics
+    <steelscript.netprofiler.core.metrics.Metrics>` of the NetProfiler.
+
+    `priority`, 'interactive' by default or 'batch', and `caller`,
+    defaulting to the name of the current thread, decide the admission
+    order of the report by the scheduler.
     """
 
     RESOLUTION_MAP = {60: "1min",
@@ -281,6 +658,22 @@ class Report(object):
         self.query = None
         self.queries = list()
 
+        # True when the results were merged locally from other reports
+        self.merged = False
+
+        # result cache state, see steelscript.netprofiler.core.cache
+        self.from_cache = False
+        self._cache_key = None
+        self._cache_entry = None
+
+        self.timings = dict()
+        self._posted = None
+
+        # admission by the scheduler of the NetProfiler
+        self.priority = INTERACTIVE
+        self.caller = None
+        self._ticket = None
+
     def __enter__(self):
         return self
 
@@ -327,13 +720,11 @@ class Report(object):
         self.id = None
         self.queries = list()
         self.last_status = None
+        self.merged = False
+        self.timings = dict()
+        self._posted = None
 
-        if resolution not in ["auto", "1min", "15min", "hour",
-                              "6hour", "day", "week", "month"]:
-            rd = parse_timedelta(resolution)
-            resolution = self.RESOLUTION_MAP[int(timedelta_total_seconds(rd))]
-
-        self.resolution = resolution
+        self.resolution = self._parse_resolution(resolution)
 
         start = datetime_to_seconds(self.timefilter.start)
         end = datetime_to_seconds(self.timefilter.end)
@@ -360,10 +751,59 @@ class Report(object):
 
         to_post = {"template_id": self.template_id,
                    "criteria": criteria}
+        self._to_post = to_post
+
+        self.from_cache = False
+        self._cache_key = None
+        self._cache_entry = None
+
+        cache = getattr(self.profiler, 'report_cache', None)
+        if cache is not None:
+            self._cache_key = cache.make_key(self.profiler, to_post)
+            entry = cache.get(self._cache_key)
+            if entry is not None:
+                self.from_cache = True
+                self._cache_entry = entry
+                self.id = entry['id']
+                self._release()
+                logger.info("Restored report %d from cache" % self.id)
+                return
+
+        self._post(to_post)
+
+        if sync:
+            self.wait_for_complete()
 
+    @classmethod
+    def _parse_resolution(cls, resolution):
+        """Return the NetProfiler name of `resolution`, such as '1min'."""
+        if resolution not in ["auto", "1min", "15min", "hour",
+                              "6hour", "day", "week", "month"]:
+            rd = parse_timedelta(resolution)
+            resolution = cls.RESOLUTION_MAP[int(timedelta_total_seconds(rd))]
+        return resolution
+
+    def _post(self, to_post):
+        """Create the report described by `to_post` on NetProfiler."""
         logger.debug("Posting JSON: %s" % to_post)
 
-        response = self.profiler.api.report.reports(data=to_post)
+        ticket = self._submit()
+        if ticket is not None:
+            timeout = ticket.scheduler.timeout
+            if not ticket.wait(timeout):
+                self._release()
+                raise ProfilerException('Report not admitted by the '
+                                        'scheduler within %s seconds'
+                                        % timeout)
+            self._time('admission', ticket.queued, ticket.admitted)
+
+        start = time.monotonic()
+        try:
+            response = self.profiler.api.report.reports(data=to_post)
+        except:
+            self._release()
+            raise
+        self._posted = time.monotonic()
 
         try:
             self.id = int(response['id'])
@@ -372,36 +812,128 @@ class Report(object):
                 "failed to retrieve report id from report creation response: %s"
                 % response)
 
+        self._time('post', start, self._posted)
         logger.info("Created report %d" % self.id)
 
-        if sync:
-            self.wait_for_complete()
+    def _submit(self):
+        """Queue this report with the scheduler of the NetProfiler.
+
+        Returns the :class:`Ticket
+        <steelscript.netprofiler.core.scheduler.Ticket>` of the report,
+        or None if the NetProfiler has no scheduler.
+        """
+        scheduler = getattr(self.profiler, 'scheduler', None)
+        if scheduler is None:
+            return None
+        if self._ticket is None or self._ticket.released:
+            self._ticket = scheduler.submit(self.priority, self.caller)
+            # last resort for reports dropped without being polled to
+            # completion or deleted
+            weakref.finalize(self, self._ticket.release)
+        return self._ticket
+
+    def _release(self):
+        """Let the scheduler admit another report in place of this one."""
+        if self._ticket is not None:
+            self._ticket.release()
+
+    def _rerun(self):
+        """Run a report restored from the cache on NetProfiler.
+
+        Needed when data which was never downloaded before is requested
+        from a cached report.  The queries are pointed at the new report.
+        """
+        entry = self._cache_entry
+        logger.info("Report %d: data not cached, running report again"
+                    % self.id)
+        self.from_cache = False
+        self._post(entry['to_post'])
+        self.wait_for_complete()
+
+        data = self.profiler.api.report.queries(self.id)
+        for query, json in zip(self.queries, data):
+            query.id = json['id']
+
+        entry['id'] = self.id
+        entry['queries'] = data
+        self.profiler.report_cache.put(self._cache_key, entry)
+
+    def _cached_querydata(self, query, params):
+        """Return the cached data of `query` for `params`, or None.
+
+        If the report was restored from the cache and the data is
+        missing, the report is run again on NetProfiler first.
+        """
+        if self._cache_entry is None:
+            return None
 
-    def wait_for_complete(self, interval=1, timeout=600):
+        key = (self.queries.index(query), _params_key(params))
+        querydata = self._cache_entry['data'].get(key)
+        if querydata is None and self.from_cache:
+            self._rerun()
+        return querydata
+
+    def _cache_querydata(self, query, params, querydata):
+        """Add data downloaded for `query` to the cache entry."""
+        if self._cache_entry is None:
+            return
+
+        key = (self.queries.index(query), _params_key(params))
+        self._cache_entry['data'][key] = querydata
+        self.profiler.report_cache.put(self._cache_key, self._cache_entry)
+
+    def _time(self, phase, start, end=None):
+        """Add the seconds since `start`, or until `end`, to `phase`."""
+        if end is None:
+            end = time.monotonic()
+        self._add_time(phase, end - start)
+
+    def _add_time(self, phase, seconds):
+        """Add `seconds` to `phase`, recorded as one observation."""
+        self.timings[phase] = self.timings.get(phase, 0) + seconds
+
+        metrics = getattr(self.profiler, 'metrics', None)
+        if metrics is not None:
+            metrics.record_phase(phase, seconds, getattr(self, 'id', None))
+
+    def wait_for_complete(self, interval=None, timeout=600, polling=None):
         """Periodically checks report status and returns when 100% complete.
+
+        :param interval: if set, poll the status every `interval` seconds
+
+        :param timeout: seconds of wall clock time after which to give up
+
+        :param polling: :class:`PollingStrategy
+            <steelscript.netprofiler.core.polling.PollingStrategy>` deciding
+            how often to poll, defaults to
+            :class:`AdaptivePolling
+            <steelscript.netprofiler.core.polling.AdaptivePolling>` unless
+            `interval` is given
         """
+        if polling is None and interval is not None:
+            polling = FixedPolling(interval)
+
         complete = False
         percent = 100
-        start = time.process_time()
-        while (time.process_time() - start) < timeout:
-            s = self.status()
-
+        start = time.monotonic()
+        for s in poll_status(self.status, polling, timeout):
             if s['status'] == 'completed':
-                logger.info("Report %d complete" % self.id)
+                logger.info("Report %s complete" % self.id)
                 complete = True
                 break
 
             if int(s['percent']) != percent:
                 percent = s['percent']
-                logger.info("Report %d %d%% complete, remaining %d" %
+                logger.info("Report %s %d%% complete, remaining %d" %
                             (self.id, percent, s['remaining_seconds']))
 
-            time.sleep(interval)
-
+        self._time('wait', start)
         if not complete:
-            logger.warning("Timed out waiting for report %d to complete,"
+            logger.warning("Timed out waiting for report %s to complete,"
                            "last %d%% complete" %
                            (self.id, (percent if percent else 0)))
+            # given up on, let other reports be admitted
+            self._release()
 
         return complete
 
@@ -415,10 +947,26 @@ class Report(object):
         - `percent` indicating the percentage complete (0-100)
         - `remaining_seconds` is an estimate of the time left until complete
         """
-        if not self.id:
+        if not self.id and not self.merged:
             return None
 
+        if self.from_cache or self.merged:
+            self.last_status = {'status': 'completed',
+                                'percent': 100,
+                                'remaining_seconds': 0}
+            return self.last_status
+
+        start = time.monotonic()
         self.last_status = self.profiler.api.report.status(self.id)
+        self._time('poll', start)
+        self.timings['polls'] = self.timings.get('polls', 0) + 1
+        if self.last_status.get('status') == 'completed':
+            self._release()
+
+        if (self._posted is not None and 'queued' not in self.timings and
+                self.last_status.get('status') != 'waiting'):
+            # as seen by the first poll after NetProfiler started the report
+            self._time('queued', self._posted)
 
         return self.last_status
 
@@ -427,7 +975,16 @@ class Report(object):
             raise ValueError("No id set, must run a report"
                              "or attach to an existing report first")
 
-        data = self.profiler.api.report.queries(self.id)
+        if self.from_cache:
+            data = self._cache_entry['queries']
+        else:
+            data = self.profiler.api.report.queries(self.id)
+            if self._cache_key is not None and self._cache_entry is None:
+                cache = self.profiler.report_cache
+                self._cache_entry = cache.new_entry(
+                    self._to_post, self.id, data)
+                cache.put(self._cache_key, self._cache_entry)
+
         for json in data:
             self.queries.append(Query(self, json, columns))
 
@@ -436,7 +993,7 @@ class Report(object):
 
     def get_query_by_index(self, index=0):
         """Returns the query_id by specifying the index, defaults to 0."""
-        if not self.id:
+        if not self.id and not self.merged:
             raise ValueError("No id set, must run a report"
                              "or attach to an existing report first")
 
@@ -445,7 +1002,7 @@ class Report(object):
 
         query = self.queries[index]
 
-        logger.debug("Retrieving query data for report %d, query %s" %
+        logger.debug("Retrieving query data for report %s, query %s" %
                      (self.id, query.id))
 
         return query
@@ -459,16 +1016,24 @@ class Report(object):
         query = self.get_query_by_index(index)
         return query.get_legend(columns)
 
-    def get_iterdata(self, index=0, columns=None, limit=None):
+    def get_iterdata(self, index=0, columns=None, limit=None, page_size=None,
+                     stream=False):
         """Retrieve iterator for the result data.
 
         If `columns` is specified, restrict the legend to the list of
         requested columns.
 
         :param integer limit: Upper limit of rows of the result data.
+
+        :param integer page_size: if set, retrieve the data in pages
+            of at most `page_size` rows, keeping memory use bounded
+            for very large results.
+
+        :param bool stream: if True, parse the data incrementally as it
+            is received rather than loading the whole response first.
         """
         query = self.get_query_by_index(index)
-        return query.get_iterdata(columns, limit)
+        return query.get_iterdata(columns, limit, page_size, stream)
 
     def get_data(self, index=0, columns=None, limit=None):
         """Retrieve data for this report.
@@ -492,10 +1057,15 @@ class Report(object):
 
     def delete(self):
         """Issue a call to NetProfiler delete this report."""
+        if self.from_cache or self.merged:
+            # the report id belongs to an earlier run, or there is no
+            # report on NetProfiler at all
+            return
         try:
             self.profiler.api.report.delete(self.id)
         except:
             pass
+        self._release()
 
 
 class MultiQueryReport(Report):
@@ -564,17 +1134,22 @@ class SingleQueryReport(Report):
     as :class:`TrafficSummaryReport`.
     """
 
+    TIMESERIES_REALMS = ('traffic_overall_time_series', 'traffic_time_series')
+
     def __init__(self, profiler):
         super(SingleQueryReport, self).__init__(profiler)
         self._limit = None
 
+        # set on reports run on behalf of another report
+        self._nested = False
+
     def run(self, realm,
             groupby="hos", columns=None, sort_col=None,
             timefilter=None, trafficexpr=None, host_group_type="ByLocation",
             resolution="auto", centricity="hos", area=None,
             data_filter=None, sync=True,
             query_columns_groupby=None, query_columns=None,
-            limit=None, custom_criteria=None
+            limit=None, custom_criteria=None, shards=None
             ):
         """
         :param str realm: type of query, this is automatically set by subclasses
@@ -619,7 +1194,42 @@ class SingleQueryReport(Report):
             NetProfiler will return by default a maximum of 10,000 rows,
             but with this argument that limit can be raised up to '1000000',
             if needed.
+
+        :param integer shards: if set, split `timefilter` into that many
+            windows aligned on the resolution, run one report per window
+            concurrently and merge their results.  Time series and flow
+            lists are concatenated and summaries are summed, which
+            requires all value columns to be additive totals.  Summary
+            windows are run without `limit`, applied once summed.  The
+            report is complete when this method returns.
+
+        If a :class:`TimeSeriesCache
+        <steelscript.netprofiler.core.cache.TimeSeriesCache>` is set as
+        `timeseries_cache` on the NetProfiler, time series reports with a
+        resolution other than 'auto' only run reports for the parts of
+        `timefilter` missing from the cache, and always complete before
+        returning.
         """
+        cache = getattr(self.profiler, 'timeseries_cache', None)
+        incremental = (cache is not None and
+                       realm in self.TIMESERIES_REALMS and
+                       self._parse_resolution(resolution) in TIMESERIES_STEPS)
+        if (incremental or shards) and not self._nested:
+            kwargs = dict(
+                realm=realm, groupby=groupby, columns=columns,
+                sort_col=sort_col, timefilter=timefilter,
+                trafficexpr=trafficexpr, host_group_type=host_group_type,
+                resolution=resolution, centricity=centricity, area=area,
+                data_filter=data_filter,
+                query_columns_groupby=query_columns_groupby,
+                query_columns=query_columns, limit=limit,
+                custom_criteria=custom_criteria)
+            self.timings = dict()
+            # only the reports run on behalf of this one take slots
+            self._release()
+            if incremental:
+                return self._run_incremental(cache, kwargs)
+            return self._run_sharded(shards, kwargs)
 
         # query related parameters
         self.realm = realm
@@ -688,20 +1298,286 @@ class SingleQueryReport(Report):
                                            sync=sync,
                                            custom_criteria=custom_criteria)
 
+    def _subreport(self):
+        """Return a report to run on behalf of this one."""
+        report = SingleQueryReport(self.profiler)
+        report._nested = True
+        report.priority = self.priority
+        report.caller = self.caller
+        return report
+
+    def _run_merged(self, kwargs, legend, rows, columns, totals=None):
+        """Set the results of this report to rows merged locally."""
+        self.realm = kwargs['realm']
+        self.groupby = kwargs['groupby'] or 'hos'
+        self.centricity = kwargs['centricity']
+        self.host_group_type = kwargs['host_group_type']
+        self.area = kwargs['area']
+        self.timefilter = kwargs['timefilter']
+        self.resolution = self._parse_resolution(kwargs['resolution'])
+        self.trafficexpr = kwargs['trafficexpr']
+        self.columns = columns
+        self._limit = None
+
+        self.id = None
+        self.merged = True
+        self.from_cache = False
+        self.last_status = None
+        self.queries = [MergedQuery(self, legend, rows, columns, totals)]
+
+    def _add_timings(self, report):
+        """Add the phase timings of the sub-report `report`, which are
+        recorded in the metrics already.
+        """
+        for phase, value in report.timings.items():
+            self.timings[phase] = self.timings.get(phase, 0) + value
+
+    def _run_incremental(self, cache, kwargs):
+        """Run a time series report through `cache`.
+
+        Reports are only run for the ranges of the time frame missing
+        from the cache, and their rows stitched with the cached ones.
+        """
+        timefilter = kwargs['timefilter']
+        if timefilter is None:
+            timefilter = TimeFilter.parse_range("last 5 min")
+            kwargs['timefilter'] = timefilter
+
+        resolution = self._parse_resolution(kwargs['resolution'])
+        step = TIMESERIES_STEPS[resolution]
+        # NetProfiler reports whole time buckets
+        start = datetime_to_seconds(timefilter.start) // step * step
+        end = datetime_to_seconds(timefilter.end) // step * step
+        if end <= start:
+            end = start + step
+
+        time_column = self.profiler.columns.key.time
+        columns = self.profiler.get_columns(kwargs['columns'], 'tim')
+        fetch_columns = list(columns)
+        if time_column not in fetch_columns:
+            fetch_columns.insert(0, time_column)
+
+        trafficexpr = kwargs['trafficexpr']
+        key = cache.make_key(self.profiler, {
+            'realm': kwargs['realm'],
+            'columns': [c.id for c in fetch_columns],
+            'trafficexpr': trafficexpr.filter if trafficexpr else None,
+            'centricity': kwargs['centricity'],
+            'resolution': resolution,
+            'area': kwargs['area'],
+            'host_group_type': kwargs['host_group_type'],
+            'query_columns_groupby': kwargs['query_columns_groupby'],
+            'query_columns': kwargs['query_columns'],
+            'data_filter': kwargs['data_filter'],
+            'custom_criteria': kwargs['custom_criteria']})
+
+        # coverage may end within a bucket, such as once old rows
+        # are pruned
+        gaps = []
+        for s, e in cache.missing(key, start, end):
+            s = s // step * step
+            e = -(-e // step) * step
+            if gaps and s <= gaps[-1][1]:
+                gaps[-1] = (gaps[-1][0], max(gaps[-1][1], e))
+            else:
+                gaps.append((s, e))
+        logger.debug('Time series cache: fetching %d of %d seconds in %d '
+                     'reports' % (sum(e - s for s, e in gaps), end - start,
+                                  len(gaps)))
+
+        def fetch(report):
+            try:
+                return report.get_legend(), report.get_data()
+            finally:
+                report.delete()
+
+        batch = ReportBatch(fetch=fetch)
+        ranges = dict()
+        for s, e in gaps:
+            report = self._subreport()
+            ranges[report] = (s, e)
+            subkwargs = dict(kwargs)
+            subkwargs['columns'] = fetch_columns
+            subkwargs['timefilter'] = TimeFilter(sec_string_to_datetime(s),
+                                                 sec_string_to_datetime(e))
+            batch.add(report, **subkwargs)
+
+        for result in batch.run():
+            if result.error is not None:
+                raise result.error
+            self._add_timings(result.report)
+            legend, rows = result.data
+            s, e = ranges[result.report]
+            cache.update(key, s, e, legend, rows, legend.index(time_column),
+                         step)
+
+        legend, rows = cache.get(key, start, end)
+        if legend is None:
+            # nothing fetched nor cached for an empty time frame
+            legend = fetch_columns
+
+        if time_column in columns:
+            selected = None
+        else:
+            selected = [c for c in legend if c != time_column]
+        self._run_merged(kwargs, legend, rows, selected)
+
+    def _run_sharded(self, shards, kwargs):
+        """Run the report as `shards` reports over parts of its time
+        frame and merge their results.
+        """
+        realm = kwargs['realm']
+        if realm not in (('traffic_summary', 'traffic_flow_list') +
+                         self.TIMESERIES_REALMS):
+            raise ProfilerException("Reports of realm '%s' cannot be "
+                                    "sharded" % realm)
+
+        groupby = kwargs['groupby'] or 'hos'
+        columns = self.profiler.get_columns(kwargs['columns'], groupby)
+        if realm == 'traffic_summary':
+            # Summing per window results is only right for totals
+            rejected = [c.key for c in columns
+                        if not c.iskey and not _is_additive(c)]
+            if rejected:
+                raise ProfilerException(
+                    'Sharded summary reports only support additive '
+                    'columns, such as total_bytes, not: %s'
+                    % ', '.join(rejected))
+
+        timefilter = kwargs['timefilter']
+        if timefilter is None:
+            timefilter = TimeFilter.parse_range("last 5 min")
+            kwargs['timefilter'] = timefilter
+
+        resolution = self._parse_resolution(kwargs['resolution'])
+        if realm in self.TIMESERIES_REALMS:
+            if resolution not in TIMESERIES_STEPS:
+                raise ProfilerException('Sharded time series reports need '
+                                        'a fixed resolution')
+            step = TIMESERIES_STEPS[resolution]
+        else:
+            step = 60
+
+        start = datetime_to_seconds(timefilter.start)
+        end = datetime_to_seconds(timefilter.end)
+        bounds = [start]
+        for i in range(1, shards):
+            # on the absolute grid of the resolution, so that no time
+            # bucket is split between two shards
+            t = (start + (end - start) * i // shards) // step * step
+            if bounds[-1] < t < end:
+                bounds.append(t)
+        bounds.append(end)
+
+        def fetch(report):
+            try:
+                totals = None
+                if realm == 'traffic_summary':
+                    totals = report.get_totals()
+                return report.get_legend(), report.get_data(), totals
+            finally:
+                report.delete()
+
+        batch = ReportBatch(max_running=shards, fetch=fetch)
+        order = dict()
+        for i, (s, e) in enumerate(zip(bounds[:-1], bounds[1:])):
+            report = self._subreport()
+            order[report] = i
+            subkwargs = dict(kwargs)
+            subkwargs['timefilter'] = TimeFilter(sec_string_to_datetime(s),
+                                                 sec_string_to_datetime(e))
+            if realm == 'traffic_summary':
+                # the top rows of each window do not add up to the top
+                # rows of the whole time frame
+                subkwargs['limit'] = None
+            batch.add(report, **subkwargs)
+        logger.info('Running report as %d shards' % len(order))
+
+        results = [None] * len(order)
+        for result in batch.run():
+            if result.error is not None:
+                raise result.error
+            self._add_timings(result.report)
+            results[order[result.report]] = result.data
+
+        legend = results[0][0]
+        totals = None
+        if realm in self.TIMESERIES_REALMS:
+            rows = []
+            tindex = legend.index(self.profiler.columns.key.time)
+            for _, data, _ in results:
+                # windows are aligned, but never repeat a time bucket
+                last = rows[-1][tindex] if rows else None
+                rows.extend(r for r in data
+                            if last is None or r[tindex] > last)
+        else:
+            if realm == 'traffic_flow_list':
+                # windows do not overlap, and identical rows may be
+                # distinct flows
+                rows = [r for _, data, _ in results for r in data]
+            else:
+                rows, totals = _sum_results(legend, results)
+
+            # rows of each shard are only sorted among themselves
+            if kwargs['sort_col'] is not None:
+                sort_col = self.profiler.get_columns([kwargs['sort_col']],
+                                                     groupby)[0]
+                i = legend.index(sort_col)
+                rows.sort(key=lambda r: r[i] or 0, reverse=True)
+            if kwargs['limit']:
+                rows = rows[:kwargs['limit']]
+
+        self._run_merged(kwargs, legend, rows, None, totals)
+
     def _load_queries(self, columns=None):
         super(SingleQueryReport, self)._load_queries(columns)
 
     def get_legend(self, columns=None):
         return super(SingleQueryReport, self).get_legend(0, columns)
 
-    def get_iterdata(self, columns=None, limit=None):
+    def get_iterdata(self, columns=None, limit=None, page_size=None,
+                     stream=False):
         return super(SingleQueryReport, self).get_iterdata(
-            0, columns, limit or self._limit)
+            0, columns, limit or self._limit, page_size, stream)
 
     def get_data(self, columns=None, limit=None):
         return super(SingleQueryReport, self).get_data(
             0, columns, limit or self._limit)
 
+    def get_columns_data(self, columns=None, limit=None):
+        """Retrieve the report data as a list of typed numpy arrays.
+
+        See :py:meth:`Query.get_columns_data`.
+        """
+        query = self.get_query_by_index(0)
+        return query.get_columns_data(columns, limit or self._limit)
+
+    def get_dataframe(self, columns=None, limit=None):
+        """Retrieve the report data as a pandas DataFrame.
+
+        Columns are named by their key and typed as described in
+        :py:meth:`Query.get_columns_data`.  Key columns of strings with
+        repeated values are stored as categoricals.
+
+        Requires pandas.
+        """
+        import pandas
+
+        query = self.get_query_by_index(0)
+        arrays = query.get_columns_data(columns, limit or self._limit)
+        legend = query.data_selected_columns
+
+        data = dict()
+        for i, (col, arr) in enumerate(zip(legend, arrays)):
+            if (col.iskey and arr.dtype == object and
+                    len(set(arr)) * 2 <= len(arr)):
+                arr = pandas.Categorical(arr)
+            data[i] = arr
+
+        df = pandas.DataFrame(data, columns=list(range(len(legend))))
+        df.columns = [c.key for c in legend]
+        return df
+
 
 class TrafficSummaryReport(SingleQueryReport):
     """
@@ -716,7 +1592,7 @@ class TrafficSummaryReport(SingleQueryReport):
     def run(self, groupby, columns, sort_col=None,
             timefilter=None, trafficexpr=None, host_group_type="ByLocation",
             resolution="auto", centricity="hos", area=None, sync=True,
-            limit=None):
+            limit=None, shards=None):
         """See :meth:`SingleQueryReport.run` for a description of the keyword
         arguments.
         """
@@ -725,7 +1601,8 @@ class TrafficSummaryReport(SingleQueryReport):
             groupby=groupby, columns=columns, sort_col=sort_col,
             timefilter=timefilter, trafficexpr=trafficexpr,
             host_group_type=host_group_type, resolution=resolution,
-            centricity=centricity, area=area, sync=sync, limit=limit)
+            centricity=centricity, area=area, sync=sync, limit=limit,
+            shards=shards)
 
 
 class TrafficOverallTimeSeriesReport(SingleQueryReport):
@@ -737,7 +1614,8 @@ class TrafficOverallTimeSeriesReport(SingleQueryReport):
 
     def run(self, columns,
             timefilter=None, trafficexpr=None,
-            resolution="auto", centricity="hos", area=None, sync=True):
+            resolution="auto", centricity="hos", area=None, sync=True,
+            shards=None):
         """See :meth:`SingleQueryReport.run` for a description of the keyword
         arguments.
 
@@ -749,7 +1627,7 @@ class TrafficOverallTimeSeriesReport(SingleQueryReport):
             groupby='tim', columns=columns, sort_col=None,
             timefilter=timefilter, trafficexpr=trafficexpr,
             host_group_type=None, resolution=resolution,
-            centricity=centricity, area=area, sync=sync)
+            centricity=centricity, area=area, sync=sync, shards=shards)
 
 
 class TrafficTimeSeriesReport(SingleQueryReport):
@@ -762,7 +1640,7 @@ class TrafficTimeSeriesReport(SingleQueryReport):
     def run(self, columns, query_columns_groupby, query_columns,
             timefilter=None, trafficexpr=None, host_group_type=None,
             resolution="auto", centricity="hos", area=None, sync=True,
-            custom_criteria=None):
+            custom_criteria=None, shards=None):
         """
         :param str query_columns_groupby: defines the type of data for
             each unique column
@@ -794,7 +1672,7 @@ class TrafficTimeSeriesReport(SingleQueryReport):
                 area=area, sync=sync,
                 query_columns_groupby=query_columns_groupby,
                 query_columns=query_columns,
-                custom_criteria=custom_criteria)
+                custom_criteria=custom_criteria, shards=shards)
         except RvbdHTTPException as e:
             if 'Error creating element ports' in str(e):
                 raise ProfilerException(
@@ -841,19 +1719,20 @@ class TrafficFlowListReport(SingleQueryReport):
         super(TrafficFlowListReport, self).__init__(profiler)
 
     def run(self, columns, sort_col=None,
-            timefilter=None, trafficexpr=None, sync=True, limit=None):
+            timefilter=None, trafficexpr=None, sync=True, limit=None,
+            shards=None):
         """See :meth:`SingleQueryReport.run` for a description of the keyword
         arguments.
 
-        Note that only `columns, `sort_col`, `timefilter`, `trafficexpr` and
-        `limit` apply to this report type.
+        Note that only `columns, `sort_col`, `timefilter`, `trafficexpr`,
+        `limit` and `shards` apply to this report type.
         """
         return super(TrafficFlowListReport, self).run(
             realm='traffic_flow_list',
             groupby='hos', columns=columns, sort_col=sort_col,
             timefilter=timefilter, trafficexpr=trafficexpr, host_group_type=None,
             centricity="hos", area=None, sync=sync,
-            limit=limit)
+            limit=limit, shards=shards)
 
 
 class WANReport(SingleQueryReport):
@@ -1262,3 +2141,202 @@ class LiveReport(MultiQueryReport):
 
         return self.profiler.get_columns_by_ids(
             widget_config['criteria']['columns'])
+
+
+# Length in seconds of the time buckets of each fixed resolution
+TIMESERIES_STEPS = dict((v, k) for k, v in Report.RESOLUTION_MAP.items())
+
+ReportResult = namedtuple('ReportResult', ['report', 'data', 'error'])
+
+
+class ReportBatch(object):
+    """Run many reports concurrently and collect their results.
+
+    Reports are created with `sync=False` and the status of all running
+    reports is polled from a single loop.  At most `max_running` reports
+    run at the same time on each NetProfiler, the rest wait their turn.
+    Results are returned in completion order, so the total time is
+    close to that of the slowest reports rather than the sum of all::
+
+        >>> batch = ReportBatch(max_running=4)
+        >>> for host in hosts:
+        ...     batch.add(TrafficSummaryReport(netprofiler),
+        ...               groupby='hos', columns=columns,
+        ...               trafficexpr=TrafficFilter('host %s' % host))
+        >>> for result in batch.run():
+        ...     print(result.report, len(result.data))
+
+    Reports are also only started once admitted by the
+    :class:`ReportScheduler
+    <steelscript.netprofiler.core.scheduler.ReportScheduler>` of their
+    NetProfiler, without blocking the reports of the batch already running.
+
+    Only reports whose `run` method accepts `sync`, such as subclasses
+    of :class:`SingleQueryReport`, can be run in a batch.
+    """
+
+    def __init__(self, max_running=4, interval=None, timeout=600, fetch=None,
+                 polling=None):
+        """
+        :param int max_running: maximum number of reports running at
+            once on any one NetProfiler
+
+        :param interval: if set, poll each running report every
+            `interval` seconds
+
+        :param polling: :class:`PollingStrategy
+            <steelscript.netprofiler.core.polling.PollingStrategy>` deciding
+            how often each report is polled, defaults to
+            :class:`AdaptivePolling
+            <steelscript.netprofiler.core.polling.AdaptivePolling>` unless
+            `interval` is given
+
+        :param timeout: seconds after which a running report is given up
+
+        :param fetch: function called with each completed report to
+            retrieve its data, defaults to ``report.get_data()``
+        """
+        if polling is None:
+            if interval is not None:
+                polling = FixedPolling(interval)
+            else:
+                polling = AdaptivePolling()
+
+        self.max_running = max_running
+        self.polling = polling
+        self.timeout = timeout
+        self.fetch = fetch or (lambda report: report.get_data())
+
+        self._pending = deque()
+
+    def add(self, report, **kwargs):
+        """Queue `report`, to be run with the keyword arguments `kwargs`.
+        """
+        kwargs['sync'] = False
+        self._pending.append((report, kwargs))
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _admitted(self, report):
+        """Queue `report` with the scheduler of its NetProfiler, return
+        True once it is admitted.
+        """
+        ticket = report._submit()
+        return ticket is None or ticket.admitted is not None
+
+    def _start(self, report, kwargs):
+        try:
+            report.run(**kwargs)
+        except Exception as e:
+            logger.warning('Failed to start report %s: %s' % (report, e))
+            report._release()
+            return ReportResult(report, None, e)
+        return None
+
+    def _finish(self, report):
+        try:
+            return ReportResult(report, self.fetch(report), None)
+        except Exception as e:
+            logger.warning('Failed to retrieve data for report %s: %s'
+                           % (report.id, e))
+            return ReportResult(report, None, e)
+
+    def run(self):
+        """Run all queued reports, yielding a :class:`ReportResult`
+        of (`report`, `data`, `error`) as each one completes.
+
+        `error` is None on success, otherwise the exception raised
+        while running the report or retrieving its data.  Reports which
+        time out are deleted from NetProfiler.
+
+        If the caller stops iterating before all reports completed, the
+        reports still running are deleted and those not started yet
+        leave the queue of the scheduler.
+        """
+        running = dict()      # report -> [start time, polls, next poll]
+        try:
+            yield from self._run(running)
+        finally:
+            for report in running:
+                report.delete()
+            for report, _ in self._pending:
+                report._release()
+
+    def _run(self, running):
+        per_host = dict()     # host -> number of running reports
+
+        while self._pending or running:
+            # Start as many queued reports as the limits allow, keeping
+            # reports for busy NetProfilers queued in order
+            waiting = deque()
+            failures = []
+            while self._pending:
+                report, kwargs = self._pending.popleft()
+                host = report.profiler.host
+                if (per_host.get(host, 0) >= self.max_running or
+                        not self._admitted(report)):
+                    waiting.append((report, kwargs))
+                    continue
+
+                failed = self._start(report, kwargs)
+                if failed:
+                    failures.append(failed)
+                    continue
+
+                now = time.monotonic()
+                running[report] = [now, 0, now]
+                per_host[host] = per_host.get(host, 0) + 1
+            self._pending = waiting
+            yield from failures
+
+            if not running and self._pending:
+                # all queued reports wait for the scheduler, slots being
+                # used by other callers
+                report = self._pending[0][0]
+                report._ticket.wait(1)
+                continue
+
+            finished = False
+            for report, state in list(running.items()):
+                started, attempt, next_poll = state
+                now = time.monotonic()
+                if now < next_poll:
+                    continue
+
+                try:
+                    status = report.status()
+                except Exception as e:
+                    report.delete()
+                    result = ReportResult(report, None, e)
+                else:
+                    elapsed = now - started
+                    if status['status'] == 'completed':
+                        logger.info("Report %s complete" % report.id)
+                        result = self._finish(report)
+                    elif elapsed > self.timeout:
+                        logger.warning("Timed out waiting for report %s "
+                                       "to complete" % report.id)
+                        # do not leave it running on NetProfiler
+                        report.delete()
+                        result = ReportResult(report, None, ProfilerException(
+                            'Timed out waiting for report %s to complete'
+                            % report.id))
+                    else:
+                        delay = self.polling.next_interval(status, attempt,
+                                                           elapsed)
+                        state[1] = attempt + 1
+                        state[2] = now + delay
+                        continue
+
+                del running[report]
+                per_host[report.profiler.host] -= 1
+                report._release()
+                finished = True
+                yield result
+
+            if running and not (finished and self._pending):
+                next_poll = min(state[2] for state in running.values())
+                delay = next_poll - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
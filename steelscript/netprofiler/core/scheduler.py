@@ -0,0 +1,306 @@
+# Copyright (c) 2019 Riverbed Technology, Inc.
+#
+# This software is licensed under the terms and conditions of the MIT License
+# accompanying the software ("License").  This software is distributed "AS IS"
+# as set forth in the License.
+
+"""
+Admission control of the reports run against a NetProfiler appliance.
+
+Admission control is optional: reports of a NetProfiler created with a
+`scheduler` go through that :class:`ReportScheduler` before being
+created, those of other NetProfiler objects are created right away.
+Passing ``scheduler=True`` uses the scheduler shared by all NetProfiler
+objects of the process connected to the same host, also returned by
+:func:`get_scheduler`::
+
+    >>> netprofiler = NetProfiler(host, auth=auth, scheduler=True)
+
+The scheduler bounds the number of reports in progress on the
+appliance: others wait for one of them to complete or be deleted, and
+raise ProfilerException if not admitted within its `timeout`.
+
+Waiting reports are admitted by priority, ``interactive`` before
+``batch``, and within a priority in turn across callers, so that a
+caller queueing many reports does not delay the others.  Some capacity
+is reserved for interactive reports, batch reports only use the rest::
+
+    >>> report = TrafficSummaryReport(netprofiler)
+    >>> report.priority = 'batch'
+    >>> report.caller = 'nightly-export'
+    >>> report.run(...)
+
+A report holds its slot from its creation until NetProfiler reports it
+complete, `wait_for_complete` gives up on it or it is deleted.  Code creating many reports with `sync=False`
+from one thread should use a :class:`ReportBatch
+<steelscript.netprofiler.core.report.ReportBatch>`, which starts them as
+they are admitted, rather than block on a slot only it could free.
+
+Queue depths, reports in progress and the time spent waiting are
+recorded in the `metrics` of the scheduler.
+"""
+
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+
+from steelscript.netprofiler.core.metrics import Metrics
+from steelscript.netprofiler.core._exceptions import ProfilerException
+
+__all__ = ['ReportScheduler', 'get_scheduler', 'INTERACTIVE', 'BATCH']
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+
+# admitted in this order
+PRIORITIES = (INTERACTIVE, BATCH)
+
+# default number of reports in progress per appliance, and of those
+# reserved for interactive reports
+MAX_RUNNING = 8
+RESERVE = 2
+
+# default seconds a report waits for admission
+TIMEOUT = 600
+
+
+class Ticket(object):
+    """Place of a report in the queue of a :class:`ReportScheduler`."""
+
+    def __init__(self, scheduler, priority, caller):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.caller = caller
+        self.queued = time.monotonic()
+        self.admitted = None        # time of admission
+        self.released = False
+        self._callbacks = []
+
+    def add_done_callback(self, callback):
+        """Call `callback` with the ticket once admitted, right away if it
+        already is, otherwise from the thread releasing a slot.
+        """
+        with self.scheduler._cond:
+            if self.admitted is None:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def wait(self, timeout=None):
+        """See :meth:`ReportScheduler.wait`."""
+        return self.scheduler.wait(self, timeout)
+
+    def release(self):
+        """See :meth:`ReportScheduler.release`."""
+        self.scheduler.release(self)
+
+
+class ReportScheduler(object):
+    """Bounds and orders the reports in progress on one appliance."""
+
+    def __init__(self, max_running=MAX_RUNNING, reserve=RESERVE,
+                 metrics=None, timeout=TIMEOUT):
+        """Create a scheduler.
+
+        :param int max_running: maximum number of reports in progress
+
+        :param int reserve: number of the `max_running` slots only used
+            by interactive reports
+
+        :param timeout: seconds a report waits for admission before
+            failing, None to wait indefinitely
+
+        :param metrics: :class:`Metrics
+            <steelscript.netprofiler.core.metrics.Metrics>` recording
+            queue depths and waiting times
+        """
+        self._cond = threading.Condition()
+        self._max_running = max_running
+        self._reserve = reserve
+        self.timeout = timeout
+        self.metrics = metrics if metrics is not None else Metrics()
+
+        self._running = dict((p, 0) for p in PRIORITIES)
+        # priority -> OrderedDict of caller -> deque of waiting tickets,
+        # callers are served in turn by moving them to the end
+        self._queues = dict((p, OrderedDict()) for p in PRIORITIES)
+
+    @property
+    def max_running(self):
+        return self._max_running
+
+    @max_running.setter
+    def max_running(self, value):
+        with self._cond:
+            self._max_running = value
+            self._dispatch()
+
+    @property
+    def reserve(self):
+        return self._reserve
+
+    @reserve.setter
+    def reserve(self, value):
+        with self._cond:
+            self._reserve = value
+            self._dispatch()
+
+    def _limit(self, priority):
+        """Number of reports in progress allowing `priority` to start."""
+        if priority == INTERACTIVE:
+            return self._max_running
+        # batch reports can always use at least one slot
+        return max(self._max_running - self._reserve, 1)
+
+    def _next(self):
+        running = sum(self._running.values())
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            if not queue or running >= self._limit(priority):
+                continue
+            caller, tickets = next(iter(queue.items()))
+            ticket = tickets.popleft()
+            if tickets:
+                queue.move_to_end(caller)
+            else:
+                del queue[caller]
+            return ticket
+        return None
+
+    def _dispatch(self):
+        """Admit waiting tickets while capacity allows.  Called with the
+        lock held.
+        """
+        while True:
+            ticket = self._next()
+            if ticket is None:
+                break
+            ticket.admitted = time.monotonic()
+            self._running[ticket.priority] += 1
+            wait = ticket.admitted - ticket.queued
+            self.metrics.observe('admission_wait_seconds', wait,
+                                 priority=ticket.priority)
+            if wait > 1:
+                logger.debug('Report admitted after waiting %.1fs, '
+                             'priority %s, caller %s'
+                             % (wait, ticket.priority, ticket.caller))
+            for callback in ticket._callbacks:
+                try:
+                    callback(ticket)
+                except Exception:
+                    logger.exception('Admission callback %r failed'
+                                     % callback)
+            ticket._callbacks = []
+
+        self._cond.notify_all()
+        self._update_gauges()
+
+    def _update_gauges(self):
+        for priority in PRIORITIES:
+            queued = sum(len(t) for t in self._queues[priority].values())
+            self.metrics.set_gauge('admission_queue_depth', queued,
+                                   priority=priority)
+            self.metrics.set_gauge('admission_running',
+                                   self._running[priority],
+                                   priority=priority)
+
+    def submit(self, priority=INTERACTIVE, caller=None):
+        """Queue a report and return its :class:`Ticket` without waiting.
+
+        :param str priority: 'interactive' or 'batch'
+
+        :param caller: hashable identifying the caller among which
+            admission is shared fairly, defaults to the current thread
+        """
+        if priority not in PRIORITIES:
+            raise ProfilerException('Unknown report priority: %s'
+                                    % priority)
+        if caller is None:
+            caller = threading.current_thread().name
+
+        ticket = Ticket(self, priority, caller)
+        with self._cond:
+            self._queues[priority].setdefault(caller, deque()).append(ticket)
+            self._dispatch()
+        return ticket
+
+    def wait(self, ticket, timeout=None):
+        """Wait until `ticket` is admitted.
+
+        Returns True once admitted, or False if `timeout` seconds passed
+        first, leaving the ticket queued.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while ticket.admitted is None:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                self._cond.wait(remaining)
+        return True
+
+    def acquire(self, priority=INTERACTIVE, caller=None, timeout=None):
+        """Queue a report and wait for its admission.
+
+        Returns its :class:`Ticket`, to pass to :meth:`release` once the
+        report is complete.  Raises ProfilerException if not admitted
+        within `timeout` seconds.
+        """
+        ticket = self.submit(priority, caller)
+        if not self.wait(ticket, timeout):
+            self.release(ticket)
+            raise ProfilerException('Report not admitted by the scheduler '
+                                    'within %s seconds' % timeout)
+        return ticket
+
+    def _cancel(self, ticket):
+        tickets = self._queues[ticket.priority].get(ticket.caller)
+        if tickets is not None and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del self._queues[ticket.priority][ticket.caller]
+        ticket.released = True
+        self._update_gauges()
+
+    def release(self, ticket):
+        """Free the slot of `ticket`, or remove it from the queue if not
+        admitted yet.  Releasing a ticket more than once has no effect.
+        """
+        with self._cond:
+            if ticket.released:
+                return
+            if ticket.admitted is None:
+                self._cancel(ticket)
+                return
+            ticket.released = True
+            self._running[ticket.priority] -= 1
+            self._dispatch()
+
+    def stats(self):
+        """Return a dict with the number of reports `running` and `queued`
+        for each priority.
+        """
+        with self._cond:
+            return {'running': dict(self._running),
+                    'queued': dict(
+                        (p, sum(len(t) for t in q.values()))
+                        for p, q in self._queues.items())}
+
+
+_schedulers = dict()
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(host):
+    """Return the scheduler shared by all reports run against `host`."""
+    with _schedulers_lock:
+        scheduler = _schedulers.get(host)
+        if scheduler is None:
+            scheduler = _schedulers[host] = ReportScheduler(
+                metrics=Metrics(labels={'host': host}))
+        return scheduler
@@ -6,12 +6,14 @@
 
 
 from steelscript.netprofiler.core import NetProfiler
-from steelscript.netprofiler.core.hostgroup import HostGroup, HostGroupType
+from steelscript.netprofiler.core.hostgroup import (HostGroup, HostGroupType,
+                                                   HostGroupConfig)
 from steelscript.common.service import UserAuth
 from steelscript.common.exceptions import RvbdException
 
 import os
 import vcr
+import pickle
 import logging
 import unittest
 import pytest
@@ -209,5 +211,306 @@ class HostGroupTests(unittest.TestCase):
         self.assertEqual(host_group_type.config[1]['cidr'], '10.92.11.0/24')
 
 
+class HostGroupConfigTests(unittest.TestCase):
+    def setUp(self):
+        self.host_group_type = HostGroupType.create(None, 'TestType4057')
+        for name in ('Boston', 'SanFran', 'NewYork'):
+            HostGroup(self.host_group_type, name).add(
+                [name + '/1', name + '/2'])
+
+    def cidrs(self):
+        return [entry['cidr'] for entry in self.host_group_type.config]
+
+    def test_add(self):
+        sanfran = self.host_group_type.groups['SanFran']
+        sanfran.add('a')
+        sanfran.add('b', prepend=True)
+        sanfran.add('c', keep_together=False)
+        sanfran.add('d', prepend=True, keep_together=False)
+        self.assertEqual(self.cidrs(),
+                         ['d', 'Boston/1', 'Boston/2', 'b', 'SanFran/1',
+                          'SanFran/2', 'a', 'NewYork/1', 'NewYork/2', 'c'])
+        self.assertEqual(sanfran.get(),
+                         ['d', 'b', 'SanFran/1', 'SanFran/2', 'a', 'c'])
+
+        sanfran.add(['e', 'f'], replace=True)
+        self.assertEqual(sanfran.get(), ['e', 'f'])
+        self.assertEqual(self.cidrs()[-2:], ['e', 'f'])
+
+    def test_remove(self):
+        boston = self.host_group_type.groups['Boston']
+        HostGroup(self.host_group_type, 'Other').add('Boston/1')
+        boston.remove(['Boston/1'])
+        self.assertEqual(boston.get(), ['Boston/2'])
+        self.assertEqual(self.host_group_type.config.find('Boston/1'),
+                         [{'cidr': 'Boston/1', 'name': 'Other'}])
+
+        self.host_group_type.groups['NewYork'].clear()
+        self.assertEqual(self.host_group_type.config.names(),
+                         ['Boston', 'SanFran', 'Other'])
+        self.assertEqual(len(self.host_group_type.config), 4)
+
+    def test_list(self):
+        config = self.host_group_type.config
+        entries = list(config)
+        self.assertEqual(config, entries)
+        self.assertEqual(config[2], {'cidr': 'SanFran/1', 'name': 'SanFran'})
+        self.assertEqual(pickle.loads(pickle.dumps(config)), entries)
+        extra = [{'cidr': 'y', 'name': 'Other'}]
+        self.assertEqual(config + extra, entries + extra)
+        self.assertEqual(extra + config, extra + entries)
+
+        # items are copies, leaving the indexes right
+        config[0]['name'] = 'SanFran'
+        config[0:1][0]['name'] = 'SanFran'
+        next(iter(config))['name'] = 'SanFran'
+        self.assertEqual(config[0], {'cidr': 'Boston/1', 'name': 'Boston'})
+        inserted = {'cidr': 'x', 'name': 'Other'}
+        config.append(inserted)
+        inserted['name'] = 'SanFran'
+        self.assertEqual(config.get_group('Other'),
+                         [{'cidr': 'x', 'name': 'Other'}])
+        del config[-1]
+
+        del config[0]
+        config.insert(0, {'cidr': 'x', 'name': 'SanFran'})
+        self.assertEqual(self.host_group_type.groups['SanFran'].get(),
+                         ['x', 'SanFran/1', 'SanFran/2'])
+        self.assertEqual(self.host_group_type.groups['Boston'].get(),
+                         ['Boston/2'])
+
+        self.host_group_type.config = entries
+        self.assertIsInstance(self.host_group_type.config, HostGroupConfig)
+        self.assertEqual(self.host_group_type.config, entries)
+
+        config = self.host_group_type.config
+        config.sort(key=lambda entry: entry['cidr'], reverse=True)
+        self.assertEqual(self.cidrs(), sorted(self.cidrs(), reverse=True))
+        self.assertEqual(self.host_group_type.groups['SanFran'].get(),
+                         ['SanFran/2', 'SanFran/1'])
+
+    def test_lookup(self):
+        host_group_type = HostGroupType.create(None, 'TestType4057')
+        HostGroup(host_group_type, 'Lab').add(['10.99.1.128/25', '10.98/16'])
+        HostGroup(host_group_type, 'SanFran').add(['10.99.1/24', '10.99.2/24'])
+        HostGroup(host_group_type, 'Corp').add(['10/8', '2001:db8::/32'])
+        lookup = host_group_type.lookup()
+
+        ips = ['10.99.1.200', '10.99.1.10', '10.99.2.1', '10.98.7.7',
+               '10.1.2.3', '11.0.0.1', '2001:db8::1']
+        expected = ['Lab', 'SanFran', 'SanFran', 'Lab', 'Corp', None, 'Corp']
+        self.assertEqual([lookup.get(ip) for ip in ips], expected)
+        self.assertEqual(list(lookup.classify(ips)), expected)
+        self.assertEqual(list(lookup.classify(ips[:-1])), expected[:-1])
+        self.assertIs(host_group_type.lookup(), lookup)
+
+        # earlier items take precedence
+        host_group_type.groups['Corp'].add('10.99.2.0/24', prepend=True,
+                                           keep_together=False)
+        self.assertEqual(host_group_type.lookup()['10.99.2.1'], 'Corp')
+
+
+class FakeHostGroupTypesAPI(object):
+    def __init__(self):
+        self.calls = []
+        self.types = {}
+
+    def get_all(self, offset=0, limit=None):
+        self.calls.append('get_all')
+        types = [{'id': type_id, 'name': info['name']}
+                 for type_id, info in self.types.items()]
+        return self._page(types, offset, limit)
+
+    def _page(self, items, offset, limit):
+        return items[offset:None if limit is None else offset + limit]
+
+    def _groups(self, type_id):
+        names = []
+        for entry in self.types[type_id]['config']:
+            if entry['name'] not in names:
+                names.append(entry['name'])
+        return [{'id': i, 'name': name} for i, name in enumerate(names)]
+
+    def get_all_groups(self, type_id, offset=0, limit=None):
+        self.calls.append('get_all_groups')
+        return self._page(self._groups(type_id), offset, limit)
+
+    def get_group_members(self, type_id, group_id, offset=0, limit=None):
+        self.calls.append('get_group_members')
+        name = self._groups(type_id)[group_id]['name']
+        members = [{'ipaddr': '10.%d.1.%d' % (group_id, i)}
+                   for i in range(2 * len(name))]
+        return self._page(members, offset, limit)
+
+    def create(self, name, desc, favorite, config):
+        self.calls.append('create')
+        type_id = len(self.types) + 1
+        self.types[type_id] = {'name': name, 'description': desc,
+                               'favorite': favorite, 'config': config}
+        return {'id': type_id}
+
+    def get(self, type_id):
+        self.calls.append('get')
+        return self.types[type_id]
+
+    def get_config(self, type_id):
+        self.calls.append('get_config')
+        return [dict(entry) for entry in self.types[type_id]['config']]
+
+    def delete(self, type_id):
+        self.calls.append('delete')
+        del self.types[type_id]
+
+    def set(self, type_id, name, desc, favorite, config):
+        self.calls.append('set')
+        self.types[type_id] = {'name': name, 'description': desc,
+                               'favorite': favorite, 'config': config}
+
+    def set_config(self, type_id, config):
+        self.calls.append('set_config')
+        self.types[type_id]['config'] = config
+
+
+class HostGroupSaveTests(unittest.TestCase):
+    def setUp(self):
+        self.profiler = type('NetProfiler', (object,), {})()
+        self.profiler.host = 'hostgroup-save-%s' % self.id()
+        self.profiler.api = type('API', (object,), {})()
+        self.api = self.profiler.api.host_group_types = \
+            FakeHostGroupTypesAPI()
+
+        host_group_type = HostGroupType.create(self.profiler, 'TestType4057')
+        for i in range(100):
+            HostGroup(host_group_type, 'Test%d' % i).add(
+                ['10.%d.1.0/24' % i, '10.%d.2.0/24' % i])
+        self.assertEqual(host_group_type.save()['action'], 'create')
+        self.host_group_type = HostGroupType(self.profiler,
+                                             host_group_type.id)
+        self.host_group_type.load()
+
+    def test_unchanged(self):
+        result = self.host_group_type.save()
+        self.assertIsNone(result['action'])
+        self.assertEqual(result['bytes_sent'], 0)
+        self.assertGreater(result['bytes_saved'], 5000)
+
+        # changes undone
+        self.host_group_type.groups['Test1'].add('10.99.0.0/16')
+        self.host_group_type.groups['Test1'].remove('10.99.0.0/16')
+        self.assertIsNone(self.host_group_type.save()['action'])
+        self.assertEqual(self.api.calls, ['create', 'get', 'get_config'])
+
+    def test_config_item_replaced(self):
+        config = self.host_group_type.config
+        config[0] = dict(config[0], cidr='11.0.0.0/8')
+        result = self.host_group_type.save()
+        self.assertEqual(result['action'], 'set_config')
+        self.assertEqual((result['added'], result['removed']), (1, 1))
+        self.assertEqual(self.api.types[self.host_group_type.id]
+                         ['config'][0]['cidr'], '11.0.0.0/8')
+        self.assertIsNone(self.host_group_type.save()['action'])
+
+    def test_config_changed(self):
+        self.host_group_type.groups['Test1'].add('10.99.0.0/16')
+        result = self.host_group_type.save()
+        self.assertEqual(result['action'], 'set_config')
+        self.assertEqual((result['added'], result['removed']), (1, 0))
+        self.assertGreater(result['bytes_saved'], 0)
+
+        self.host_group_type.description = 'changed'
+        self.host_group_type.groups['Test2'].clear()
+        result = self.host_group_type.save()
+        self.assertEqual(result['action'], 'set')
+        self.assertEqual((result['added'], result['removed']), (0, 2))
+        self.assertEqual(result['bytes_saved'], 0)
+        self.assertEqual(self.api.calls, ['create', 'get', 'get_config',
+                                          'set_config', 'set'])
+        self.assertEqual(self.api.types[1]['config'],
+                         list(self.host_group_type.config))
+
+        self.assertEqual(self.host_group_type.save(force=True)['action'],
+                         'set')
+
+    def test_directory(self):
+        del self.api.calls[:]
+        for _ in range(3):
+            host_group_type = HostGroupType.find_by_name(
+                self.profiler, 'TestType4057', refresh=False)
+            self.assertEqual(len(host_group_type.groups), 100)
+        self.assertEqual(self.api.calls, ['get_all'])
+
+        # loaded again by default, as they are to be saved
+        host_group_type = HostGroupType.find_by_name(self.profiler,
+                                                     'TestType4057')
+        self.assertEqual(self.api.calls, ['get_all', 'get', 'get_config'])
+
+        # saved changes are loaded again
+        host_group_type.groups['Test1'].clear()
+        host_group_type.save()
+        host_group_type = HostGroupType.find_by_name(
+            self.profiler, 'TestType4057', refresh=False)
+        self.assertNotIn('Test1', host_group_type.groups)
+        self.assertEqual(self.api.calls[3:], ['set_config', 'get_all',
+                                              'get', 'get_config'])
+
+        host_group_type.delete()
+        with self.assertRaises(RvbdException):
+            HostGroupType.find_by_name(self.profiler, 'TestType4057')
+
+    def test_load_all(self):
+        other = HostGroupType.create(self.profiler, 'TestType4058')
+        HostGroup(other, 'Other').add(['192.168.0.0/16'])
+        other.save()
+
+        del self.api.calls[:]
+        types = HostGroupType.load_all(self.profiler, workers=4, page_size=7)
+        self.assertEqual(list(types), ['TestType4057', 'TestType4058'])
+        self.assertEqual(self.api.calls.count('get_all'), 2)
+        # 100 groups in pages of 7 and 1 group, and 101 groups of 10 or
+        # 12 members, each list ending with an empty page
+        self.assertEqual(self.api.calls.count('get_all_groups'), 18)
+        self.assertEqual(self.api.calls.count('get_group_members'), 303)
+
+        host_group_type = types['TestType4057']
+        self.assertEqual(host_group_type.config, self.host_group_type.config)
+        self.assertEqual(sorted(host_group_type.groups),
+                         sorted(self.host_group_type.groups))
+        host_group = host_group_type.groups['Test10']
+        self.assertEqual(host_group.info, {'id': 10, 'name': 'Test10'})
+        self.assertEqual(host_group.get(), ['10.10.1.0/24', '10.10.2.0/24'])
+        self.assertEqual(len(host_group.members), 12)
+        self.assertEqual(types['TestType4058'].groups['Other'].members,
+                         [{'ipaddr': '10.0.1.%d' % i} for i in range(10)])
+
+        # the directory is filled, and nothing is left to save
+        del self.api.calls[:]
+        self.assertEqual(HostGroupType.find_by_name(
+            self.profiler, 'TestType4058', refresh=False).id, other.id)
+        self.assertIsNone(host_group_type.save()['action'])
+        self.assertEqual(self.api.calls, [])
+
+        types = HostGroupType.load_all(self.profiler, members=False)
+        self.assertIsNone(types['TestType4058'].groups['Other'].members)
+        self.assertNotIn('get_group_members', self.api.calls)
+
+    def load_members(self, page):
+        self.api._page = page
+        types = HostGroupType.load_all(self.profiler, workers=4, page_size=7)
+        return types['TestType4057'].groups['Test10'].members
+
+    def test_load_all_capped(self):
+        # pages of at most 5 items, whatever the limit
+        members = self.load_members(
+            lambda items, offset, limit: items[offset:offset + 5])
+        self.assertEqual(members, [{'ipaddr': '10.10.1.%d' % i}
+                                   for i in range(12)])
+
+    def test_load_all_unpaged(self):
+        # offset and limit ignored
+        members = self.load_members(lambda items, offset, limit: items)
+        self.assertEqual(members, [{'ipaddr': '10.10.1.%d' % i}
+                                   for i in range(12)])
+
+
 if __name__ == '__main__':
     unittest.main()
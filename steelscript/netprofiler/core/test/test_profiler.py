@@ -9,17 +9,46 @@
 from steelscript.netprofiler.core import NetProfiler
 from steelscript.netprofiler.core.filters import TimeFilter, TrafficFilter
 from steelscript.common.service import UserAuth
-from steelscript.common.exceptions import RvbdException
+from steelscript.common.exceptions import RvbdException, RvbdHTTPException
+from steelscript.common.api_helpers import APIVersion
 from steelscript.netprofiler.core.report import (WANSummaryReport, WANTimeSeriesReport, TrafficSummaryReport,
                                   TrafficOverallTimeSeriesReport, TrafficFlowListReport,
-                                  IdentityReport)
+                                  IdentityReport, RowDecoder, ReportBatch,
+                                  _column_array)
+from steelscript.netprofiler.core._types import Column, ColumnContainer
+from steelscript.netprofiler.core._exceptions import ProfilerException
+from steelscript.netprofiler.core import _jsonstream
+from steelscript.netprofiler.core import _api1
+from steelscript.netprofiler.core._registry import MetadataRegistry
+from steelscript.netprofiler.core import _pool
+from steelscript.netprofiler.core import aio
+from steelscript.netprofiler.core.metrics import Metrics
+from steelscript.netprofiler.core.scheduler import ReportScheduler
+from steelscript.netprofiler.core._catalog import ColumnCatalogFile
+from steelscript.netprofiler.core.netprofiler import ColumnIndex, make_hash
+from steelscript.netprofiler.core.polling import AdaptivePolling
+from steelscript.netprofiler.core.cache import ReportCache, TimeSeriesCache
 
 import os
 import vcr
+import shutil
+import tempfile
 import pytest
 import unittest
 import logging
+import asyncio
 import datetime
+import time
+import weakref
+import threading
+import http.server
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 logger = logging.getLogger(__name__)
@@ -439,5 +468,1166 @@ class ProfilerDevicesTests(unittest.TestCase):
             self.assertTrue(h in dev.keys())
 
 
+class RowDecoderTests(unittest.TestCase):
+    def _column(self, cid, ctype, rate='', category='data'):
+        return Column.from_json({'id': cid, 'strid': 'ID_COL%d' % cid,
+                                 'name': 'Col %d' % cid, 'type': ctype,
+                                 'rate': rate, 'category': category})
+
+    def test_decode_row(self):
+        legend = [self._column(98, 'time', category='key'),
+                  self._column(5, 'ipaddr', category='key'),
+                  self._column(33, 'int', rate='persec'),
+                  self._column(280, 'reltime', rate='opt'),
+                  self._column(72, 'float')]
+        decode = RowDecoder(legend)
+        raw = ['1549641600', '10.99.16.1', '1432', '0.25', '3.5']
+        row = decode(raw)
+        self.assertEqual(row, [1549641600.0, '10.99.16.1', 1432, 0.25, 3.5])
+        self.assertEqual(raw[0], '1549641600')
+        self.assertEqual(decode.converters[1], None)
+
+    def test_decode_mislabeled_int(self):
+        # %reduct and hostgroup columns may be labeled as ints
+        decode = RowDecoder([self._column(410, 'int'),
+                             self._column(411, 'int')])
+        self.assertEqual(decode(['12.5%', '123:10']), ['12.5%', '123:10'])
+
+
+@unittest.skipIf(numpy is None, 'requires numpy')
+class ColumnsDataTests(unittest.TestCase):
+    def column(self, key):
+        return FakeProfiler().columns[key]
+
+    def test_column_array(self):
+        arr = _column_array(self.column('avg_bytes'), ['12', '7'])
+        self.assertEqual(arr.dtype, numpy.int64)
+        self.assertEqual(arr.tolist(), [12, 7])
+
+        # missing values
+        for blank in ('', None):
+            arr = _column_array(self.column('avg_bytes'), ['12', blank])
+            self.assertEqual(arr.dtype, numpy.float64)
+            self.assertTrue(numpy.isnan(arr[1]))
+
+        # beyond int64, or mislabeled
+        big = 2 ** 70
+        arr = _column_array(self.column('total_bytes'), [str(big), '1'])
+        self.assertEqual(arr.dtype, object)
+        self.assertEqual(arr.tolist(), [big, 1])
+        arr = _column_array(self.column('total_bytes'), ['12.5%', None])
+        self.assertEqual(arr.tolist(), ['12.5%', None])
+
+        arr = _column_array(self.column('time'), ['1500000000'])
+        self.assertEqual(arr.dtype, numpy.dtype('datetime64[s]'))
+        arr = _column_array(self.column('host_ip'), ['10.0.0.1'])
+        self.assertEqual(arr.dtype, object)
+
+    def test_report(self):
+        report = TrafficSummaryReport(FakeProfiler())
+        report.run('hos', ['host_ip', 'avg_bytes', 'total_bytes'])
+        host_ip, avg_bytes, total_bytes = report.get_columns_data()
+        self.assertEqual(host_ip.tolist(), ['10.0.0.1'])
+        self.assertEqual(avg_bytes.dtype, numpy.int64)
+        self.assertEqual(total_bytes.tolist(), [100])
+
+    def test_dataframe(self):
+        pandas = pytest.importorskip('pandas')
+        profiler = FakeProfiler()
+        report = TrafficSummaryReport(profiler)
+        report.run('hos', ['host_ip', 'avg_bytes'])
+        df = report.get_dataframe()
+        self.assertEqual(list(df.columns), ['host_ip', 'avg_bytes'])
+        self.assertEqual(df['avg_bytes'].dtype, numpy.int64)
+        self.assertEqual(df['host_ip'].tolist(), ['10.0.0.1'])
+
+        # repeated keys are categoricals
+        queries = profiler.api.report.queries
+
+        def repeated(rid, qid=None, params=None):
+            res = queries(rid, qid, params)
+            if qid is not None:
+                res['data'] = [['10.0.0.%d' % (i % 2), str(i)]
+                               for i in range(10)]
+            return res
+
+        profiler.api.report.queries = repeated
+        report = TrafficSummaryReport(profiler)
+        report.run('hos', ['host_ip', 'avg_bytes'])
+        df = report.get_dataframe()
+        self.assertIsInstance(df['host_ip'].dtype, pandas.CategoricalDtype)
+        self.assertEqual(df['avg_bytes'].sum(), 45)
+
+
+class ColumnTests(unittest.TestCase):
+    def test_shared(self):
+        a = Column.from_json(dict(COLUMNS[3]))
+        b = Column.from_json(dict(COLUMNS[3]))
+        self.assertIs(a, b)
+        self.assertEqual(hash(a), hash(tuple(COLUMNS[3].values())))
+        self.assertEqual(a.ctype, COLUMNS[3]['type'])
+        self.assertRaises(AttributeError, setattr, a, 'bogus', 1)
+
+        ephemeral = dict(COLUMNS[3], id=200001, strid='200001')
+        self.assertIsNot(Column.from_json(ephemeral),
+                         Column.from_json(dict(ephemeral)))
+
+    def test_shared_threads(self):
+        definition = dict(COLUMNS[2], id=77, strid='ID_THREADED')
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            columns = list(pool.map(lambda _: Column.from_json(
+                dict(definition)), range(64)))
+        self.assertEqual(len(set(id(c) for c in columns)), 1)
+
+
+class ColumnContainerTests(unittest.TestCase):
+    def test_loader(self):
+        loaded = []
+
+        def loader():
+            if not loaded:
+                loaded.append(True)
+                container._update([Column.from_json(COLUMNS[1])])
+
+        container = ColumnContainer([Column.from_json(COLUMNS[0])],
+                                    loader=loader)
+        self.assertEqual(container.key.time.id, 98)
+        self.assertFalse(loaded)
+        self.assertEqual(container.key.host_ip.id, 6)
+        self.assertEqual(container['host_ip'].id, 6)
+        self.assertRaises(AttributeError, getattr, container.key, 'bogus')
+        self.assertEqual(len(loaded), 1)
+
+
+class ColumnCatalogTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_roundtrip(self):
+        time_column, host_column, bytes_column = [Column.from_json(c)
+                                                  for c in COLUMNS[:3]]
+        catalog = ColumnCatalogFile(self.directory, 'columns.json')
+        self.assertEqual(catalog.data, None)
+        catalog.data = {'a': [time_column, bytes_column],
+                        'b': [host_column, bytes_column]}
+        catalog.version = 1.1
+        catalog.write()
+
+        catalog = ColumnCatalogFile(self.directory, 'columns.json')
+        self.assertEqual(catalog.version, 1.1)
+        self.assertEqual([c.key for c in catalog.data['a']],
+                         ['time', 'avg_bytes'])
+        self.assertEqual(catalog.data['b'][0].json, COLUMNS[1])
+        # columns shared by triplets are loaded once
+        self.assertTrue(catalog.data['a'][1] is catalog.data['b'][1])
+
+
+class ColumnIndexTests(unittest.TestCase):
+    def test_search(self):
+        time_column, host_column, bytes_column = [Column.from_json(c)
+                                                  for c in COLUMNS[:3]]
+        data = {make_hash('traffic_summary', 'hos', 'hos'):
+                [host_column, bytes_column],
+                make_hash('traffic_overall_time_series', 'int', 'tim'):
+                [time_column, bytes_column]}
+        index = ColumnIndex(data,
+                            ['traffic_summary', 'traffic_overall_time_series'],
+                            ['hos', 'int'], ['hos', 'tim'])
+
+        self.assertEqual(index.search(),
+                         set(['time', 'host_ip', 'avg_bytes']))
+        self.assertEqual(index.search(groupbys=['tim']),
+                         set(['time', 'avg_bytes']))
+        # no triplet is traffic_summary with centricity int
+        self.assertEqual(index.search(realms=['traffic_summary'],
+                                      centricities=['int']), set())
+
+
+class MetadataRegistryTests(unittest.TestCase):
+    def test_version(self):
+        registry = MetadataRegistry()
+        entry = registry.get('profiler', '10.0')
+        self.assertIs(registry.get('profiler', '10.0'), entry)
+        self.assertIsNot(registry.get('other', '10.0'), entry)
+
+        upgraded = registry.get('profiler', '10.1')
+        self.assertIsNot(upgraded, entry)
+        self.assertIs(registry.get('profiler', '10.1'), upgraded)
+
+    def test_api_cache(self):
+        entry = MetadataRegistry().get('profiler', '10.0')
+        first = _api1.Report('/api/profiler/1.0/reporting', None)
+        second = _api1.Report('/api/profiler/1.0/reporting', None)
+        first.share_cache(entry.api_cache)
+        second.share_cache(entry.api_cache)
+
+        first.realms_cache = ['traffic_summary']
+        first.columns_cache['key'] = []
+        self.assertEqual(second.realms_cache, ['traffic_summary'])
+        self.assertIn('key', second.columns_cache)
+
+
+class FakeColumnsAPI(object):
+    """Column definitions of a NetProfiler, the requests for the triplets
+    in `fail` raising an HTTP error.
+    """
+    def __init__(self, fail=()):
+        self.calls = []
+        self.fail = fail
+
+    def columns(self, realm, centricity, groupby, force=False):
+        triplet = (realm, centricity, groupby)
+        self.calls.append(triplet)
+        # later triplets complete first
+        time.sleep(0.02 if centricity == 'hos' else 0)
+        if triplet in self.fail:
+            result = type('Response', (object,),
+                          {'status_code': 500, 'reason': 'Error',
+                           'headers': {}})()
+            raise RvbdHTTPException(result, '', 'GET', '/columns')
+        if groupby == 'tim':
+            return [dict(COLUMNS[0]), dict(COLUMNS[2])]
+        # same key as in time series, differently described
+        return [dict(COLUMNS[1]), dict(COLUMNS[2], available=False)]
+
+
+def lazy_profiler(directory, api):
+    """Return a lazy NetProfiler, not connected, retrieving columns from
+    `api` and caching them in `directory`.
+    """
+    profiler = NetProfiler.__new__(NetProfiler)
+    profiler.lazy = True
+    profiler.realms = ['traffic_summary', 'traffic_overall_time_series']
+    profiler.centricities = ['hos', 'int']
+    profiler.groupbys = {'host': 'hos', 'time': 'tim'}
+    profiler.column_timings = dict()
+    profiler.api = type('API', (object,), {})()
+    profiler.api.report = api
+
+    metadata = MetadataRegistry().get('fake', '10.0')
+    metadata.columns_file = ColumnCatalogFile(directory, 'columns.json')
+    metadata.columns_file.data = dict()
+    metadata.columns = ColumnContainer([], loader=metadata.load_columns)
+    metadata.colnames = set()
+    metadata.profiler = weakref.ref(profiler)
+    profiler._metadata = metadata
+    profiler.columns = metadata.columns
+    profiler.colnames = metadata.colnames
+    return profiler
+
+
+class ColumnFetchTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_fetch(self):
+        api = FakeColumnsAPI()
+        profiler = lazy_profiler(self.directory, api)
+        triplets = list(profiler._triplets())
+        self.assertTrue(profiler._fetch_triplets(triplets))
+        self.assertEqual(sorted(api.calls), sorted(triplets))
+        self.assertEqual(set(profiler.column_timings), set(triplets))
+
+        # stored in the order of the triplets, not of completion
+        data = profiler._metadata.columns_file.data
+        self.assertEqual(list(data), [make_hash(*t) for t in triplets])
+
+        # one Column per key across triplets
+        summary = data[make_hash('traffic_summary', 'hos', 'hos')]
+        series = data[make_hash('traffic_overall_time_series', 'int',
+                                'tim')]
+        self.assertIs(summary[1], series[1])
+        self.assertEqual(profiler.colnames,
+                         set(['time', 'host_ip', 'avg_bytes']))
+
+        # nothing left to fetch
+        self.assertFalse(profiler._fetch_triplets(triplets))
+        self.assertEqual(len(api.calls), len(triplets))
+
+    def test_fetch_error(self):
+        failed = ('traffic_summary', 'hos', 'hos')
+        api = FakeColumnsAPI(fail=[failed])
+        profiler = lazy_profiler(self.directory, api)
+        triplets = list(profiler._triplets())
+        self.assertTrue(profiler._fetch_triplets(triplets))
+
+        data = profiler._metadata.columns_file.data
+        self.assertNotIn(make_hash(*failed), data)
+        self.assertEqual(len(data), len(triplets) - 1)
+
+        # requested again next time
+        api.fail = []
+        self.assertTrue(profiler._fetch_triplets(triplets))
+        self.assertEqual(api.calls[-1], failed)
+
+
+class LazyColumnsTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.api = FakeColumnsAPI()
+        self.profiler = lazy_profiler(self.directory, self.api)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_groupby(self):
+        profiler = self.profiler
+        columns = profiler.get_columns(['time', 'avg_bytes'], 'tim')
+        self.assertEqual([c.key for c in columns], ['time', 'avg_bytes'])
+        # only the triplets of the groupby
+        self.assertEqual(set(t[2] for t in self.api.calls), set(['tim']))
+
+        with self.assertRaises(RvbdException):
+            profiler.get_columns(['host_ip'], 'tim')
+        self.assertEqual(set(t[2] for t in self.api.calls), set(['tim']))
+
+    def test_missing(self):
+        profiler = self.profiler
+        self.assertEqual(profiler.get_columns(['host_ip'])[0].id, 6)
+        calls = len(self.api.calls)
+        self.assertEqual(calls, len(list(profiler._triplets())))
+
+        # unknown columns are only looked for once
+        for _ in range(3):
+            with self.assertRaises(RvbdException):
+                profiler.get_columns(['no_such_column'])
+            with self.assertRaises(KeyError):
+                profiler.columns['no_such_column']
+            self.assertNotIn('no_such_column', profiler.columns)
+        self.assertEqual(len(self.api.calls), calls)
+
+
+class KeepAliveHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        body = b'{}'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ConnectionPoolTests(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                                      KeepAliveHandler)
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        self.url = 'http://127.0.0.1:%d/' % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_reuse(self):
+        session = requests.Session()
+        stats = _pool.ConnectionStats()
+        _pool.mount(session, stats, pool_size=4, block=True)
+
+        for _ in range(20):
+            session.get(self.url).json()
+        self.assertEqual(stats.connections, 1)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda _: session.get(self.url).json(),
+                          range(40)))
+        self.assertLessEqual(stats.connections, 4)
+        session.close()
+
+
+class JsonStreamTests(unittest.TestCase):
+    def test_iter_items(self):
+        text = ('{"id": "q1", "data": [["1", 2.5, "a,]b"], [12345, null]],'
+                ' "totals": [3, "x"]}')
+        # split into chunks small enough to cut through every token
+        for size in (1, 2, 5, len(text)):
+            chunks = [text[i:i + size] for i in range(0, len(text), size)]
+            side = dict()
+            rows = list(_jsonstream.iter_items(chunks, 'data', side))
+            self.assertEqual(rows, [['1', 2.5, 'a,]b'], [12345, None]])
+            self.assertEqual(side, {'id': 'q1', 'totals': [3, 'x']})
+
+    def test_split_numbers(self):
+        text = ('{"actual_t0": 12.5, "data": [["a", 12.5, -3e-2, 1E+10, '
+                '100], [0.25, 7]], "totals": [1.5e3]}')
+        for size in (1, 2, 3):
+            chunks = [text[i:i + size] for i in range(0, len(text), size)]
+            side = dict()
+            rows = list(_jsonstream.iter_items(chunks, 'data', side))
+            self.assertEqual(rows, [['a', 12.5, -0.03, 1e10, 100],
+                                    [0.25, 7]])
+            self.assertEqual(side, {'actual_t0': 12.5, 'totals': [1500.0]})
+
+        chunks = ['{"actual_t0": 12.', '5, "data": []}']
+        side = dict()
+        self.assertEqual(list(_jsonstream.iter_items(chunks, 'data', side)),
+                         [])
+        self.assertEqual(side, {'actual_t0': 12.5})
+
+        chunks = ['{"data": ["a", 12.', '5]}']
+        self.assertEqual(list(_jsonstream.iter_items(chunks, 'data', side)),
+                         ['a', 12.5])
+
+    def test_iter_items_truncated(self):
+        chunks = ['{"data": [[1, 2], [3']
+        self.assertRaises(ValueError, list,
+                          _jsonstream.iter_items(chunks, 'data', dict()))
+
+
+class AdaptivePollingTests(unittest.TestCase):
+    def test_backoff(self):
+        polling = AdaptivePolling(min_interval=0.5, max_interval=4,
+                                  backoff=2)
+        status = {'status': 'running', 'percent': 0, 'remaining_seconds': 0}
+        delays = [polling.next_interval(status, i, 0) for i in range(5)]
+        self.assertEqual(delays, [0.5, 1, 2, 4, 4])
+
+    def test_remaining_estimate(self):
+        polling = AdaptivePolling(min_interval=0.5, max_interval=60,
+                                  remaining_factor=0.5)
+        status = {'status': 'running', 'percent': 10,
+                  'remaining_seconds': 40}
+        self.assertEqual(polling.next_interval(status, 0, 5), 20)
+        # without an estimate, extrapolate from the percent complete
+        status['remaining_seconds'] = 0
+        self.assertEqual(polling.next_interval(status, 0, 5), 22.5)
+
+
+COLUMNS = [{'id': 98, 'strid': 'ID_TIME', 'name': 'Time',
+            'type': 'time', 'rate': '', 'category': 'key',
+            'available': True},
+           {'id': 6, 'strid': 'ID_HOST_IP', 'name': 'Host IP',
+            'type': 'ipaddr', 'rate': '', 'category': 'key',
+            'available': True},
+           {'id': 33, 'strid': 'ID_AVG_BYTES', 'name': 'Avg Bytes/s',
+            'type': 'int', 'rate': 'persec', 'category': 'data',
+            'statistic': 'avg', 'available': True},
+           {'id': 30, 'strid': 'ID_TOTAL_BYTES', 'name': 'Total Bytes',
+            'type': 'int', 'rate': 'count', 'category': 'data',
+            'statistic': 'total', 'available': True}]
+
+VALUES = {98: None, 6: '10.0.0.1', 33: '12', 30: '100'}
+
+
+class FakeReportAPI(object):
+    """Minimal report API of a NetProfiler, counting the calls made.
+
+    Time series return one row per minute of the time frame.
+    """
+    def __init__(self):
+        self.calls = []
+        self.posted = []
+
+    def reports(self, data):
+        self.calls.append('reports')
+        self.posted.append(data)
+        return {'id': len(self.posted)}
+
+    def status(self, rid):
+        self.calls.append('status')
+        return {'status': 'completed', 'percent': 100,
+                'remaining_seconds': 0}
+
+    def queries(self, rid, qid=None, params=None):
+        self.calls.append('queries')
+        criteria = self.posted[rid - 1]['criteria']
+        query = criteria['query']
+        columns = [c for c in COLUMNS if c['id'] in query['columns']]
+        if qid is None:
+            return [{'id': 'q%d' % rid, 'actual_t0': 0, 'actual_t1': 60,
+                     'group_by': query['group_by'], 'columns': columns}]
+
+        if query['group_by'] == 'tim':
+            times = range(criteria['time_frame']['start'],
+                          criteria['time_frame']['end'], 60)
+        else:
+            times = [0]
+        data = [[str(t) if c['id'] == 98 else VALUES[c['id']]
+                 for c in columns] for t in times]
+        params = params or {}
+        offset = params.get('offset', 0)
+        if 'limit' in params:
+            data = data[offset:offset + params['limit']]
+        else:
+            data = data[offset:]
+        totals = [VALUES[c['id']] if c['category'] == 'data' else ''
+                  for c in columns]
+        return {'data': data, 'totals': totals}
+
+    def delete(self, rid):
+        self.calls.append('delete')
+
+
+class FakeProfiler(object):
+    host = 'fake'
+    version = '10.0'
+    supported_versions = []
+
+    def __init__(self, report_cache=None, timeseries_cache=None):
+        self.api = type('API', (object,), {})()
+        self.api.report = FakeReportAPI()
+        self.report_cache = report_cache
+        self.timeseries_cache = timeseries_cache
+        self.columns = ColumnContainer(Column.from_json(c) for c in COLUMNS)
+        self.metrics = Metrics()
+
+    def get_columns(self, columns, groupby=None, strict=True):
+        keys = [c['strid'].lower()[3:] if isinstance(c, dict) else c
+                for c in columns]
+        return [self.columns[getattr(k, 'key', k)] for k in keys]
+
+
+class MetricsTests(unittest.TestCase):
+    def test_endpoint(self):
+        self.assertEqual(_api1._endpoint('/reports/12/queries/34.json'),
+                         '/reports/{id}/queries/{id}.json')
+        self.assertEqual(_api1._endpoint('/5/groups/web/members'),
+                         '/{id}/groups/{name}/members')
+        self.assertEqual(_api1._endpoint('/group_bys.json'),
+                         '/group_bys.json')
+
+    def test_prometheus(self):
+        events = []
+        metrics = Metrics(labels={'host': 'profiler'})
+        metrics.add_sink(events.append)
+        metrics.record_request('/reports/{id}.json', 'GET', 200, 0.02,
+                               bytes_in=100)
+        metrics.record_request('/reports/{id}.json', 'GET', 200, 3,
+                               bytes_in=50)
+        metrics.record_phase('post', 0.2, report=1)
+
+        self.assertEqual(len(events), 3)
+        self.assertEqual(events[-1]['phase'], 'post')
+
+        text = metrics.to_prometheus()
+        labels = 'host="profiler",endpoint="/reports/{id}.json",' \
+                 'method="GET",status="200"'
+        self.assertIn('netprofiler_request_seconds_bucket{%s,le="0.025"} 1'
+                      % labels, text)
+        self.assertIn('netprofiler_request_seconds_bucket{%s,le="+Inf"} 2'
+                      % labels, text)
+        self.assertIn('netprofiler_request_seconds_count{%s} 2' % labels,
+                      text)
+        self.assertIn('netprofiler_response_bytes_total{%s} 150' % labels,
+                      text)
+        self.assertIn('netprofiler_report_phase_seconds_count'
+                      '{host="profiler",phase="post"} 1', text)
+
+    def test_report_timings(self):
+        profiler = FakeProfiler()
+        report = TrafficSummaryReport(profiler)
+        report.run('hos', ['host_ip', 'avg_bytes'])
+        report.get_data()
+
+        for phase in ('post', 'poll', 'queued', 'wait', 'download',
+                      'decode'):
+            self.assertIn(phase, report.timings)
+        self.assertEqual(report.timings['polls'], 1)
+        phases = profiler.metrics.as_dict()['phases']
+        self.assertEqual(phases['post']['count'], 1)
+
+        # one observation per retrieval, not per chunk of rows
+        report.get_data()
+        list(report.get_iterdata(page_size=1))
+        phases = profiler.metrics.as_dict()['phases']
+        self.assertEqual(phases['decode']['count'], 3)
+        self.assertEqual(phases['download']['count'], 2)
+
+
+class PagingTests(unittest.TestCase):
+    def setUp(self):
+        self.profiler = FakeProfiler()
+        api = self.profiler.api.report
+        queries = api.queries
+        self.windows = []
+
+        def record(rid, qid=None, params=None):
+            if qid is not None:
+                self.windows.append((params.get('offset'),
+                                     params.get('limit')))
+            return queries(rid, qid, params)
+
+        api.queries = record
+        # one row per minute
+        self.start = 1500000000 // 60 * 60
+        self.report = TrafficOverallTimeSeriesReport(self.profiler)
+        self.report.run(['time', 'avg_bytes'], timefilter=TimeFilter(
+            datetime.datetime.fromtimestamp(self.start),
+            datetime.datetime.fromtimestamp(self.start + 600)))
+
+    def times(self, **kwargs):
+        return [row[0] for row in self.report.get_iterdata(**kwargs)]
+
+    def test_pages(self):
+        self.assertEqual(self.times(page_size=3),
+                         list(range(self.start, self.start + 600, 60)))
+        # stops at the short last page
+        self.assertEqual(self.windows, [(0, 3), (3, 3), (6, 3), (9, 3)])
+
+        del self.windows[:]
+        self.assertEqual(len(self.times(page_size=5)), 10)
+        # a last empty page tells a full page was the last one
+        self.assertEqual(self.windows, [(0, 5), (5, 5), (10, 5)])
+
+    def test_limit(self):
+        self.assertEqual(self.times(page_size=4, limit=6),
+                         list(range(self.start, self.start + 360, 60)))
+        self.assertEqual(self.windows, [(0, 4), (4, 2)])
+
+        del self.windows[:]
+        self.assertEqual(len(self.times(page_size=5, limit=2)), 2)
+        self.assertEqual(self.windows, [(0, 2)])
+
+
+class ReportSchedulerTests(unittest.TestCase):
+    def test_admission_order(self):
+        scheduler = ReportScheduler(max_running=3, reserve=1)
+        running = [scheduler.acquire('batch', 'a'),
+                   scheduler.acquire('batch', 'a')]
+
+        # the reserved slot is left to interactive reports
+        batch = [scheduler.submit('batch', 'a'),
+                 scheduler.submit('batch', 'a'),
+                 scheduler.submit('batch', 'b')]
+        self.assertIsNone(batch[0].admitted)
+        interactive = scheduler.submit('interactive', 'c')
+        self.assertIsNotNone(interactive.admitted)
+
+        # interactive first, then callers in turn
+        queued = scheduler.submit('interactive', 'c')
+        scheduler.release(running[0])
+        self.assertIsNotNone(queued.admitted)
+        for ticket in (running[1], interactive, queued):
+            scheduler.release(ticket)
+        self.assertIsNotNone(batch[0].admitted)
+        self.assertIsNotNone(batch[2].admitted)
+        self.assertIsNone(batch[1].admitted)
+        self.assertEqual(scheduler.stats(),
+                         {'running': {'interactive': 0, 'batch': 2},
+                          'queued': {'interactive': 0, 'batch': 1}})
+
+        with self.assertRaises(ProfilerException):
+            scheduler.acquire('batch', 'd', timeout=0.01)
+
+        metrics = scheduler.metrics.as_dict()
+        self.assertIn(({'priority': 'batch'}, 1),
+                      metrics['gauges']['admission_queue_depth'])
+        waits = dict((labels['priority'], histogram['count'])
+                     for labels, histogram in
+                     metrics['histograms']['admission_wait_seconds'])
+        self.assertEqual(waits['interactive'], 2)
+
+    def test_report(self):
+        profiler = FakeProfiler()
+        profiler.scheduler = ReportScheduler(max_running=1, reserve=0)
+        report = TrafficSummaryReport(profiler)
+        report.run('hos', ['host_ip', 'avg_bytes'], sync=False)
+        self.assertEqual(profiler.scheduler.stats()['running']['interactive'],
+                         1)
+        report.wait_for_complete()
+        self.assertEqual(profiler.scheduler.stats()['running']['interactive'],
+                         0)
+        self.assertIn('admission', report.timings)
+
+    def test_admission_timeout(self):
+        profiler = FakeProfiler()
+        profiler.scheduler = ReportScheduler(max_running=1, reserve=0,
+                                             timeout=0.01)
+        ticket = profiler.scheduler.acquire()
+        report = TrafficSummaryReport(profiler)
+        with self.assertRaises(ProfilerException):
+            report.run('hos', ['host_ip', 'avg_bytes'], sync=False)
+        self.assertEqual(profiler.api.report.posted, [])
+        self.assertEqual(profiler.scheduler.stats()['queued']['interactive'],
+                         0)
+
+        ticket.release()
+        report.run('hos', ['host_ip', 'avg_bytes'])
+        self.assertEqual(profiler.scheduler.stats()['running']['interactive'],
+                         0)
+
+    def test_wait_timeout(self):
+        profiler = FakeProfiler()
+        profiler.api.report = SlowReportAPI({})
+        profiler.scheduler = ReportScheduler(max_running=1, reserve=0)
+        report = TrafficSummaryReport(profiler)
+        report.run('hos', ['host_ip', 'avg_bytes'], sync=False)
+        self.assertFalse(report.wait_for_complete(interval=0.01,
+                                                  timeout=0.05))
+        # the slot is free for other reports, without waiting for GC
+        self.assertEqual(profiler.scheduler.stats()['running']['interactive'],
+                         0)
+
+
+class SlowReportAPI(FakeReportAPI):
+    """Report API whose reports complete after a number of polls, set
+    per report id in `polls`, never if missing.
+    """
+    def __init__(self, polls):
+        super(SlowReportAPI, self).__init__()
+        self.polls = polls
+        self.running = set()
+        self.max_running = 0
+
+    def reports(self, data):
+        res = super(SlowReportAPI, self).reports(data)
+        self.running.add(res['id'])
+        self.max_running = max(self.max_running, len(self.running))
+        return res
+
+    def status(self, rid):
+        self.calls.append('status')
+        self.polls[rid] = self.polls.get(rid, float('inf')) - 1
+        if self.polls[rid] > 0:
+            return {'status': 'running', 'percent': 50,
+                    'remaining_seconds': 1}
+        self.running.discard(rid)
+        return {'status': 'completed', 'percent': 100,
+                'remaining_seconds': 0}
+
+    def delete(self, rid):
+        self.calls.append('delete %d' % rid)
+        self.running.discard(rid)
+
+
+class ReportBatchTests(unittest.TestCase):
+    def setUp(self):
+        self.profiler = FakeProfiler()
+        self.profiler.scheduler = ReportScheduler(max_running=8, reserve=0)
+
+    def make_batch(self, polls, count, **kwargs):
+        self.api = self.profiler.api.report = SlowReportAPI(polls)
+        kwargs.setdefault('interval', 0.001)
+        batch = ReportBatch(**kwargs)
+        reports = []
+        for _ in range(count):
+            report = TrafficSummaryReport(self.profiler)
+            batch.add(report, groupby='hos',
+                      columns=['host_ip', 'avg_bytes'])
+            reports.append(report)
+        return batch, reports
+
+    def assertReleased(self):
+        stats = self.profiler.scheduler.stats()
+        self.assertEqual(stats['running']['interactive'], 0)
+        self.assertEqual(stats['queued']['interactive'], 0)
+
+    def test_completion_order(self):
+        # poll every running report on each round, so that the number of
+        # polls alone decides the order of completion
+        batch, reports = self.make_batch({1: 3, 2: 1, 3: 2}, 3, interval=0)
+        results = list(batch.run())
+        self.assertEqual([r.report for r in results],
+                         [reports[1], reports[2], reports[0]])
+        self.assertEqual([r.data for r in results],
+                         [[['10.0.0.1', 12]]] * 3)
+        self.assertReleased()
+
+    def test_max_running(self):
+        batch, reports = self.make_batch(dict((i, 2) for i in range(1, 6)),
+                                         5, max_running=2)
+        results = list(batch.run())
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(r.error is None for r in results))
+        self.assertEqual(self.api.max_running, 2)
+        self.assertReleased()
+
+    def test_timeout(self):
+        batch, reports = self.make_batch({2: 1}, 2, timeout=0.05)
+        results = list(batch.run())
+        self.assertEqual([r.report for r in results],
+                         [reports[1], reports[0]])
+        self.assertIsNone(results[0].error)
+        self.assertIsInstance(results[1].error, ProfilerException)
+        self.assertIn('delete 1', self.api.calls)
+        self.assertEqual(self.api.running, set())
+        self.assertReleased()
+
+    def test_start_failure(self):
+        batch, reports = self.make_batch({1: 1}, 1)
+        failing = TrafficSummaryReport(self.profiler)
+        batch.add(failing, groupby='hos', columns=['no_such_column'])
+        results = list(batch.run())
+        self.assertEqual(results[0].report, failing)
+        self.assertIsInstance(results[0].error, KeyError)
+        self.assertIsNone(results[1].error)
+        self.assertReleased()
+
+    def test_close(self):
+        batch, reports = self.make_batch({1: 1}, 4, max_running=2)
+        results = batch.run()
+        self.assertEqual(next(results).report, reports[0])
+        results.close()
+        # the running report is deleted, the queued ones are dropped
+        self.assertEqual(self.api.calls.count('reports'), 2)
+        self.assertIn('delete 2', self.api.calls)
+        self.assertEqual(self.api.running, set())
+        self.assertReleased()
+
+
+class AsyncReportTests(unittest.TestCase):
+    def setUp(self):
+        self.profiler = FakeProfiler()
+        self.profiler.scheduler = ReportScheduler(max_running=1, reserve=0)
+        self.aprofiler = aio.AsyncNetProfiler(self.profiler, max_requests=2)
+
+    def tearDown(self):
+        self.aprofiler.close()
+
+    def test_run(self):
+        async def run():
+            report = aio.AsyncTrafficSummaryReport(self.aprofiler)
+            self.assertTrue(await report.run('hos', ['host_ip',
+                                                     'avg_bytes']))
+            data = await report.get_data()
+            await report.delete()
+            return data
+
+        self.assertEqual(asyncio.run(run()), [['10.0.0.1', 12]])
+        self.assertIn('delete', self.profiler.api.report.calls)
+
+    def test_admission(self):
+        async def run():
+            ticket = self.profiler.scheduler.acquire()
+            report = aio.AsyncTrafficSummaryReport(self.aprofiler)
+            task = asyncio.ensure_future(
+                report.run('hos', ['host_ip', 'avg_bytes']))
+            await asyncio.sleep(0.05)
+            # waiting on the event loop, not on the request pool
+            self.assertFalse(task.done())
+            self.assertEqual(self.profiler.api.report.posted, [])
+            ticket.release()
+            return await task
+
+        self.assertTrue(asyncio.run(run()))
+        self.assertEqual(len(self.profiler.api.report.posted), 1)
+
+    def test_run_error(self):
+        async def run():
+            report = aio.AsyncTrafficSummaryReport(self.aprofiler)
+            with self.assertRaises(KeyError):
+                await report.run('hos', ['no_such_column'])
+            return report
+
+        # still referenced, not released by garbage collection
+        report = asyncio.run(run())
+        self.assertIsNone(report.id)
+        self.assertEqual(self.profiler.scheduler.stats()['running'],
+                         {'interactive': 0, 'batch': 0})
+        self.assertEqual(self.profiler.api.report.posted, [])
+
+    def test_timeout(self):
+        self.profiler.api.report = SlowReportAPI({})
+
+        async def run():
+            report = aio.AsyncTrafficSummaryReport(self.aprofiler)
+            await report.run('hos', ['host_ip', 'avg_bytes'], sync=False)
+            return await report.wait_for_complete(interval=0.01,
+                                                  timeout=0.05)
+
+        self.assertFalse(asyncio.run(run()))
+
+    def test_sharded(self):
+        start = 1500000000 // 3600 * 3600
+        timefilter = TimeFilter(datetime.datetime.fromtimestamp(start),
+                                datetime.datetime.fromtimestamp(start + 3600))
+
+        async def run():
+            report = aio.AsyncTrafficOverallTimeSeriesReport(self.aprofiler)
+            self.assertTrue(await report.run(
+                ['time', 'avg_bytes'], timefilter=timefilter,
+                resolution='15min', shards=2))
+            self.assertIsNone(report.id)
+            return await report.get_data()
+
+        self.assertEqual(len(asyncio.run(run())), 60)
+
+
+class ReportCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_report(self, profiler, end):
+        report = TrafficSummaryReport(profiler)
+        timefilter = TimeFilter(datetime.datetime.fromtimestamp(end - 60),
+                                datetime.datetime.fromtimestamp(end))
+        report.run('hos', ['host_ip', 'avg_bytes'], timefilter=timefilter)
+        return report
+
+    def test_hit_skips_appliance(self):
+        end = 1500000000
+        profiler = FakeProfiler(ReportCache(directory=self.directory))
+        report = self.run_report(profiler, end)
+        self.assertEqual(report.get_data(), [['10.0.0.1', 12]])
+        calls = len(profiler.api.report.calls)
+
+        report = self.run_report(profiler, end)
+        self.assertTrue(report.from_cache)
+        self.assertEqual(report.get_data(), [['10.0.0.1', 12]])
+        report.delete()
+        self.assertEqual(len(profiler.api.report.calls), calls)
+
+        # a new process only has the copy on disk
+        profiler = FakeProfiler(ReportCache(directory=self.directory))
+        report = self.run_report(profiler, end)
+        self.assertEqual(report.get_data(), [['10.0.0.1', 12]])
+        self.assertEqual(profiler.api.report.calls, [])
+
+    def test_rows_not_shared(self):
+        end = 1500000000
+        profiler = FakeProfiler(ReportCache(directory=self.directory,
+                                            disk=False))
+        data = self.run_report(profiler, end).get_data()
+        data[0][1] = 'MUTATED'
+
+        report = self.run_report(profiler, end)
+        self.assertTrue(report.from_cache)
+        self.assertEqual(report.get_data(), [['10.0.0.1', 12]])
+
+    def test_evict(self):
+        cache = ReportCache(max_bytes=1000, directory=self.directory)
+        for i in range(20):
+            cache.put('k%d' % i, {'rows': 'x' * 100})
+        basedir = cache._dir.basedir
+        sizes = dict((name, os.path.getsize(os.path.join(basedir, name)))
+                     for name in os.listdir(basedir))
+        # no temporary file is left behind
+        self.assertTrue(all(name.endswith('.pcl') for name in sizes))
+        self.assertIn('k19.pcl', sizes)
+        self.assertLessEqual(sum(sizes.values()), 1000)
+        self.assertEqual(cache._disk_bytes, sum(sizes.values()))
+
+        cache.invalidate('k19')
+        self.assertEqual(cache._disk_bytes,
+                         sum(sizes.values()) - sizes['k19.pcl'])
+
+    def test_ttl(self):
+        cache = ReportCache(ttl=0, directory=self.directory)
+        profiler = FakeProfiler(cache)
+        end = int(time.time())
+        self.run_report(profiler, end).get_data()
+        self.assertFalse(self.run_report(profiler, end).from_cache)
+
+        # completed historical windows never expire
+        end -= 3600
+        self.run_report(profiler, end).get_data()
+        self.assertTrue(self.run_report(profiler, end).from_cache)
+
+
+class TimeSeriesCacheTests(unittest.TestCase):
+    def run_report(self, profiler, start, end):
+        report = TrafficOverallTimeSeriesReport(profiler)
+        timefilter = TimeFilter(datetime.datetime.fromtimestamp(start),
+                                datetime.datetime.fromtimestamp(end))
+        report.run(['time', 'avg_bytes'], timefilter=timefilter,
+                   resolution='1min')
+        return report
+
+    def test_missing(self):
+        t = int(time.time()) - 3600
+        cache = TimeSeriesCache(settle=0)
+        cache.update('k', t + 120, t + 240, [], [], 0)
+        cache.update('k', t + 300, t + 360, [], [], 0)
+        self.assertEqual(cache.missing('k', t + 60, t + 420),
+                         [(t + 60, t + 120), (t + 240, t + 300),
+                          (t + 360, t + 420)])
+        self.assertEqual(cache.missing('k', t + 120, t + 240), [])
+
+    def test_settle(self):
+        start = (int(time.time()) - 3600) // 60 * 60
+        cache = TimeSeriesCache(settle=90)
+        cache.update('k', start, start + 7200, [], [], 0, step=60)
+        gaps = cache.missing('k', start, start + 7200)
+        self.assertEqual(len(gaps), 1)
+        # the bucket in progress is fetched again, whole
+        self.assertEqual(gaps[0][0] % 60, 0)
+        self.assertLessEqual(gaps[0][0], time.time() - 90)
+
+    def test_legend_changed(self):
+        t = int(time.time()) - 3600
+        time_column, avg_bytes, total_bytes = (
+            Column.from_json(c) for c in (COLUMNS[0], COLUMNS[2], COLUMNS[3]))
+        cache = TimeSeriesCache(settle=0)
+        cache.update('k', t, t + 60, [time_column, avg_bytes], [[t, 12]], 0)
+        cache.update('k', t + 60, t + 120, [time_column, avg_bytes],
+                     [[t + 60, 13]], 0)
+        self.assertEqual(cache.get('k', t, t + 120)[1],
+                         [[t, 12], [t + 60, 13]])
+
+        # rows of other columns are not mixed with those cached
+        cache.update('k', t + 60, t + 120, [time_column, total_bytes],
+                     [[t + 60, 100]], 0)
+        self.assertEqual(cache.get('k', t, t + 120),
+                         ([time_column, total_bytes], [[t + 60, 100]]))
+        self.assertEqual(cache.missing('k', t, t + 120), [(t, t + 60)])
+
+    def test_sliding_window(self):
+        profiler = FakeProfiler(timeseries_cache=TimeSeriesCache(settle=0))
+        start = (int(time.time()) - 7200) // 60 * 60
+        report = self.run_report(profiler, start, start + 3600)
+        data = report.get_data()
+        self.assertEqual(len(data), 60)
+        self.assertEqual(data[0], [start, 12])
+
+        # slide the window by 5 minutes, only those are requested
+        report = self.run_report(profiler, start + 300, start + 3900)
+        data = report.get_data()
+        self.assertEqual(len(data), 60)
+        self.assertEqual(data[-1], [start + 3840, 12])
+        self.assertEqual(len(profiler.api.report.posted), 2)
+        frame = profiler.api.report.posted[-1]['criteria']['time_frame']
+        self.assertEqual((frame['start'], frame['end']),
+                         (start + 3600, start + 3900))
+
+        self.assertEqual(report.get_data(columns=['avg_bytes'])[0], [12])
+        self.assertEqual(report.status()['status'], 'completed')
+
+    def test_pruned(self):
+        start = (int(time.time()) - 7200) // 60 * 60
+        # coverage starts within the second bucket once older rows are
+        # dropped
+        profiler = FakeProfiler(timeseries_cache=TimeSeriesCache(
+            settle=0, max_age=time.time() - start - 90.5))
+        self.run_report(profiler, start, start + 3600)
+
+        self.run_report(profiler, start, start + 3600)
+        frame = profiler.api.report.posted[-1]['criteria']['time_frame']
+        self.assertEqual((frame['start'], frame['end']),
+                         (start, start + 120))
+
+
+class ShardedReportTests(unittest.TestCase):
+    def setUp(self):
+        self.profiler = FakeProfiler()
+        self.start = 1500000000 // 3600 * 3600
+        self.timefilter = TimeFilter(
+            datetime.datetime.fromtimestamp(self.start),
+            datetime.datetime.fromtimestamp(self.start + 3600))
+
+    def frames(self):
+        return sorted((p['criteria']['time_frame']['start'],
+                       p['criteria']['time_frame']['end'])
+                      for p in self.profiler.api.report.posted)
+
+    def test_time_series(self):
+        report = TrafficOverallTimeSeriesReport(self.profiler)
+        report.run(['time', 'avg_bytes'], timefilter=self.timefilter,
+                   resolution='15min', shards=4)
+        self.assertEqual(self.frames(),
+                         [(self.start + i * 900, self.start + (i + 1) * 900)
+                          for i in range(4)])
+        self.assertTrue(report.wait_for_complete())
+        data = report.get_data()
+        self.assertEqual([row[0] for row in data],
+                         list(range(self.start, self.start + 3600, 60)))
+
+    def test_time_series_unaligned(self):
+        start = self.start + 300
+        timefilter = TimeFilter(datetime.datetime.fromtimestamp(start),
+                                datetime.datetime.fromtimestamp(start + 3600))
+        report = TrafficOverallTimeSeriesReport(self.profiler)
+        report.run(['time', 'avg_bytes'], timefilter=timefilter,
+                   resolution='15min', shards=4)
+        # boundaries on the 15min grid, not relative to the start
+        self.assertEqual(self.frames(),
+                         [(start, self.start + 900),
+                          (self.start + 900, self.start + 1800),
+                          (self.start + 1800, self.start + 2700),
+                          (self.start + 2700, start + 3600)])
+        data = report.get_data()
+        self.assertEqual([row[0] for row in data],
+                         list(range(start, start + 3600, 60)))
+
+    def test_flow_list_limit(self):
+        api = self.profiler.api.report
+        queries = api.queries
+
+        def flows(rid, qid=None, params=None):
+            # two flows per shard, larger in later shards
+            res = queries(rid, qid, params)
+            if qid is not None:
+                res['data'] = [['10.0.%d.%d' % (rid, i), str(rid * 10 + i)]
+                               for i in range(2)]
+            return res
+
+        api.queries = flows
+        self.profiler.supported_versions = [APIVersion('1.4')]
+        report = TrafficFlowListReport(self.profiler)
+        report.run(['host_ip', 'total_bytes'], sort_col='total_bytes',
+                   timefilter=self.timefilter, limit=3, shards=3)
+        self.assertEqual(report.get_data(), [['10.0.3.1', 31],
+                                             ['10.0.3.0', 30],
+                                             ['10.0.2.1', 21]])
+
+    def test_summary(self):
+        report = TrafficSummaryReport(self.profiler)
+        report.run('hos', ['host_ip', 'total_bytes'],
+                   timefilter=self.timefilter, shards=3)
+        self.assertEqual(len(self.frames()), 3)
+        self.assertEqual(report.get_data(), [['10.0.0.1', 300]])
+        self.assertEqual(report.get_totals(), ['', 300])
+
+    def test_flow_list_duplicates(self):
+        api = self.profiler.api.report
+        queries = api.queries
+
+        def flows(rid, qid=None, params=None):
+            res = queries(rid, qid, params)
+            if qid is not None:
+                res['data'] = [['10.0.0.1', '5'], ['10.0.0.1', '5']]
+            return res
+
+        api.queries = flows
+        report = TrafficFlowListReport(self.profiler)
+        report.run(['host_ip', 'total_bytes'], timefilter=self.timefilter,
+                   shards=2)
+        self.assertEqual(report.get_data(), [['10.0.0.1', 5]] * 4)
+
+    def test_summary_limit(self):
+        api = self.profiler.api.report
+        queries = api.queries
+
+        def hosts(rid, qid=None, params=None):
+            # another host leads each window, 10.0.0.9 comes second in
+            # both and is the largest overall
+            res = queries(rid, qid, params)
+            if qid is not None:
+                res['data'] = [['10.0.0.%d' % rid, '10'], ['10.0.0.9', '8'],
+                               ['10.0.1.%d' % rid, '1']]
+                query = api.posted[rid - 1]['criteria']['query']
+                if 'limit' in query:
+                    res['data'] = res['data'][:query['limit']]
+            return res
+
+        api.queries = hosts
+        self.profiler.supported_versions = [APIVersion('1.4')]
+        report = TrafficSummaryReport(self.profiler)
+        report.run('hos', ['host_ip', 'total_bytes'], sort_col='total_bytes',
+                   timefilter=self.timefilter, limit=1, shards=2)
+        self.assertEqual(report.get_data(), [['10.0.0.9', 16]])
+        self.assertTrue(all('limit' not in p['criteria']['query']
+                            for p in api.posted))
+
+    def test_summary_not_additive(self):
+        report = TrafficSummaryReport(self.profiler)
+        with self.assertRaises(ProfilerException):
+            report.run('hos', ['host_ip', 'avg_bytes'],
+                       timefilter=self.timefilter, shards=3)
+
+
 if __name__ == '__main__':
     unittest.main()